@@ -0,0 +1 @@
+"""Analytics code shared by the visualizer, Glue setup and Athena test scripts."""
@@ -0,0 +1,230 @@
+"""
+Athena query execution shared by the visualizer, the Glue setup and the
+Athena test scripts.
+
+Queries are polled with exponential backoff instead of a tight loop, results
+are read through the get_query_results paginator so nothing is cut off at
+1,000 rows, and submit() runs queries on a thread pool so several can be in
+flight at once (boto3 clients are thread-safe).
+
+run_dataframe() skips the paginator altogether: it reads the CSV file Athena
+writes for every SELECT straight from S3 in one request and applies column
+types from the result metadata, so numbers and timestamps arrive typed.
+"""
+import time
+import random
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE = 'parking_analytics'
+DEFAULT_OUTPUT_LOCATION = 's3://parking-monitoring-data/athena-results/'
+TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+
+QueryResult = namedtuple(
+    'QueryResult', ['execution_id', 'columns', 'types', 'rows', 'data_scanned_bytes', 'reused'],
+    defaults=(0, False)
+)
+
+# Athena result types grouped by the Arrow type their CSV values are parsed as
+INTEGER_TYPES = ('tinyint', 'smallint', 'integer', 'int', 'bigint')
+FLOAT_TYPES = ('float', 'real', 'double', 'decimal')
+TIMESTAMP_TYPES = ('date', 'timestamp')
+
+def arrow_type(athena_type):
+    """Arrow type for an Athena ColumnInfo type; anything unknown stays a string"""
+    import pyarrow as pa
+    athena_type = athena_type.lower()
+    if athena_type in INTEGER_TYPES:
+        return pa.int64()
+    if athena_type in FLOAT_TYPES:
+        return pa.float64()
+    if athena_type == 'boolean':
+        return pa.bool_()
+    if athena_type in TIMESTAMP_TYPES:
+        return pa.timestamp('ms')
+    return pa.string()
+
+def arrow_to_pandas(table):
+    """Convert to pandas keeping integer and boolean columns with nulls in nullable dtypes"""
+    import pyarrow as pa
+    import pandas as pd
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype(), pa.bool_(): pd.BooleanDtype()}.get)
+
+def read_result_csv(stream, columns, types):
+    """
+    Parse an Athena result CSV into a typed DataFrame. Athena quotes every
+    value and writes NULL as an empty unquoted field, so only unquoted empty
+    fields become nulls and empty strings survive.
+    """
+    import pyarrow.csv as csv
+    table = csv.read_csv(stream, convert_options=csv.ConvertOptions(
+        column_types={name: arrow_type(t) for name, t in zip(columns, types)},
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=False
+    ))
+    return arrow_to_pandas(table)
+
+def result_dataframe(result):
+    """Typed DataFrame from the string rows of a QueryResult"""
+    import pyarrow as pa
+    arrays = [
+        pa.array([row[i] for row in result.rows], type=pa.string()).cast(arrow_type(t))
+        for i, t in enumerate(result.types)
+    ]
+    return arrow_to_pandas(pa.Table.from_arrays(arrays, names=result.columns))
+
+class QueryFailed(Exception):
+    """Raised when an Athena query ends FAILED or CANCELLED, or times out"""
+
+    def __init__(self, execution_id, state, reason=''):
+        super().__init__(f"Query {execution_id} {state}: {reason}".rstrip(': '))
+        self.execution_id = execution_id
+        self.state = state
+        self.reason = reason
+
+def execution_statistics(execution):
+    """Scan size and result reuse of a finished query, as QueryResult fields"""
+    statistics = execution.get('Statistics', {})
+    return {
+        'data_scanned_bytes': statistics.get('DataScannedInBytes', 0),
+        'reused': statistics.get('ResultReuseInformation', {}).get('ReusedPreviousResult', False)
+    }
+
+class AthenaClient:
+    def __init__(self, database=DEFAULT_DATABASE, output_location=DEFAULT_OUTPUT_LOCATION,
+                 workgroup=None, client=None, max_workers=5,
+                 initial_delay=0.2, max_delay=5.0, timeout=600, result_reuse_minutes=0,
+                 s3_client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('athena')
+        self.athena = client
+        self._s3 = s3_client
+        self.database = database
+        self.output_location = output_location
+        self.workgroup = workgroup
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        # Let Athena return a previous identical query's results instead of scanning again
+        self.result_reuse_minutes = result_reuse_minutes
+        # Athena's default account quota is about 20 concurrent DML queries
+        self.max_workers = max_workers
+        self._executor = None
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client('s3')
+        return self._s3
+
+    def start(self, query):
+        """Start a query and return its execution id"""
+        params = {
+            'QueryString': query,
+            'QueryExecutionContext': {'Database': self.database},
+            'ResultConfiguration': {'OutputLocation': self.output_location}
+        }
+        if self.workgroup:
+            params['WorkGroup'] = self.workgroup
+        if self.result_reuse_minutes:
+            params['ResultReuseConfiguration'] = {'ResultReuseByAgeConfiguration': {
+                'Enabled': True, 'MaxAgeInMinutes': self.result_reuse_minutes
+            }}
+        execution_id = self.athena.start_query_execution(**params)['QueryExecutionId']
+        logger.info(f"Started query execution: {execution_id}")
+        return execution_id
+
+    def wait(self, execution_id):
+        """
+        Poll until the query finishes, doubling the delay between polls up to
+        max_delay. Returns the QueryExecution description; raises QueryFailed
+        if the query fails, is cancelled or runs past timeout (it is then stopped).
+        """
+        deadline = time.monotonic() + self.timeout
+        delay = self.initial_delay
+        while True:
+            execution = self.athena.get_query_execution(QueryExecutionId=execution_id)['QueryExecution']
+            state = execution['Status']['State']
+            if state == 'SUCCEEDED':
+                return execution
+            if state in TERMINAL_STATES:
+                raise QueryFailed(execution_id, state, execution['Status'].get('StateChangeReason', ''))
+            if time.monotonic() >= deadline:
+                self.athena.stop_query_execution(QueryExecutionId=execution_id)
+                raise QueryFailed(execution_id, 'TIMED_OUT', f"still {state} after {self.timeout}s")
+            # Jitter keeps concurrent pollers from hitting the API in lockstep
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.max_delay)
+
+    def fetch(self, execution_id, skip_header=True):
+        """Read every page of a finished query's results"""
+        paginator = self.athena.get_paginator('get_query_results')
+        columns, types, rows = [], [], []
+        for page in paginator.paginate(QueryExecutionId=execution_id):
+            result_set = page['ResultSet']
+            if not columns:
+                info = result_set.get('ResultSetMetadata', {}).get('ColumnInfo', [])
+                columns = [column['Label'] for column in info]
+                types = [column['Type'] for column in info]
+            for row in result_set['Rows']:
+                rows.append([field.get('VarCharValue') for field in row['Data']])
+        # SELECT results repeat the column labels as the first row of the first page
+        if skip_header and rows:
+            rows = rows[1:]
+        return QueryResult(execution_id, columns, types, rows)
+
+    def run(self, query):
+        """Run a query to completion and return all of its rows"""
+        execution_id = self.start(query)
+        execution = self.wait(execution_id)
+        result = self.fetch(execution_id, skip_header=execution.get('StatementType', 'DML') == 'DML')
+        return result._replace(**execution_statistics(execution))
+
+    def fetch_dataframe(self, execution):
+        """
+        Load a finished SELECT's result CSV from S3 in one read. A single
+        get_query_results call with MaxResults=1 supplies the column types.
+        """
+        execution_id = execution['QueryExecutionId']
+        metadata = self.athena.get_query_results(QueryExecutionId=execution_id, MaxResults=1)
+        info = metadata['ResultSet']['ResultSetMetadata']['ColumnInfo']
+
+        bucket, key = execution['ResultConfiguration']['OutputLocation'][len('s3://'):].split('/', 1)
+        body = self.s3.get_object(Bucket=bucket, Key=key)['Body']
+        try:
+            df = read_result_csv(body, [c['Label'] for c in info], [c['Type'] for c in info])
+        finally:
+            body.close()
+        df.attrs.update(execution_statistics(execution), execution_id=execution_id)
+        return df
+
+    def run_dataframe(self, query):
+        """Run a query and return the result as a typed pandas DataFrame"""
+        execution_id = self.start(query)
+        execution = self.wait(execution_id)
+        if execution.get('StatementType', 'DML') != 'DML':
+            # Only SELECT-like statements write a CSV result file
+            result = self.fetch(execution_id, skip_header=False)
+            return result_dataframe(result)
+        return self.fetch_dataframe(execution)
+
+    def submit(self, query, dataframe=False):
+        """Run a query on the client's thread pool and return a Future"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor.submit(self.run_dataframe if dataframe else self.run, query)
+
+    def run_many(self, queries, dataframe=False):
+        """Run queries concurrently and return their results in the same order"""
+        futures = [self.submit(query, dataframe) for query in queries]
+        return [future.result() for future in futures]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
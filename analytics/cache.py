@@ -0,0 +1,315 @@
+"""
+Disk cache for Athena query results.
+
+Entries are keyed on the normalised SQL plus a data watermark: a fingerprint
+of the objects in the partitions the query reads. Queries over hours that no
+longer change keep hitting the cache while newer hours fill up, and data
+written into the query's window (including late events and compaction
+rewrites) moves its watermark so stale results are not served. Entries also
+expire after a TTL, and the least recently used ones are evicted once the cache grows past
+its size limit. Row results are stored as JSON and typed DataFrames as Parquet.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics.athena import QueryResult, arrow_to_pandas
+from analytics.query import window_days
+
+logger = logging.getLogger(__name__)
+
+# Single-quoted SQL literals, with '' as an escaped quote
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_LINE_COMMENT = re.compile(r"--[^\n]*")
+_BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+
+def normalize_sql(query):
+    """
+    Canonical form of a query for cache keys: comments removed, whitespace
+    collapsed and everything outside string literals lower-cased.
+    """
+    parts = _LITERAL.split(query)
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            normalized.append(part)
+        else:
+            part = _BLOCK_COMMENT.sub(' ', _LINE_COMMENT.sub(' ', part))
+            normalized.append(' '.join(part.lower().split()))
+    return ' '.join(p for p in normalized if p).strip().rstrip(';').strip()
+
+# What follows a listed prefix: "hour=HH/<file>" under a day, "<file>" under a
+# month. Names starting with "_" or "." (staging output, table metadata) are
+# skipped, like Athena does.
+_HOUR_OBJECT = re.compile(r'hour=(\d{2})/[^/_.][^/]*')
+_MONTH_OBJECT = re.compile(r'[^/_.][^/]*')
+
+def _window_prefixes(prefix, start, end, monthly):
+    """
+    Listing prefixes of the partitions overlapping [start, end), each with the
+    (first, last) hour kept under it, or None to keep every object listed.
+    """
+    if monthly:
+        months = sorted({(day.year, day.month) for day, _, _ in window_days(start, end)})
+        return [(f"{prefix}/year={year}/month={month:02d}/", None) for year, month in months]
+    return [
+        (f"{prefix}/year={day.year}/month={day.month:02d}/day={day.day:02d}/", (first, last))
+        for day, first, last in window_days(start, end)
+    ]
+
+def window_watermark(s3, bucket, prefix, start, end, monthly=False):
+    """
+    Fingerprint of every object a query over [start, end) of the table under
+    prefix can read: a digest of their keys, ETags and sizes, e.g.
+    "parking-data@42:5f0c2a9e1b7d4c83". Partitions are year=/month=/day=/hour=,
+    or year=/month= with monthly. Late events written into an older hour and
+    compaction rewrites change it; new data outside the window does not.
+    Only the window's partitions are listed, so queries without a window
+    should not be cached (see QueryCache.run).
+    """
+    digest = hashlib.sha256()
+    count = 0
+    paginator = s3.get_paginator('list_objects_v2')
+    for listed, hours in _window_prefixes(prefix, start, end, monthly):
+        pattern = _MONTH_OBJECT if hours is None else _HOUR_OBJECT
+        for page in paginator.paginate(Bucket=bucket, Prefix=listed):
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                match = pattern.fullmatch(key, len(listed))
+                if match is None:
+                    continue
+                if hours is not None and not hours[0] <= int(match.group(1)) <= hours[1]:
+                    continue
+                digest.update(f"{key}\t{obj['ETag']}\t{obj['Size']}\n".encode('utf-8'))
+                count += 1
+    return f"{prefix}@{count}:{digest.hexdigest()[:16]}"
+
+class QueryCache:
+    """
+    Caches AthenaClient results on local disk. watermark is either a fixed
+    string or a callable computed once per QueryCache and shared by every
+    query of the run; individual calls may pass their own watermark, as a
+    string or a callable evaluated when the query runs. Queries run with
+    cache=False (e.g. ones without a window to fingerprint) go straight to
+    Athena and are only counted as misses.
+    """
+
+    def __init__(self, athena, directory='.query_cache', ttl_seconds=24 * 3600,
+                 max_bytes=256 * 1024 * 1024, watermark=None):
+        self.athena = athena
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._watermark = watermark
+        self._lock = threading.Lock()
+        self._executor = None
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_scanned = 0
+        self.server_reuses = 0
+
+    def watermark(self):
+        with self._lock:
+            if callable(self._watermark):
+                self._watermark = self._watermark()
+            return self._watermark
+
+    def key(self, query, watermark=None):
+        if watermark is None:
+            watermark = self.watermark()
+        elif callable(watermark):
+            watermark = watermark()
+        material = f"{normalize_sql(query)}\n{watermark or ''}"
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _path(self, key, suffix='.json'):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _fresh(self, path, created_at):
+        """Check the TTL of an entry and mark it as used"""
+        if time.time() - created_at > self.ttl_seconds:
+            self._remove(path)
+            return False
+        # mtime doubles as last access for LRU eviction, since atime is often not tracked
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another thread since it was read
+            return False
+        return True
+
+    def get(self, key):
+        """Return the cached entry for key, or None if missing or expired"""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if self._fresh(path, entry['created_at']) else None
+
+    def get_frame(self, key):
+        """Return (DataFrame, data_scanned_bytes) for key, or None if missing or expired"""
+        import pyarrow.parquet as pq
+        path = self._path(key, '.parquet')
+        try:
+            table = pq.read_table(path)
+        except (OSError, ValueError):
+            return None
+        metadata = table.schema.metadata or {}
+        if not self._fresh(path, float(metadata.get(b'created_at', 0))):
+            return None
+        return arrow_to_pandas(table), int(metadata.get(b'data_scanned_bytes', 0))
+
+    def _write(self, key, suffix, write):
+        """Write an entry through a temporary file and rename it so readers never see a partial entry"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, self._path(key, suffix))
+        finally:
+            if os.path.exists(tmp_path):
+                self._remove(tmp_path)
+        self.evict()
+
+    def put(self, key, query, result):
+        entry = {
+            'created_at': time.time(),
+            'query': normalize_sql(query),
+            'columns': result.columns,
+            'types': result.types,
+            'rows': result.rows,
+            'data_scanned_bytes': result.data_scanned_bytes
+        }
+        def write(path):
+            with open(path, 'w') as f:
+                json.dump(entry, f, separators=(',', ':'))
+        self._write(key, '.json', write)
+
+    def put_frame(self, key, df):
+        """Store a typed DataFrame as Parquet, so dtypes survive the round trip"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(dict(
+            table.schema.metadata or {},
+            created_at=str(time.time()),
+            data_scanned_bytes=str(df.attrs.get('data_scanned_bytes', 0))
+        ))
+        self._write(key, '.parquet', lambda path: pq.write_table(table, path))
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+                if name.endswith(('.json', '.parquet')):
+                    path = os.path.join(self.directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _count_hit(self, key, bytes_saved):
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += bytes_saved
+        logger.info(f"Query cache hit {key[:12]}")
+
+    def _count_miss(self, bytes_scanned, reused):
+        with self._lock:
+            self.misses += 1
+            self.bytes_scanned += bytes_scanned
+            self.server_reuses += int(reused)
+
+    def run(self, query, watermark=None, cache=True):
+        """Return the query's QueryResult from the cache, running it on a miss"""
+        if not cache:
+            result = self.athena.run(query)
+            self._count_miss(result.data_scanned_bytes, result.reused)
+            return result
+        key = self.key(query, watermark)
+        entry = self.get(key)
+        if entry is not None:
+            self._count_hit(key, entry['data_scanned_bytes'])
+            return QueryResult(None, entry['columns'], entry['types'], entry['rows'])
+
+        result = self.athena.run(query)
+        self._count_miss(result.data_scanned_bytes, result.reused)
+        self.put(key, query, result)
+        return result
+
+    def run_dataframe(self, query, watermark=None, cache=True):
+        """Return the query's typed DataFrame from the cache, running it on a miss"""
+        if not cache:
+            df = self.athena.run_dataframe(query)
+            self._count_miss(df.attrs.get('data_scanned_bytes', 0), df.attrs.get('reused', False))
+            return df
+        key = self.key(query, watermark)
+        cached = self.get_frame(key)
+        if cached is not None:
+            df, data_scanned_bytes = cached
+            self._count_hit(key, data_scanned_bytes)
+            return df
+
+        df = self.athena.run_dataframe(query)
+        self._count_miss(df.attrs.get('data_scanned_bytes', 0), df.attrs.get('reused', False))
+        self.put_frame(key, df)
+        return df
+
+    def submit(self, query, dataframe=False, watermark=None, cache=True):
+        """Run a cached query on a thread pool sized like the Athena client's and return a Future"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=getattr(self.athena, 'max_workers', 5))
+        return self._executor.submit(self.run_dataframe if dataframe else self.run, query, watermark, cache)
+
+    def run_many(self, queries, dataframe=False):
+        """Run queries concurrently and return their results in the same order"""
+        futures = [self.submit(query, dataframe) for query in queries]
+        return [future.result() for future in futures]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'bytes_saved': self.bytes_saved,
+            'bytes_scanned': self.bytes_scanned,
+            'server_reuses': self.server_reuses
+        }
+
+    def report(self):
+        s = self.stats()
+        return (
+            f"Query cache: {s['hits']} hits, {s['misses']} misses ({s['hit_rate']:.0%} hit rate), "
+            f"{s['bytes_saved'] / 1e6:.1f} MB scan saved, {s['bytes_scanned'] / 1e6:.1f} MB scanned, "
+            f"{s['server_reuses']} Athena result reuses"
+        )
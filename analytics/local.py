@@ -0,0 +1,283 @@
+"""
+Local query engine over a copy of the bucket's partition layout.
+
+LocalEngine answers the same metrics as analytics/query.py directly from a
+local directory holding parking-data/ (newline-delimited JSON, optionally
+.gz/.zst) or parking-data-parquet/, so the dashboards run without Athena in
+development, CI and air-gapped sites. Only year=/month=/day=/hour=
+directories overlapping the requested window are read; files are scanned
+with pyarrow.dataset using Hive partitioning, and the results come back with
+the column names and dtypes AthenaClient.run_dataframe produces.
+"""
+import os
+from datetime import timedelta
+
+from analytics.athena import arrow_to_pandas
+from analytics.query import window_days
+
+PARTITION_KEYS = ('year', 'month', 'day', 'hour')
+FORMAT_PREFIXES = {
+    'json': 'parking-data',
+    'parquet': 'parking-data-parquet'
+}
+# The JSON table stores event timestamps as strings; Athena returns them that way
+JSON_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# Events this long before a window only seed each spot's state at the window start, as the
+# rollup carries every spot's last status from hour to hour
+OCCUPANCY_LOOKBACK = timedelta(hours=24)
+
+def event_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('spot_id', pa.string()),
+        ('status', pa.string()),
+        ('timestamp', pa.timestamp('ms'))
+    ])
+
+def dataset_schema():
+    import pyarrow as pa
+    schema = event_schema()
+    for key in PARTITION_KEYS:
+        schema = schema.append(pa.field(key, pa.string()))
+    return schema
+
+def partition_files(directory):
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if not name.startswith(('_', '.')) and os.path.isfile(os.path.join(directory, name))
+    ]
+
+class LocalEngine:
+    def __init__(self, root, source_format='json', prefix=None):
+        self.root = root
+        self.source_format = source_format
+        self.base = os.path.join(root, prefix or FORMAT_PREFIXES[source_format])
+
+    def partition_dirs(self, start=None, end=None):
+        """Hour partition directories overlapping [start, end), or all of them without a window"""
+        wanted = None
+        if start is not None:
+            wanted = {(day.year, day.month, day.day): (first, last) for day, first, last in window_days(start, end)}
+            years = {key[0] for key in wanted}
+            months = {key[:2] for key in wanted}
+
+        def children(path, key):
+            try:
+                entries = sorted(os.scandir(path), key=lambda e: e.name)
+            except FileNotFoundError:
+                return
+            for entry in entries:
+                if entry.is_dir() and entry.name.startswith(f"{key}="):
+                    yield entry.path, int(entry.name.split('=', 1)[1])
+
+        dirs = []
+        for year_path, year in children(self.base, 'year'):
+            if wanted is not None and year not in years:
+                continue
+            for month_path, month in children(year_path, 'month'):
+                if wanted is not None and (year, month) not in months:
+                    continue
+                for day_path, day in children(month_path, 'day'):
+                    hours = wanted.get((year, month, day)) if wanted is not None else (0, 23)
+                    if hours is None:
+                        continue
+                    for hour_path, hour in children(day_path, 'hour'):
+                        if hours[0] <= hour <= hours[1]:
+                            dirs.append(hour_path)
+        return dirs
+
+    def files(self, start=None, end=None):
+        """Data files of the selected partitions; like Athena, names starting with _ or . are skipped"""
+        return [path for directory in self.partition_dirs(start, end) for path in partition_files(directory)]
+
+    def _file_format(self):
+        import pyarrow.dataset as ds
+        import pyarrow.json as pj
+        if self.source_format == 'parquet':
+            return ds.ParquetFileFormat()
+        return ds.JsonFileFormat(parse_options=pj.ParseOptions(explicit_schema=event_schema()))
+
+    def _read_zstd(self, path):
+        """Arrow does not recognise .zst as a compressed extension, so decompress explicitly"""
+        import pyarrow as pa
+        import pyarrow.json as pj
+        table = pj.read_json(pa.input_stream(path, compression='zstd'),
+                             parse_options=pj.ParseOptions(explicit_schema=event_schema()))
+        values = dict(part.split('=', 1) for part in os.path.relpath(os.path.dirname(path), self.base).split(os.sep))
+        for key in PARTITION_KEYS:
+            table = table.append_column(key, pa.array([values[key]] * table.num_rows, type=pa.string()))
+        return table
+
+    def _condition(self, start=None, end=None, spot_ids=None):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        condition = None
+        if start is not None:
+            condition = (
+                (ds.field('timestamp') >= pa.scalar(start, type=pa.timestamp('ms')))
+                & (ds.field('timestamp') < pa.scalar(end, type=pa.timestamp('ms')))
+            )
+        if spot_ids:
+            spot_condition = ds.field('spot_id').isin(list(spot_ids))
+            condition = spot_condition if condition is None else condition & spot_condition
+        return condition
+
+    def _read(self, files, condition):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        zstd_files = [f for f in files if f.endswith('.zst')]
+        other_files = [f for f in files if not f.endswith('.zst')]
+        tables = []
+        if other_files:
+            dataset = ds.dataset(
+                other_files,
+                schema=dataset_schema(),
+                format=self._file_format(),
+                partitioning=ds.partitioning(
+                    pa.schema([(key, pa.string()) for key in PARTITION_KEYS]), flavor='hive'
+                ),
+                partition_base_dir=self.base
+            )
+            # Arrow's JSON scanner deadlocks on a single-thread CPU pool (one-core CI runners)
+            use_threads = self.source_format == 'parquet' or pa.cpu_count() > 1
+            tables.append(dataset.to_table(filter=condition, use_threads=use_threads))
+        if zstd_files:
+            zstd_table = pa.concat_tables([self._read_zstd(f) for f in zstd_files])
+            tables.append(zstd_table.filter(condition) if condition is not None else zstd_table)
+        if not tables:
+            return dataset_schema().empty_table()
+        return pa.concat_tables(tables)
+
+    def load_events(self, start=None, end=None, spot_ids=None):
+        """Events in [start, end) as an Arrow table with the partition columns as strings"""
+        return self._read(self.files(start, end), self._condition(start, end, spot_ids))
+
+    def iter_hours(self, start=None, end=None, spot_ids=None):
+        """Events in [start, end) one hour partition at a time, oldest first"""
+        condition = self._condition(start, end, spot_ids)
+        for path in self.partition_dirs(start, end):
+            files = partition_files(path)
+            if files:
+                yield self._read(files, condition)
+
+    def occupancy(self, start, end, spot_ids=None, lookback=OCCUPANCY_LOOKBACK):
+        """
+        Time-weighted occupancy, dwell and turnover over [start, end), reading one
+        hour at a time. Events in the lookback before start only set each spot's
+        state at start, so a car parked before the window counts from its start.
+        """
+        from analytics.occupancy import time_weighted_occupancy
+        return time_weighted_occupancy(self.iter_hours(start - lookback, end, spot_ids), start, end)
+
+    def _event_timestamps(self, table):
+        """Present timestamps as the raw table does: strings for JSON, timestamps for Parquet"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        if self.source_format != 'json':
+            return table
+        # Whole seconds, so %S does not render the millisecond fraction
+        seconds = table['timestamp'].cast(pa.timestamp('s'), safe=False)
+        index = table.schema.get_field_index('timestamp')
+        return table.set_column(index, 'timestamp', pc.strftime(seconds, format=JSON_TIMESTAMP_FORMAT))
+
+    def run_metric(self, metric, start=None, end=None, spot_ids=None, limit=None):
+        """The DataFrame build_query(metric, ...) returns from Athena, computed locally"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        events = self.load_events(start, end, spot_ids)
+        occupied = pc.cast(pc.equal(events['status'], 'occupied'), pa.int64())
+        vacant = pc.cast(pc.equal(events['status'], 'vacant'), pa.int64())
+        events = events.append_column('occupied', occupied).append_column('vacant', vacant)
+
+        def rate(numerator, total):
+            return pc.round(pc.divide(pc.multiply(pc.cast(numerator, pa.float64()), 100.0), total), 2)
+
+        if metric == 'hourly_occupancy':
+            grouped = events.group_by(list(PARTITION_KEYS)).aggregate([([], 'count_all'), ('occupied', 'sum')])
+            result = pa.table({
+                **{key: grouped[key] for key in PARTITION_KEYS},
+                'total_events': grouped['count_all'],
+                'occupied_events': grouped['occupied_sum'],
+                'occupancy_rate': rate(grouped['occupied_sum'], grouped['count_all'])
+            }).sort_by([(key, 'ascending') for key in PARTITION_KEYS])
+        elif metric == 'spot_activity':
+            grouped = events.group_by('spot_id').aggregate(
+                [([], 'count_all'), ('occupied', 'sum'), ('vacant', 'sum')]
+            )
+            result = pa.table({
+                'spot_id': grouped['spot_id'],
+                'total_events': grouped['count_all'],
+                'times_occupied': grouped['occupied_sum'],
+                'times_vacant': grouped['vacant_sum'],
+                'occupancy_rate': rate(grouped['occupied_sum'], grouped['count_all'])
+            }).sort_by([('total_events', 'descending'), ('spot_id', 'ascending')])
+        elif metric == 'day_of_week':
+            events = events.append_column('weekday', pc.day_of_week(events['timestamp'], count_from_zero=False))
+            grouped = events.group_by('weekday').aggregate([([], 'count_all'), ('occupied', 'sum')])
+            result = pa.table({
+                'day': grouped['weekday'],
+                'total_events': grouped['count_all'],
+                'occupied_events': grouped['occupied_sum'],
+                'occupancy_rate': rate(grouped['occupied_sum'], grouped['count_all'])
+            }).sort_by('day')
+        elif metric == 'latest_status':
+            # 'last' follows input order, so sort by time and aggregate single-threaded
+            ordered = events.sort_by([('spot_id', 'ascending'), ('timestamp', 'ascending')])
+            grouped = ordered.group_by('spot_id', use_threads=False).aggregate(
+                [('status', 'last'), ('timestamp', 'max')]
+            )
+            result = self._event_timestamps(pa.table({
+                'spot_id': grouped['spot_id'],
+                'status': grouped['status_last'],
+                'timestamp': grouped['timestamp_max']
+            }).sort_by('spot_id'))
+        elif metric == 'events':
+            result = self._event_timestamps(events.select(['spot_id', 'status', 'timestamp']).sort_by('timestamp'))
+        else:
+            raise ValueError(f"Unknown metric {metric!r}")
+
+        frame = arrow_to_pandas(result)
+        if metric in ('hourly_occupancy', 'spot_activity') and start is not None:
+            frame = self._with_time_occupied(frame, metric, events, start, end, spot_ids)
+        # Like LIMIT, applied to the final ordered rows, after any rows without events are added
+        if limit:
+            frame = frame.head(limit)
+        return frame
+
+    def _with_time_occupied(self, frame, metric, events, start, end, spot_ids=None):
+        """
+        Add the time_occupied_pct column the rollup source returns, with the
+        rollup's denominator: every hour in which a spot's state is known counts
+        in full, and time before its first event counts as vacant. Like the
+        rollup, hours and spots that carried occupied time without any event
+        get a row with zero events.
+        """
+        import pandas as pd
+        from analytics.occupancy import time_weighted_occupancy
+        lookback = self.load_events(start - OCCUPANCY_LOOKBACK, start, spot_ids)
+        spot_hours = time_weighted_occupancy([lookback, events], start, end).spot_hours()
+        hour_start = spot_hours['hour_start']
+        window = (hour_start + pd.Timedelta(hours=1)).clip(upper=pd.Timestamp(end)) - hour_start.clip(lower=pd.Timestamp(start))
+        spot_hours = spot_hours.assign(window_seconds=window.dt.total_seconds())
+
+        if metric == 'spot_activity':
+            keys, counts = ['spot_id'], ['total_events', 'times_occupied', 'times_vacant']
+            weighted = spot_hours.groupby('spot_id', as_index=False)[['occupied_seconds', 'window_seconds']].sum()
+        else:
+            keys, counts = list(PARTITION_KEYS), ['total_events', 'occupied_events']
+            weighted = spot_hours.groupby('hour_start', as_index=False)[['occupied_seconds', 'window_seconds']].sum()
+            for key, pattern in zip(PARTITION_KEYS, ('%Y', '%m', '%d', '%H')):
+                weighted[key] = weighted['hour_start'].dt.strftime(pattern)
+        weighted['time_occupied_pct'] = (weighted['occupied_seconds'] * 100.0 / weighted['window_seconds']).round(2)
+        weighted = weighted[keys + ['time_occupied_pct']].astype({key: frame[key].dtype for key in keys})
+
+        frame = frame.merge(weighted, on=keys, how='outer')
+        frame[counts] = frame[counts].fillna(0)
+        if metric == 'spot_activity':
+            frame = frame.sort_values(['total_events', 'spot_id'], ascending=[False, True])
+        else:
+            frame = frame.sort_values(keys)
+        return frame.reset_index(drop=True)
@@ -0,0 +1,338 @@
+"""
+Time-weighted occupancy, dwell times and turnover from per-spot state transitions.
+
+Counting the share of events that say "occupied" over-weights spots and hours
+whose sensors report more often. OccupancyAccumulator instead sorts each
+spot's events by time and treats every event as the start of a state that
+lasts until the spot's next event (or the end of the window):
+
+- occupancy is the time a spot spent occupied divided by the time its state
+  was known, per spot and hour;
+- a vacant -> occupied transition is an arrival (turnover), and the time from
+  an arrival to the next occupied -> vacant transition is a dwell time;
+  repeated "occupied" reports during a stay do not split it.
+
+Events are fed in chunks, e.g. one hour partition at a time, and each spot's
+state is carried from one chunk to the next, so memory is bounded by the
+largest chunk plus the spots x hours result arrays rather than by the number
+of events. Chunks must come in time order; an event older than its spot's
+latest known event is applied at that latest time.
+
+Usage:
+    python -m analytics.occupancy --data-dir data --hours 168
+"""
+import argparse
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from analytics.query import ceil_hour, floor_hour, last_hours
+from analytics.spots import SpotRegistry
+
+HOUR_NS = 3600 * 10**9
+# Upper bounds of the dwell-time histogram bins in minutes; the last bin is open-ended
+DWELL_BINS_MINUTES = (5, 15, 30, 60, 120, 240, 480, 1440)
+# Marks a stay whose start is unknown (the spot was first seen occupied)
+UNKNOWN = np.iinfo(np.int64).min
+
+def event_arrays(events):
+    """(spot_ids, occupied, timestamp_ns) arrays of an Arrow table or DataFrame of events"""
+    if hasattr(events, 'column_names'):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        spot_ids = events['spot_id'].to_numpy(zero_copy_only=False)
+        occupied = pc.equal(events['status'], 'occupied').to_numpy(zero_copy_only=False)
+        timestamps = events['timestamp']
+        if pa.types.is_timestamp(timestamps.type):
+            ns = timestamps.cast(pa.timestamp('ns')).cast(pa.int64()).to_numpy(zero_copy_only=False)
+            return spot_ids, occupied.astype(bool), ns
+        events = pd.DataFrame({'timestamp': timestamps.to_numpy(zero_copy_only=False)})
+    else:
+        spot_ids = events['spot_id'].to_numpy(dtype=object)
+        occupied = (events['status'] == 'occupied').to_numpy(dtype=bool, na_value=False)
+    # JSON tables hold the event time as an ISO-8601 string
+    timestamps = pd.to_datetime(events['timestamp'], utc=True).dt.tz_localize(None)
+    return spot_ids, occupied, timestamps.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+class OccupancyAccumulator:
+    def __init__(self, start, end, dwell_bins_minutes=DWELL_BINS_MINUTES, registry=None):
+        if end <= start:
+            raise ValueError(f"Empty time window: {start} to {end}")
+        self.start = start
+        self.end = end
+        self.first_hour = floor_hour(start)
+        self.hours = int((ceil_hour(end) - self.first_hour) / timedelta(hours=1))
+        self._start = int((start - self.first_hour) / timedelta(microseconds=1)) * 1000
+        self._end = int((end - self.first_hour) / timedelta(microseconds=1)) * 1000
+        self._epoch = pd.Timestamp(self.first_hour).value
+        self.dwell_edges = np.array([0] + [m * 60 * 10**9 for m in dwell_bins_minutes], dtype=np.int64)
+
+        # Spot ids -> row codes; may be shared with other consumers of the same lot
+        self.registry = registry if registry is not None else SpotRegistry()
+        self._capacity = 0
+        # Per spot: state carried between chunks, with times in ns since first_hour
+        self._known = np.zeros(0, dtype=bool)
+        self._occupied = np.zeros(0, dtype=bool)
+        self._last = np.zeros(0, dtype=np.int64)
+        self._stay_start = np.zeros(0, dtype=np.int64)
+        # Per spot and hour; time is kept as difference arrays (one spare column each
+        # side of the window end) so a segment spanning many hours is O(1) to add
+        self._occupied_ns = np.zeros((0, self.hours + 2), dtype=np.int64)
+        self._observed_ns = np.zeros((0, self.hours + 2), dtype=np.int64)
+        self._events = np.zeros((0, self.hours), dtype=np.int64)
+        self._arrivals = np.zeros((0, self.hours), dtype=np.int64)
+        # Completed stays, per spot and per hour in which they ended
+        self._stays = np.zeros(0, dtype=np.int64)
+        self._dwell_ns = np.zeros(0, dtype=np.int64)
+        self._dwell_max = np.zeros(0, dtype=np.int64)
+        self._dwell_hist = np.zeros((0, len(self.dwell_edges)), dtype=np.int64)
+        self._departures = np.zeros(self.hours, dtype=np.int64)
+        self._departure_dwell_ns = np.zeros(self.hours, dtype=np.int64)
+
+    def _grow(self, count):
+        if count <= self._capacity:
+            return
+        capacity = max(count, 2 * self._capacity, 64)
+
+        def grown(array, fill=0):
+            resized = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            resized[:len(array)] = array
+            return resized
+
+        self._known = grown(self._known)
+        self._occupied = grown(self._occupied)
+        self._last = grown(self._last)
+        self._stay_start = grown(self._stay_start, UNKNOWN)
+        self._occupied_ns = grown(self._occupied_ns)
+        self._observed_ns = grown(self._observed_ns)
+        self._events = grown(self._events)
+        self._arrivals = grown(self._arrivals)
+        self._stays = grown(self._stays)
+        self._dwell_ns = grown(self._dwell_ns)
+        self._dwell_max = grown(self._dwell_max)
+        self._dwell_hist = grown(self._dwell_hist)
+        self._capacity = capacity
+
+    def _codes(self, spot_ids):
+        """Dense integer codes of spot ids, assigning new codes to spots not seen before"""
+        codes = self.registry.codes(spot_ids)
+        self._grow(self.registry.size)
+        return codes
+
+    def _count(self):
+        """Rows in use; a shared registry may have grown since the last chunk"""
+        self._grow(self.registry.size)
+        return self.registry.size
+
+    def _add_time(self, diff, codes, low, high):
+        """Add the segments [low, high) to the per-hour difference array of each spot"""
+        low = np.clip(low, self._start, self._end)
+        high = np.clip(high, self._start, self._end)
+        keep = high > low
+        codes, low, high = codes[keep], low[keep], high[keep]
+        first, last = low // HOUR_NS, high // HOUR_NS
+        single = first == last
+        # Partial first hour, whole hours in between, partial last hour
+        head = np.where(single, high - low, (first + 1) * HOUR_NS - low)
+        tail = np.where(single, 0, high - last * HOUR_NS)
+        full = np.where(single, 0, HOUR_NS)
+        flat = diff.reshape(-1)
+        width = diff.shape[1]
+        base = codes * width
+        for hour, value in (
+            (first, head), (first + 1, -head),
+            (first + 1, full), (last, -full),
+            (last, tail), (last + 1, -tail)
+        ):
+            np.add.at(flat, base + hour, value)
+
+    def add(self, events):
+        """Fold a chunk of events (Arrow table or DataFrame with spot_id, status, timestamp) in"""
+        spot_ids, occupied, ns = event_arrays(events)
+        t = ns - self._epoch
+        keep = t < self._end
+        if not keep.all():
+            spot_ids, occupied, t = spot_ids[keep], occupied[keep], t[keep]
+        if not len(t):
+            return
+        codes = self._codes(spot_ids)
+        # Late events are applied at the spot's latest known time
+        t = np.where(self._known[codes], np.maximum(t, self._last[codes]), t)
+
+        order = np.lexsort((t, codes))
+        codes, occupied, t = codes[order], occupied[order], t[order]
+        count = len(t)
+        first = np.ones(count, dtype=bool)
+        first[1:] = codes[1:] != codes[:-1]
+        last = np.ones(count, dtype=bool)
+        last[:-1] = first[1:]
+
+        # Previous state of each event's spot: the row before, or the carried state
+        prev_known = np.ones(count, dtype=bool)
+        prev_known[first] = self._known[codes[first]]
+        prev_occupied = np.empty(count, dtype=bool)
+        prev_occupied[1:] = occupied[:-1]
+        prev_occupied[first] = self._occupied[codes[first]]
+        prev_t = np.empty(count, dtype=np.int64)
+        prev_t[1:] = t[:-1]
+        prev_t[first] = self._last[codes[first]]
+
+        self._add_time(self._observed_ns, codes[prev_known], prev_t[prev_known], t[prev_known])
+        was_occupied = prev_known & prev_occupied
+        self._add_time(self._occupied_ns, codes[was_occupied], prev_t[was_occupied], t[was_occupied])
+
+        in_window = t >= self._start
+        hours = t // HOUR_NS
+        np.add.at(self._events, (codes[in_window], hours[in_window]), 1)
+        arrival = occupied & prev_known & ~prev_occupied
+        counted = arrival & in_window
+        np.add.at(self._arrivals, (codes[counted], hours[counted]), 1)
+
+        # Start of the stay each event belongs to, forward-filled from the last
+        # arrival of the spot (or the carried stay at the spot's first row)
+        stay_start = np.where(arrival, t, UNKNOWN)
+        carried = first & ~arrival & was_occupied
+        stay_start[carried] = self._stay_start[codes[carried]]
+        marks = np.where(first | arrival, np.arange(count), 0)
+        since = stay_start[np.maximum.accumulate(marks)]
+
+        departure = ~occupied & was_occupied & in_window & (since != UNKNOWN)
+        if departure.any():
+            spots, dwell, ended = codes[departure], (t - since)[departure], hours[departure]
+            np.add.at(self._stays, spots, 1)
+            np.add.at(self._dwell_ns, spots, dwell)
+            np.maximum.at(self._dwell_max, spots, dwell)
+            bins = np.searchsorted(self.dwell_edges, dwell, side='right') - 1
+            np.add.at(self._dwell_hist, (spots, bins), 1)
+            np.add.at(self._departures, ended, 1)
+            np.add.at(self._departure_dwell_ns, ended, dwell)
+
+        spots = codes[last]
+        self._known[spots] = True
+        self._occupied[spots] = occupied[last]
+        self._last[spots] = t[last]
+        self._stay_start[spots] = np.where(occupied[last], since[last], UNKNOWN)
+
+    def _time_per_hour(self):
+        """(occupied_ns, observed_ns) per spot and hour, with every spot's state held until the window end"""
+        count = self._count()
+        known = np.flatnonzero(self._known[:count])
+        totals = []
+        for diff, held in ((self._occupied_ns, known[self._occupied[known]]), (self._observed_ns, known)):
+            diff = diff[:count].copy()
+            self._add_time(diff, held, self._last[held], np.full(len(held), self._end, dtype=np.int64))
+            totals.append(np.cumsum(diff, axis=1)[:, :self.hours])
+        return totals
+
+    def _hour_starts(self):
+        return pd.date_range(self.first_hour, periods=self.hours, freq='h')
+
+    def spot_hours(self):
+        """One row per spot and hour in which its state was known"""
+        occupied, observed = self._time_per_hour()
+        count = self._count()
+        spots, hours = np.nonzero(observed)
+        return pd.DataFrame({
+            'spot_id': self.registry.ids(spots),
+            'hour_start': self._hour_starts()[hours],
+            'event_count': self._events[:count][spots, hours],
+            'arrivals': self._arrivals[:count][spots, hours],
+            'occupied_seconds': occupied[spots, hours] / 1e9,
+            'observed_seconds': observed[spots, hours] / 1e9,
+            'occupancy_pct': np.round(occupied[spots, hours] * 100.0 / observed[spots, hours], 2)
+        })
+
+    def hourly(self):
+        """Occupancy, turnover and dwell of all spots together, one row per hour of the window"""
+        occupied, observed = self._time_per_hour()
+        spots_observed = (observed > 0).sum(axis=0)
+        occupied, observed = occupied.sum(axis=0), observed.sum(axis=0)
+        # Length of each hour inside the window; the first and last may be partial
+        bounds = np.arange(self.hours + 1, dtype=np.int64) * HOUR_NS
+        length = np.diff(np.clip(bounds, self._start, self._end))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return pd.DataFrame({
+                'hour_start': self._hour_starts(),
+                'spots_observed': spots_observed,
+                'occupied_seconds': occupied / 1e9,
+                'observed_seconds': observed / 1e9,
+                'occupancy_pct': np.round(np.where(observed > 0, occupied * 100.0 / observed, np.nan), 2),
+                'avg_occupied_spots': np.round(np.where(length > 0, occupied / length, np.nan), 2),
+                'arrivals': self._arrivals[:self._count()].sum(axis=0),
+                'departures': self._departures,
+                'mean_dwell_minutes': np.round(np.where(
+                    self._departures > 0, self._departure_dwell_ns / 6e10 / self._departures, np.nan
+                ), 1)
+            })
+
+    def spots(self):
+        """Occupancy, turnover and dwell per spot over the whole window"""
+        occupied, observed = (total.sum(axis=1) for total in self._time_per_hour())
+        count = self._count()
+        stays = self._stays[:count]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frame = pd.DataFrame({
+                'spot_id': self.registry.ids(),
+                'event_count': self._events[:count].sum(axis=1),
+                'arrivals': self._arrivals[:count].sum(axis=1),
+                'occupied_seconds': occupied / 1e9,
+                'observed_seconds': observed / 1e9,
+                'occupancy_pct': np.round(np.where(observed > 0, occupied * 100.0 / observed, np.nan), 2),
+                'stays': stays,
+                'mean_dwell_minutes': np.round(np.where(stays > 0, self._dwell_ns[:count] / 6e10 / stays, np.nan), 1),
+                'max_dwell_minutes': np.round(np.where(stays > 0, self._dwell_max[:count] / 6e10, np.nan), 1)
+            })
+        # Spots of a shared registry that had no events here
+        return frame[self._known[:count]].sort_values('spot_id', ignore_index=True)
+
+    def dwell_histogram(self, by_spot=False):
+        """Completed stays per dwell-time bin, for all spots or one row per spot"""
+        labels = [
+            f"{low // 6e10:g}-{high // 6e10:g}m" for low, high in zip(self.dwell_edges[:-1], self.dwell_edges[1:])
+        ] + [f">={self.dwell_edges[-1] // 6e10:g}m"]
+        count = self._count()
+        counts = self._dwell_hist[:count]
+        if by_spot:
+            frame = pd.DataFrame(counts, columns=labels)
+            frame.insert(0, 'spot_id', self.registry.ids())
+            return frame[self._known[:count]].sort_values('spot_id', ignore_index=True)
+        return pd.DataFrame({'dwell': labels, 'stays': counts.sum(axis=0)})
+
+def time_weighted_occupancy(chunks, start, end, **kwargs):
+    """Run an OccupancyAccumulator over an iterable of time-ordered event chunks"""
+    accumulator = OccupancyAccumulator(start, end, **kwargs)
+    for chunk in chunks:
+        accumulator.add(chunk)
+    return accumulator
+
+def main():
+    from analytics.local import LocalEngine
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data-dir', default='data', help='local copy of the bucket')
+    parser.add_argument('--source-format', choices=['json', 'parquet'], default='json')
+    parser.add_argument('--hours', type=int, default=24, help='window ending now')
+    parser.add_argument('--spots', nargs='+', help='only these spot ids')
+    parser.add_argument('--output-dir', help='also write spots/hourly/spot_hours/dwell CSV files here')
+    args = parser.parse_args()
+
+    start, end = last_hours(args.hours)
+    accumulator = LocalEngine(args.data_dir, args.source_format).occupancy(start, end, args.spots)
+    frames = {
+        'spots': accumulator.spots(),
+        'hourly': accumulator.hourly(),
+        'spot_hours': accumulator.spot_hours(),
+        'dwell': accumulator.dwell_histogram()
+    }
+    with pd.option_context('display.width', 160, 'display.max_columns', 20):
+        for name in ('spots', 'hourly', 'dwell'):
+            print(f"\n{name}:\n{frames[name].to_string(index=False)}")
+    if args.output_dir:
+        import os
+        os.makedirs(args.output_dir, exist_ok=True)
+        for name, frame in frames.items():
+            frame.to_csv(os.path.join(args.output_dir, f"{name}.csv"), index=False)
+
+if __name__ == "__main__":
+    main()
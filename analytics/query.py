@@ -0,0 +1,265 @@
+"""
+Time-window query builder for the parking tables.
+
+build_query() turns a metric, a time window and an optional spot filter into
+Athena SQL whose WHERE clause constrains the year/month/day/hour partition
+columns exactly as the ingestion handler lays them out (four-digit year,
+zero-padded month, day and hour strings). Athena then only reads the
+partitions inside the window, so bytes scanned grow with the window rather
+than with the age of the table.
+
+Usage:
+    python -m analytics.query hourly_occupancy --hours 24
+    python -m analytics.query spot_activity --hours 168 --spots A1 A2 --source rollup
+"""
+import argparse
+import calendar
+from datetime import datetime, timedelta
+
+from analytics.rollup import ROLLUP_TABLE, SOURCE_TABLE, TIMESTAMP_EXPRESSIONS
+
+HOUR = timedelta(hours=1)
+
+def floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def ceil_hour(moment):
+    floored = floor_hour(moment)
+    return floored if floored == moment else floored + HOUR
+
+def last_hours(hours, now=None):
+    """Window covering the last `hours` hours, including the current partial hour"""
+    end = ceil_hour(now or datetime.utcnow())
+    return end - hours * HOUR, end
+
+def _range(column, low, high):
+    return f"{column} = '{low}'" if low == high else f"{column} BETWEEN '{low}' AND '{high}'"
+
+def window_days(start, end):
+    """
+    Split [start, end) into per-day hour ranges: [(date, first_hour, last_hour)],
+    where a range of 0..23 means the whole day is inside the window.
+    """
+    days = []
+    hour, end = floor_hour(start), ceil_hour(end)
+    while hour < end:
+        day_end = datetime(hour.year, hour.month, hour.day) + timedelta(days=1)
+        last = min(end, day_end) - HOUR
+        days.append((hour.date(), hour.hour, last.hour))
+        hour = last + HOUR
+    return days
+
+def partition_predicate(start, end):
+    """
+    Predicate on year/month/day/hour selecting exactly the hour partitions that
+    overlap [start, end). Whole days, months and years are merged into single
+    ranges, so a 90-day window is a handful of clauses rather than 2,160.
+    """
+    if end <= start:
+        raise ValueError(f"Empty time window: {start} to {end}")
+
+    clauses = []
+    # Runs of whole days: (year, month, first_day, last_day)
+    day_runs = []
+    for day, first_hour, last_hour in window_days(start, end):
+        if (first_hour, last_hour) != (0, 23):
+            clauses.append(
+                f"year = '{day.year}' AND month = '{day.month:02d}' AND day = '{day.day:02d}' "
+                f"AND {_range('hour', f'{first_hour:02d}', f'{last_hour:02d}')}"
+            )
+        elif day_runs and day_runs[-1][:2] == (day.year, day.month) and day_runs[-1][3] == day.day - 1:
+            day_runs[-1] = day_runs[-1][:3] + (day.day,)
+        else:
+            day_runs.append((day.year, day.month, day.day, day.day))
+
+    # Whole months collapse further: (year, first_month, last_month)
+    month_runs = []
+    for year, month, first_day, last_day in day_runs:
+        whole_month = first_day == 1 and last_day == calendar.monthrange(year, month)[1]
+        if not whole_month:
+            clauses.append(
+                f"year = '{year}' AND month = '{month:02d}' "
+                f"AND {_range('day', f'{first_day:02d}', f'{last_day:02d}')}"
+            )
+        elif month_runs and month_runs[-1][0] == year and month_runs[-1][2] == month - 1:
+            month_runs[-1] = (year, month_runs[-1][1], month)
+        else:
+            month_runs.append((year, month, month))
+
+    for year, first_month, last_month in month_runs:
+        if (first_month, last_month) == (1, 12):
+            clauses.append(f"year = '{year}'")
+        else:
+            clauses.append(f"year = '{year}' AND {_range('month', f'{first_month:02d}', f'{last_month:02d}')}")
+
+    return "(" + "\n     OR ".join(f"({clause})" for clause in sorted(clauses)) + ")"
+
+def month_predicate(start, end):
+    """Predicate on the rollup table's year/month partitions overlapping [start, end)"""
+    months = {}
+    for day, _, _ in window_days(start, end):
+        months.setdefault(day.year, []).append(f"{day.month:02d}")
+    clauses = [
+        f"(year = '{year}' AND month IN ({', '.join(repr(m) for m in sorted(set(ms)))}))"
+        for year, ms in sorted(months.items())
+    ]
+    return "(" + " OR ".join(clauses) + ")"
+
+def time_predicate(column_expression, start, end, source_format='json'):
+    """Exact event-time bounds; JSON timestamps are fixed-format strings that compare lexically"""
+    if source_format == 'json':
+        low, high = (f"'{moment:%Y-%m-%dT%H:%M:%SZ}'" for moment in (start, end))
+    else:
+        low, high = (f"TIMESTAMP '{moment:%Y-%m-%d %H:%M:%S}'" for moment in (start, end))
+    return f"{column_expression} >= {low} AND {column_expression} < {high}"
+
+def spot_predicate(spot_ids):
+    quoted = ", ".join("'" + spot_id.replace("'", "''") + "'" for spot_id in spot_ids)
+    return f"spot_id IN ({quoted})"
+
+# SELECT ... GROUP BY ... ORDER BY templates per metric and source table; {ts} is the
+# event timestamp expression of the raw table
+METRICS = {
+    'hourly_occupancy': {
+        'events': {
+            'select': """year, month, day, hour,
+       COUNT(*) as total_events,
+       COUNT_IF(status = 'occupied') as occupied_events,
+       ROUND(COUNT_IF(status = 'occupied') * 100.0 / COUNT(*), 2) as occupancy_rate""",
+            'group_by': 'year, month, day, hour',
+            'order_by': 'year, month, day, hour'
+        },
+        'rollup': {
+            'select': """year, month, day, hour,
+       SUM(event_count) as total_events,
+       SUM(occupied_count) as occupied_events,
+       ROUND(SUM(occupied_count) * 100.0 / NULLIF(SUM(event_count), 0), 2) as occupancy_rate,
+       ROUND(SUM(occupied_seconds) * 100.0 / (COUNT(*) * 3600), 2) as time_occupied_pct""",
+            'group_by': 'year, month, day, hour',
+            'order_by': 'year, month, day, hour'
+        }
+    },
+    'spot_activity': {
+        'events': {
+            'select': """spot_id,
+       COUNT(*) as total_events,
+       COUNT_IF(status = 'occupied') as times_occupied,
+       COUNT_IF(status = 'vacant') as times_vacant,
+       ROUND(COUNT_IF(status = 'occupied') * 100.0 / COUNT(*), 2) as occupancy_rate""",
+            'group_by': 'spot_id',
+            'order_by': 'total_events DESC'
+        },
+        'rollup': {
+            'select': """spot_id,
+       SUM(event_count) as total_events,
+       SUM(occupied_count) as times_occupied,
+       SUM(vacant_count) as times_vacant,
+       ROUND(SUM(occupied_count) * 100.0 / NULLIF(SUM(event_count), 0), 2) as occupancy_rate,
+       ROUND(SUM(occupied_seconds) * 100.0 / (COUNT(*) * 3600), 2) as time_occupied_pct""",
+            'group_by': 'spot_id',
+            'order_by': 'total_events DESC'
+        }
+    },
+    'day_of_week': {
+        'events': {
+            'select': """day_of_week({ts}) as day,
+       COUNT(*) as total_events,
+       COUNT_IF(status = 'occupied') as occupied_events,
+       ROUND(COUNT_IF(status = 'occupied') * 100.0 / COUNT(*), 2) as occupancy_rate""",
+            'group_by': 'day_of_week({ts})',
+            'order_by': 'day'
+        },
+        'rollup': {
+            'select': """day_of_week(hour_start) as day,
+       SUM(event_count) as total_events,
+       SUM(occupied_count) as occupied_events,
+       ROUND(SUM(occupied_count) * 100.0 / NULLIF(SUM(event_count), 0), 2) as occupancy_rate""",
+            'group_by': 'day_of_week(hour_start)',
+            'order_by': 'day'
+        }
+    },
+    'latest_status': {
+        'events': {
+            'select': """spot_id,
+       max_by(status, timestamp) as status,
+       max(timestamp) as timestamp""",
+            'group_by': 'spot_id',
+            'order_by': 'spot_id'
+        }
+    },
+    'events': {
+        'events': {
+            'select': 'spot_id, status, timestamp',
+            'order_by': 'timestamp'
+        }
+    }
+}
+
+def build_query(metric, start=None, end=None, spot_ids=None, source='events', source_format='json',
+                order_by=None, limit=None, table=None):
+    """
+    SQL for one metric over the window [start, end), optionally limited to
+    some spots. Without a window the query covers the whole history, which
+    only makes sense for latest_status. source is 'events' for raw parking_events or 'rollup' for the
+    spot_hourly table; source_format is the raw table's format ('json' or
+    'parquet'), which decides how event timestamps are compared. table
+    overrides the table name, e.g. for another database.
+    """
+    try:
+        template = METRICS[metric][source]
+    except KeyError:
+        raise ValueError(f"Metric {metric!r} is not available from {source!r}") from None
+
+    ts = TIMESTAMP_EXPRESSIONS[source_format]
+    conditions = []
+    if source == 'events':
+        table = table or SOURCE_TABLE
+        if start is not None:
+            conditions += [
+                partition_predicate(start, end),
+                time_predicate('timestamp', start, end, source_format)
+            ]
+    else:
+        table = table or ROLLUP_TABLE
+        if start is not None:
+            conditions += [
+                month_predicate(start, end),
+                time_predicate('hour_start', floor_hour(start), ceil_hour(end), 'parquet')
+            ]
+    if spot_ids:
+        conditions.append(spot_predicate(spot_ids))
+
+    sql = [f"SELECT {template['select']}", f"FROM {table}"]
+    if conditions:
+        sql.append("WHERE " + "\n  AND ".join(conditions))
+    if 'group_by' in template:
+        sql.append(f"GROUP BY {template['group_by']}")
+    sql.append(f"ORDER BY {order_by or template['order_by']}")
+    if limit:
+        sql.append(f"LIMIT {int(limit)}")
+    return "\n".join(sql).replace('{ts}', ts)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('metric', choices=sorted(METRICS))
+    window = parser.add_mutually_exclusive_group(required=True)
+    window.add_argument('--hours', type=int, help='window ending now')
+    window.add_argument('--start', help='window start as YYYY-MM-DDTHH[:MM]')
+    parser.add_argument('--end', help='window end as YYYY-MM-DDTHH[:MM] (default: now)')
+    parser.add_argument('--spots', nargs='+', help='only these spot ids')
+    parser.add_argument('--source', choices=['events', 'rollup'], default='events')
+    parser.add_argument('--source-format', choices=['json', 'parquet'], default='json')
+    parser.add_argument('--limit', type=int)
+    args = parser.parse_args()
+
+    def parse(value):
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M" if ':' in value else "%Y-%m-%dT%H")
+
+    if args.hours:
+        start, end = last_hours(args.hours)
+    else:
+        start, end = parse(args.start), parse(args.end) if args.end else datetime.utcnow()
+    print(build_query(args.metric, start, end, args.spots, args.source, args.source_format, limit=args.limit) + ";")
+
+if __name__ == "__main__":
+    main()
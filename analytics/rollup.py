@@ -0,0 +1,124 @@
+"""
+Hourly per-spot rollup of parking events.
+
+parking_analytics.spot_hourly holds one row per spot and closed hour with the
+number of events, how many of them were occupied/vacant, the time the spot
+spent occupied in that hour and its status at the end of the hour. Each hour
+is appended with INSERT INTO from the hour's raw partition plus the previous
+hour's rollup rows, which carry each spot's status across the hour boundary,
+so a spot without events in an hour still gets its occupied time. Dashboards
+aggregate this table instead of scanning raw events.
+"""
+from datetime import datetime, timedelta
+
+ROLLUP_TABLE = 'parking_analytics.spot_hourly'
+ROLLUP_PREFIX = 'rollups/spot_hourly'
+ROLLUP_LOCATION = f's3://parking-monitoring-data/{ROLLUP_PREFIX}'
+SOURCE_TABLE = 'parking_analytics.parking_events'
+
+# How each raw table format stores the event timestamp, as an Athena timestamp expression
+TIMESTAMP_EXPRESSIONS = {
+    'json': "date_parse(timestamp, '%Y-%m-%dT%H:%i:%sZ')",
+    'parquet': 'timestamp'
+}
+
+def create_table_sql(location=ROLLUP_LOCATION):
+    """DDL of the rollup table; partitions are registered by INSERT INTO"""
+    return f"""
+CREATE EXTERNAL TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+    spot_id string,
+    hour_start timestamp,
+    day string,
+    hour string,
+    event_count bigint,
+    occupied_count bigint,
+    vacant_count bigint,
+    occupied_seconds double,
+    last_status string
+)
+PARTITIONED BY (
+    year string,
+    month string
+)
+STORED AS PARQUET
+LOCATION '{location}/'
+TBLPROPERTIES ('parquet.compression'='SNAPPY')
+""".strip()
+
+def _timestamp_literal(moment):
+    return f"TIMESTAMP '{moment:%Y-%m-%d %H:%M:%S}'"
+
+def _partition_filter(moment):
+    return f"year = '{moment.year}' AND month = '{moment.month:02d}'"
+
+def rollup_hour_sql(hour, source_format='json'):
+    """
+    INSERT INTO statement that appends the rollup rows of one closed hour.
+    Occupied time is the sum of the segments between consecutive events (and
+    from the hour start, using the status carried over from the previous
+    hour's rollup) during which the spot was occupied.
+    """
+    start = hour.replace(minute=0, second=0, microsecond=0)
+    previous = start - timedelta(hours=1)
+    end = start + timedelta(hours=1)
+    ts = TIMESTAMP_EXPRESSIONS[source_format]
+    return f"""
+INSERT INTO {ROLLUP_TABLE}
+WITH hour_events AS (
+    SELECT spot_id, status, {ts} AS ts, 1 AS is_event
+    FROM {SOURCE_TABLE}
+    WHERE year = '{start.year}' AND month = '{start.month:02d}'
+      AND day = '{start.day:02d}' AND hour = '{start.hour:02d}'
+),
+carried AS (
+    SELECT spot_id, last_status AS status, {_timestamp_literal(start)} AS ts, 0 AS is_event
+    FROM {ROLLUP_TABLE}
+    WHERE {_partition_filter(previous)} AND hour_start = {_timestamp_literal(previous)}
+),
+segments AS (
+    SELECT spot_id, status, ts, is_event,
+           coalesce(lead(ts) OVER (PARTITION BY spot_id ORDER BY ts, is_event),
+                    {_timestamp_literal(end)}) AS next_ts
+    FROM (SELECT * FROM hour_events UNION ALL SELECT * FROM carried)
+)
+SELECT spot_id,
+       {_timestamp_literal(start)} AS hour_start,
+       '{start.day:02d}' AS day,
+       '{start.hour:02d}' AS hour,
+       CAST(sum(is_event) AS bigint) AS event_count,
+       count_if(is_event = 1 AND status = 'occupied') AS occupied_count,
+       count_if(is_event = 1 AND status = 'vacant') AS vacant_count,
+       sum(CASE WHEN status = 'occupied' THEN date_diff('millisecond', ts, next_ts) ELSE 0 END) / 1000.0 AS occupied_seconds,
+       max_by(status, to_unixtime(ts) * 2 + is_event) AS last_status,
+       '{start.year}' AS year,
+       '{start.month:02d}' AS month
+FROM segments
+GROUP BY spot_id
+""".strip()
+
+def hour_exists_sql(hour):
+    """Query counting the rollup rows already written for an hour"""
+    start = hour.replace(minute=0, second=0, microsecond=0)
+    return (
+        f"SELECT count(*) FROM {ROLLUP_TABLE} "
+        f"WHERE {_partition_filter(start)} AND hour_start = {_timestamp_literal(start)}"
+    )
+
+def latest_hour_sql():
+    return f"SELECT max(hour_start) FROM {ROLLUP_TABLE}"
+
+def hours_to_process(last_rolled_up, now, grace=timedelta(minutes=15)):
+    """
+    Closed hours after last_rolled_up, oldest first. An hour is closed once
+    it ended more than grace ago, so late events have landed.
+    """
+    hours = []
+    hour = last_rolled_up.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    while hour + timedelta(hours=1) + grace <= now:
+        hours.append(hour)
+        hour += timedelta(hours=1)
+    return hours
+
+def parse_athena_timestamp(value):
+    """Parse a timestamp cell of an Athena result, e.g. '2024-03-20 10:00:00.000'"""
+    return datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S')
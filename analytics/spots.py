@@ -0,0 +1,337 @@
+"""
+Compact array-backed registry of parking spots.
+
+SpotRegistry interns spot ids to dense integer codes (0, 1, 2, ... in order
+of first appearance) and keeps every spot's state in NumPy arrays indexed by
+code: one bit of a packed bitset for "occupied", one for "state known", and
+int64 epoch seconds of the newest event and of the last status change. Ids
+themselves live in one fixed-width bytes array, found through an
+open-addressing hash table of int32 codes, so a million spots take a few
+tens of megabytes instead of the hundreds a dict of Python strings and
+tuples needs, and lot-wide or per-zone counts are vectorized reductions
+over the arrays.
+
+Ids are hashed over their 8-byte words, which works the same on one id in
+Python and on a batch of ids as uint64 columns, so single events and whole
+snapshots or chunks are interned through the same table.
+"""
+import numpy as np
+
+from analytics.timestamps import epoch_seconds
+
+# Recently used ids kept as a dict in front of the hash table
+CACHE_LIMIT = 65536
+# Epoch seconds of spots whose state is not known yet
+MISSING = np.iinfo(np.int64).min
+
+# Set bits per byte value; np.bitwise_count needs NumPy 2
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = 2**64 - 1
+
+def _encode(spot_ids):
+    """Fixed-width bytes array of spot ids (UTF-8)"""
+    try:
+        return np.asarray(spot_ids, dtype=np.bytes_)
+    except UnicodeEncodeError:
+        return np.array([spot_id.encode('utf-8') for spot_id in spot_ids], dtype=np.bytes_)
+
+def _hash_words(words):
+    """64-bit hashes of a (count, words) uint64 array, as _hash_key computes for one key"""
+    hashes = np.zeros(len(words), dtype=np.uint64)
+    for column in words.T:
+        hashes = (hashes ^ column) * np.uint64(_MULTIPLIER)
+    return hashes
+
+def _hash_key(words):
+    h = 0
+    for word in words:
+        h = ((h ^ word) * _MULTIPLIER) & _MASK64
+    return h
+
+class SpotRegistry:
+    def __init__(self, capacity=1024, id_width=8):
+        self.size = 0
+        self._capacity = 0
+        # Ids are stored padded to whole 8-byte words
+        self._width = -(-id_width // 8) * 8
+        self._keys = np.zeros(0, dtype=f'S{self._width}')
+        self._cache = {}
+
+        self._occupied = np.zeros(0, dtype=np.uint8)
+        self._known = np.zeros(0, dtype=np.uint8)
+        self.last_seen = np.zeros(0, dtype=np.int64)
+        self.last_change = np.zeros(0, dtype=np.int64)
+        self._grow(capacity)
+
+    def _grow(self, count):
+        if count <= self._capacity:
+            return
+        # Whole bytes of the bitsets
+        capacity = -(-max(count, 2 * self._capacity, 64) // 8) * 8
+
+        def grown(array, length, fill=0):
+            resized = np.full(length, fill, dtype=array.dtype)
+            resized[:len(array)] = array
+            return resized
+
+        self._keys = grown(self._keys, capacity, b'')
+        self._occupied = grown(self._occupied, capacity // 8)
+        self._known = grown(self._known, capacity // 8)
+        self.last_seen = grown(self.last_seen, capacity, MISSING)
+        self.last_change = grown(self.last_change, capacity, MISSING)
+        self._capacity = capacity
+        # Memoryviews index to plain Python objects, which keeps scalar updates cheap
+        self._key_view = memoryview(self._keys.view('<u8'))
+        self._occupied_view = memoryview(self._occupied)
+        self._known_view = memoryview(self._known)
+        self._seen_view = memoryview(self.last_seen)
+        self._change_view = memoryview(self.last_change)
+        self._rebuild_table()
+
+    def _widen(self, width):
+        width = -(-width // 8) * 8
+        if width > self._width:
+            self._width = width
+            self._keys = self._keys.astype(f'S{width}')
+            self._key_view = memoryview(self._keys.view('<u8'))
+            self._rebuild_table()
+
+    def _rebuild_table(self):
+        """Hash table with at least twice the capacity in slots, holding every registered code"""
+        bits = max(int(2 * self._capacity - 1).bit_length(), 4)
+        self._table = np.full(1 << bits, -1, dtype=np.int32)
+        self._table_view = memoryview(self._table)
+        self._mask = (1 << bits) - 1
+        self._shift = 64 - bits
+        self._insert(np.arange(self.size), self._slots(self._keys[:self.size]))
+
+    def _slots(self, keys):
+        """Home slots of a bytes array of the registry's width"""
+        words = keys.view('<u8').reshape(len(keys), self._width // 8)
+        return (_hash_words(words) >> np.uint64(self._shift)).astype(np.intp)
+
+    def _insert(self, codes, slots):
+        """Put codes into the table with linear probing, one code per free slot per round"""
+        table = self._table
+        while len(codes):
+            free = np.flatnonzero(table[slots] < 0)
+            _, first = np.unique(slots[free], return_index=True)
+            placed = free[first]
+            table[slots[placed]] = codes[placed]
+            left = np.ones(len(codes), dtype=bool)
+            left[placed] = False
+            codes, slots = codes[left], slots[left]
+            slots = np.where(table[slots] < 0, slots, (slots + 1) & self._mask)
+
+    def code(self, spot_id, create=True):
+        """Code of one spot id, registering it if needed (or returning None when create is False)"""
+        code = self._cache.get(spot_id)
+        if code is not None:
+            return code
+        key = spot_id.encode('utf-8')
+        if len(key) > self._width:
+            if not create:
+                return None
+            self._widen(len(key))
+        # Compared as uint64 words, which is what the key view indexes to
+        count = self._width // 8
+        if count == 1:
+            # Little-endian, so the unpadded key is the same word
+            words = word = int.from_bytes(key, 'little')
+            slot = ((word * _MULTIPLIER) & _MASK64) >> self._shift
+        else:
+            padded = key.ljust(self._width, b'\0')
+            words = [int.from_bytes(padded[i:i + 8], 'little') for i in range(0, self._width, 8)]
+            slot = _hash_key(words) >> self._shift
+        table, keys, mask = self._table_view, self._key_view, self._mask
+        while True:
+            code = table[slot]
+            if code < 0:
+                if not create:
+                    return None
+                if self.size == self._capacity:
+                    # Growing rebuilds the table, so probe again
+                    self._grow(self.size + 1)
+                    return self.code(spot_id)
+                code = table[slot] = self.size
+                self._keys[code] = key
+                self.size += 1
+                break
+            if (keys[code] == words) if count == 1 else (keys[code * count:(code + 1) * count].tolist() == words):
+                break
+            slot = (slot + 1) & mask
+        if len(self._cache) >= CACHE_LIMIT:
+            self._cache.clear()
+        self._cache[spot_id] = code
+        return code
+
+    def codes(self, spot_ids, create=True):
+        """Codes of an array of spot ids in one vectorized pass; -1 for unknown ids when create is False"""
+        keys = _encode(spot_ids)
+        if not len(keys):
+            return np.zeros(0, dtype=np.int64)
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        too_long = None
+        if create:
+            self._widen(unique.dtype.itemsize)
+        elif unique.dtype.itemsize > self._width:
+            # Ids longer than the registry's width are not registered, and would be truncated below
+            too_long = np.char.str_len(unique) > self._width
+        unique = unique.astype(self._keys.dtype)
+
+        found = np.full(len(unique), -1, dtype=np.int64)
+        slots = self._slots(unique)
+        probing = np.arange(len(unique))
+        while len(probing):
+            candidates = self._table[slots[probing]]
+            matched = (candidates >= 0) & (self._keys[np.maximum(candidates, 0)] == unique[probing])
+            found[probing[matched]] = candidates[matched]
+            # An empty slot ends the probe: the id is not registered
+            probing = probing[~matched & (candidates >= 0)]
+            slots[probing] = (slots[probing] + 1) & self._mask
+        if too_long is not None:
+            found[too_long] = -1
+
+        if create and (found < 0).any():
+            # New ids get codes in order of first appearance
+            new = np.flatnonzero(found < 0)
+            new = new[np.argsort(first[new])]
+            start = self.size
+            self._grow(start + len(new))
+            found[new] = np.arange(start, start + len(new))
+            self._keys[start:start + len(new)] = unique[new]
+            self.size += len(new)
+            self._insert(found[new], self._slots(unique[new]))
+        return found[inverse]
+
+    def ids(self, codes=None):
+        """Spot ids of codes (all registered spots by default) as a str array"""
+        keys = self._keys[:self.size] if codes is None else self._keys[np.asarray(codes)]
+        return np.char.decode(keys, 'utf-8')
+
+    def set(self, code, occupied, timestamp):
+        """
+        Apply one event to a spot with last-writer-wins on event time. Returns
+        the previous status (1 occupied, 0 vacant, -1 unknown), or None when
+        the event is older than the spot's newest one and was ignored.
+        """
+        if self._seen_view[code] > timestamp:
+            return None
+        byte, bit = code >> 3, 1 << (code & 7)
+        was_known = self._known_view[byte] & bit
+        was_occupied = 1 if self._occupied_view[byte] & bit else 0
+        self._seen_view[code] = timestamp
+        if occupied:
+            self._occupied_view[byte] |= bit
+        else:
+            self._occupied_view[byte] &= ~bit & 0xFF
+        if not was_known:
+            self._known_view[byte] |= bit
+            self._change_view[code] = timestamp
+            return -1
+        if was_occupied != occupied:
+            self._change_view[code] = timestamp
+        return was_occupied
+
+    def update(self, codes, occupied, timestamps):
+        """
+        Apply a batch of events with last-writer-wins, vectorized: the newest
+        event per spot is compared with the stored state. Returns the codes
+        whose status changed or became known.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        if not len(codes):
+            return codes
+        occupied = np.asarray(occupied, dtype=bool)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        # Newest event per spot; on equal times the one delivered last wins, as in set()
+        order = np.lexsort((np.arange(len(codes)), timestamps, codes))
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = codes[order][1:] != codes[order][:-1]
+        newest = order[last]
+        codes, occupied, timestamps = codes[newest], occupied[newest], timestamps[newest]
+
+        fresh = timestamps >= self.last_seen[codes]
+        codes, occupied, timestamps = codes[fresh], occupied[fresh], timestamps[fresh]
+        was_known = self.known_mask(codes)
+        changed = ~was_known | (self.occupied_mask(codes) != occupied)
+        self.last_seen[codes] = timestamps
+        self.last_change[codes[changed]] = timestamps[changed]
+        self._assign_bits(self._occupied, codes, occupied)
+        self._assign_bits(self._known, codes, np.ones(len(codes), dtype=bool))
+        return codes[changed]
+
+    @staticmethod
+    def _assign_bits(bits, codes, values):
+        expanded = np.unpackbits(bits, bitorder='little')
+        expanded[codes] = values
+        bits[:] = np.packbits(expanded, bitorder='little')
+
+    def occupied_mask(self, codes=None):
+        """Boolean occupied flag of codes (all registered spots by default)"""
+        return self._bits(self._occupied, codes)
+
+    def known_mask(self, codes=None):
+        return self._bits(self._known, codes)
+
+    def _bits(self, bits, codes):
+        if codes is None:
+            return np.unpackbits(bits, bitorder='little', count=self.size).astype(bool)
+        codes = np.asarray(codes, dtype=np.int64)
+        return (bits[codes >> 3] >> (codes & 7).astype(np.uint8) & 1).astype(bool)
+
+    def occupied_count(self):
+        return int(_POPCOUNT[self._occupied].sum())
+
+    def known_count(self):
+        return int(_POPCOUNT[self._known].sum())
+
+    def counts_by(self, groups):
+        """
+        (spots, occupied) per group for an int array giving each registered
+        spot's group, e.g. a zone code; spots with unknown state are not counted
+        """
+        groups = np.asarray(groups, dtype=np.intp)
+        known = self.known_mask()
+        spots = np.bincount(groups[known], minlength=int(groups.max(initial=-1)) + 1)
+        occupied = np.bincount(groups[known & self.occupied_mask()], minlength=len(spots))
+        return spots, occupied
+
+    def status(self, spot_id):
+        """(occupied, last_seen) of a spot, or None if it has no known state"""
+        code = self.code(spot_id, create=False)
+        if code is None or not self._known_view[code >> 3] & (1 << (code & 7)):
+            return None
+        return bool(self._occupied_view[code >> 3] & (1 << (code & 7))), self._seen_view[code]
+
+    def load_snapshot(self, spots):
+        """Apply a status snapshot ({spot_id: {'status': ..., 'timestamp': ...}}) with last-writer-wins"""
+        spot_ids = list(spots)
+        self.update(
+            self.codes(spot_ids),
+            [spots[spot_id]['status'] == 'occupied' for spot_id in spot_ids],
+            [epoch_seconds(spots[spot_id]['timestamp']) for spot_id in spot_ids]
+        )
+        return self
+
+    def frame(self):
+        """DataFrame of every spot with known state: spot_id, status, timestamp (as in the snapshot)"""
+        import pandas as pd
+
+        codes = np.flatnonzero(self.known_mask())
+        seconds = self.last_seen[codes].astype('datetime64[s]')
+        frame = pd.DataFrame({
+            'spot_id': self.ids(codes),
+            'status': np.where(self.occupied_mask(codes), 'occupied', 'vacant'),
+            'timestamp': np.datetime_as_string(seconds, unit='s').astype(object) + 'Z'
+        })
+        return frame.sort_values('spot_id', ignore_index=True)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the registry's arrays"""
+        return sum(array.nbytes for array in (
+            self._keys, self._table, self._occupied, self._known, self.last_seen, self.last_change
+        ))
@@ -0,0 +1,33 @@
+"""
+Event timestamps as the sensors publish them ("%Y-%m-%dT%H:%M:%SZ") and epoch seconds.
+
+Shared by the analytics package (SpotRegistry snapshots) and the realtime
+aggregator and service.
+"""
+import re
+import time
+import calendar
+
+# Fixed layout of "%Y-%m-%dT%H:%M:%SZ", checked on every event; ASCII digits only
+_TIMESTAMP_LAYOUT = re.compile(r'\d{4}-\d\d-\d\dT\d\d:[0-5]\d:[0-5]\dZ', re.ASCII)
+# Epoch seconds of "YYYY-MM-DDTHH" prefixes; events arrive in near time order
+_hour_cache = {}
+_HOUR_CACHE_LIMIT = 4096
+
+def epoch_seconds(timestamp):
+    """
+    Epoch seconds of a "%Y-%m-%dT%H:%M:%SZ" timestamp. The layout is checked
+    on every call; only the hour's epoch is cached, and strptime validates
+    the date and hour the first time an hour is seen.
+    """
+    if _TIMESTAMP_LAYOUT.fullmatch(timestamp) is None:
+        raise ValueError(f"Invalid timestamp: {timestamp!r}")
+    hour = _hour_cache.get(timestamp[:13])
+    if hour is None:
+        if len(_hour_cache) >= _HOUR_CACHE_LIMIT:
+            _hour_cache.clear()
+        hour = _hour_cache[timestamp[:13]] = calendar.timegm(time.strptime(timestamp[:13], "%Y-%m-%dT%H"))
+    return hour + int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+
+def format_epoch(seconds):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
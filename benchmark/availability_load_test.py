@@ -0,0 +1,196 @@
+"""
+Load test for the real-time availability service.
+
+Opens --clients keep-alive connections and has each one issue a GET request
+every --interval seconds (back to back with 0) for --duration seconds,
+cycling through the lot, a zone and a spot resource, then reports throughput
+and latency percentiles. With --conditional every client sends If-None-Match
+with the last ETag it saw, as a polling dashboard would, so unchanged
+resources are answered with 304.
+--long-pollers adds clients that each watch one spot with ?wait= requests,
+to show that parked long-polls do not slow the others down.
+
+By default the service is started as a subprocess with simulated sensors;
+pass --url to test a running instance instead.
+
+Usage:
+    python benchmark/availability_load_test.py [--clients 2000] [--interval 1] [--duration 10]
+        [--conditional] [--long-pollers 1000] [--url http://127.0.0.1:8080] [--max-p99-ms 50]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import statistics
+import subprocess
+from urllib.parse import urlsplit
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PATHS = ['/availability', '/availability/zones/A', '/availability/spots/A1', '/availability/zones/B']
+
+async def read_response(reader):
+    """(status, headers, body) of one HTTP/1.1 response"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, *lines = head[:-4].decode('latin-1').split('\r\n')
+    headers = {}
+    for line in lines:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return int(status_line.split(' ', 2)[1]), headers, body
+
+async def client(host, port, deadline, interval, conditional, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    etags = {}
+    paths = PATHS[:]
+    random.shuffle(paths)
+    try:
+        i = 0
+        # Spread the clients' polls evenly over the interval
+        next_request = time.monotonic() + random.uniform(0, interval)
+        while next_request < deadline:
+            await asyncio.sleep(next_request - time.monotonic())
+            next_request += interval
+            path = paths[i % len(paths)]
+            i += 1
+            request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+            if conditional and path in etags:
+                request += f"If-None-Match: {etags[path]}\r\n"
+            start = time.perf_counter()
+            writer.write((request + "\r\n").encode('latin-1'))
+            status, headers, _ = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if 'etag' in headers:
+                etags[path] = headers['etag']
+    finally:
+        writer.close()
+
+async def long_poller(host, port, spot_id, deadline, wait, counts):
+    reader, writer = await asyncio.open_connection(host, port)
+    etag = None
+    try:
+        while time.monotonic() < deadline:
+            # Do not hold the test open past its duration
+            timeout = round(min(wait, deadline - time.monotonic()), 1)
+            request = f"GET /availability/spots/{spot_id}?wait={timeout} HTTP/1.1\r\nHost: {host}\r\n"
+            if etag:
+                request += f"If-None-Match: {etag}\r\n"
+            writer.write((request + "\r\n").encode('latin-1'))
+            status, headers, _ = await read_response(reader)
+            counts[status] = counts.get(status, 0) + 1
+            etag = headers.get('etag', etag)
+    finally:
+        writer.close()
+
+async def run(host, port, args):
+    deadline = time.monotonic() + args.duration
+    latencies, statuses, long_polls = [], {}, {}
+    # The service's simulated spots are A1, B1, ... H1, A2, ...
+    spot_ids = [f"{chr(ord('A') + i % 8)}{i // 8 + 1}" for i in range(args.spots)]
+    tasks = [asyncio.create_task(long_poller(host, port, spot_ids[i % len(spot_ids)], deadline, args.wait, long_polls))
+             for i in range(args.long_pollers)]
+    # Let the long-polls park before the measured clients start
+    await asyncio.sleep(0.5 if args.long_pollers else 0)
+    started = time.perf_counter()
+    tasks += [asyncio.create_task(client(host, port, deadline, args.interval, args.conditional, latencies, statuses))
+              for _ in range(args.clients)]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    errors = [r for r in results if isinstance(r, Exception)]
+    return latencies, statuses, long_polls, errors, elapsed
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def start_service(port, spots):
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'realtime.service', '--source', 'simulate', '--spots', str(spots),
+         '--port', str(port)],
+        cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+    )
+
+    async def ready():
+        for _ in range(100):
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(b"GET /health HTTP/1.1\r\nHost: localhost\r\n\r\n")
+                await read_response(reader)
+                writer.close()
+                return
+            except OSError:
+                await asyncio.sleep(0.1)
+        raise RuntimeError("Service did not start")
+
+    asyncio.run(ready())
+    return proc
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='running service to test (default: start one with simulated sensors)')
+    parser.add_argument('--port', type=int, default=8099, help='port for the started service')
+    parser.add_argument('--spots', type=int, default=500, help='simulated spots of the started service')
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between requests per client')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--conditional', action='store_true', help='send If-None-Match with the last ETag')
+    parser.add_argument('--long-pollers', type=int, default=0)
+    parser.add_argument('--wait', type=float, default=30, help='long-poll wait in seconds')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--max-p99-ms', type=float, help='fail if the p99 latency exceeds this')
+    args = parser.parse_args()
+
+    # Every client holds a socket open
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    proc = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', args.port
+        proc = start_service(port, args.spots)
+    try:
+        latencies, statuses, long_polls, errors, elapsed = asyncio.run(run(host, port, args))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    latencies.sort()
+    summary = {
+        'clients': args.clients,
+        'long_pollers': args.long_pollers,
+        'requests': len(latencies),
+        'requests_per_sec': round(len(latencies) / elapsed),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'long_poll_statuses': {str(status): count for status, count in sorted(long_polls.items())},
+        'errors': len(errors)
+    }
+    print(f"Availability load test: {args.clients} clients every {args.interval:g}s "
+          f"({args.long_pollers} long-polling) for {args.duration:g}s"
+          f"{', conditional' if args.conditional else ''}")
+    for key in ('requests', 'requests_per_sec', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'statuses',
+                'long_poll_statuses', 'errors'):
+        print(f"  {key:<20} {summary[key]}")
+    if errors:
+        print(f"  first error: {errors[0]!r}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    if args.max_p99_ms is not None and summary['p99_ms'] > args.max_p99_ms:
+        print(f"p99 {summary['p99_ms']} ms exceeds the {args.max_p99_ms} ms budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Rendering time of the dashboard charts for a large lot.
+
+Builds the DataFrames visualize/parking_analytics.py plots for --spots spots
+over --days days of hourly data and times each chart twice: in detailed
+mode (one bar per spot, every heatmap cell annotated, markers on every hour,
+as the charts were drawn before they had compact forms) and in the default
+mode, which switches to a status grid, a sorted rate curve and unannotated
+cells past MAX_SPOT_BARS / MAX_DETAILED_POINTS. It then times rendering all
+four charts one after another and in a process pool of --workers.
+
+Charts are written to a temporary directory.
+
+Usage:
+    python benchmark/chart_benchmark.py [--spots 10000] [--days 90] [--workers 4] [--skip-detailed]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# The charts need no query engine; the local one creates no AWS clients
+os.environ.setdefault('QUERY_ENGINE', 'local')
+
+from visualize import parking_analytics as charts
+
+def chart_data(spots, days, seed=42):
+    """(current_status, hourly, spot_activity) DataFrames shaped like the dashboard queries' results"""
+    rng = np.random.default_rng(seed)
+    spot_ids = [f"{chr(ord('A') + i % 8)}{i // 8 + 1}" for i in range(spots)]
+    current_status = pd.DataFrame({
+        'spot_id': sorted(spot_ids),
+        'status': np.where(rng.random(spots) < 0.6, 'occupied', 'vacant'),
+        'timestamp': '2024-03-20T10:00:00Z'
+    })
+
+    hours = pd.date_range('2024-01-01', periods=days * 24, freq='h')
+    # A daily cycle peaking in the early afternoon, plus noise
+    daily = 55 + 30 * np.sin((hours.hour.to_numpy() - 8) / 24 * 2 * np.pi)
+    occupancy = np.clip(daily + rng.normal(0, 5, len(hours)), 0, 100)
+    hourly = pd.DataFrame({
+        'year': hours.strftime('%Y'),
+        'month': hours.strftime('%m'),
+        'day': hours.strftime('%d'),
+        'hour': hours.strftime('%H'),
+        'occupied_events': (occupancy / 100 * spots * 4).astype(int),
+        'time_occupied_pct': occupancy.round(2)
+    })
+
+    rates = np.clip(rng.normal(60, 15, spots), 0, 100).round(2)
+    spot_activity = pd.DataFrame({
+        'spot_id': spot_ids,
+        'total_events': rng.integers(100, 5000, spots),
+        'occupancy_rate': rates,
+        'time_occupied_pct': rates
+    })
+    return current_status, hourly, spot_activity
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--spots', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--skip-detailed', action='store_true', help='do not time the detailed mode')
+    args = parser.parse_args()
+
+    current_status, hourly, spot_activity = chart_data(args.spots, args.days)
+    chart_jobs = [
+        ('current status', charts.plot_current_status, current_status, 'max_bars'),
+        ('occupancy rate', charts.plot_occupancy_rate, charts.occupancy_rate_by_hour(hourly), 'max_markers'),
+        ('spot activity', charts.plot_spot_activity, spot_activity, 'max_bars'),
+        ('daily pattern', charts.plot_daily_pattern, charts.daily_pattern_by_hour(hourly), 'max_annotated'),
+    ]
+
+    workdir = tempfile.mkdtemp(prefix='chart_benchmark_')
+    os.makedirs(os.path.join(workdir, 'visualize'))
+    os.chdir(workdir)
+    # Font caches and other first-use costs are not part of any chart
+    charts.plot_occupancy_rate(charts.occupancy_rate_by_hour(hourly.head(24)))
+
+    print(f"Chart benchmark: {args.spots:,} spots x {args.days} days ({len(hourly):,} hours), "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'chart':<18} {'detailed (s)':>14} {'compact (s)':>14}")
+    compact_total = 0.0
+    for name, plot, df, limit in chart_jobs:
+        detailed = None if args.skip_detailed else timed(partial(plot, **{limit: sys.maxsize}), df)
+        compact = timed(plot, df)
+        compact_total += compact
+        print(f"{name:<18} {'-' if detailed is None else f'{detailed:.2f}':>14} {compact:>14.2f}")
+
+    pairs = [(plot, df) for _, plot, df, _ in chart_jobs]
+    sequential = timed(charts.render_charts, pairs, 1)
+    parallel = timed(charts.render_charts, pairs, args.workers)
+    print(f"{'all four':<18} {'':>14} {compact_total:>14.2f}")
+    print(f"render_charts: {sequential:.2f}s sequential, {parallel:.2f}s with {args.workers} worker processes")
+    print(f"Charts written to {os.path.join(workdir, 'visualize')}")
+
+if __name__ == "__main__":
+    main()
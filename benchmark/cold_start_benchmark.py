@@ -0,0 +1,182 @@
+"""
+Cold-start benchmark for the ingestion Lambda.
+
+Each run starts a fresh interpreter with `python -X importtime`, imports
+lambda/ingestion/index.py and invokes the handler twice against a local S3
+stand-in, so it measures module import time, first-invocation latency (the
+part of a cold start the init phase did not cover) and warm latency.
+Runs are repeated for the default eager mode, which creates the S3 client
+at import time, and for EAGER_INIT=false, which defers it to the first
+invocation.
+
+The figure to compare between modes is the cold start: import plus first
+invocation. Lazy creation only moves building the client from the init
+phase into the first call, so the two modes cost about the same in total.
+
+Usage:
+    python benchmark/cold_start_benchmark.py [--runs 5] [--top 10] [--output results.json]
+        [--max-cold-start-ms 400]
+
+With --max-cold-start-ms the script exits non-zero when the default (eager)
+mode's median cold start, import plus first invocation, exceeds the budget,
+so it can guard against regressions in CI. Import time alone is not
+guarded: moving work into the first invocation would lower it without
+making cold starts any faster.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+INGESTION_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'lambda', 'ingestion'))
+PHASE_MARKER = '--- first invocation ---'
+
+# Runs inside the child interpreter; timings are printed as a single JSON line
+CHILD_SCRIPT = f"""
+import sys, json, time
+start = time.perf_counter()
+import index
+imported = time.perf_counter()
+print({PHASE_MARKER!r}, file=sys.stderr, flush=True)
+event = {{'records': [{{'topic': 'parking-events', 'partition': 0, 'offset': 0,
+    'value': json.dumps({{'spot_id': 'A1', 'status': 'occupied', 'timestamp': '2024-03-20T10:00:00Z'}})}}]}}
+index.handler(event, None)
+first = time.perf_counter()
+index.handler(event, None)
+second = time.perf_counter()
+print('RESULT ' + json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'first_invocation_ms': (first - imported) * 1000,
+    'warm_invocation_ms': (second - first) * 1000
+}}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+class S3StandIn(BaseHTTPRequestHandler):
+    """Accepts PutObject requests and discards the body; every object read is missing"""
+    # HTTP/1.1 so botocore's "Expect: 100-continue" is answered instead of timing out
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('ETag', '"0"')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        # What GetObject of the not-yet-written status snapshot returns
+        body = b'<?xml version="1.0" encoding="UTF-8"?><Error><Code>NoSuchKey</Code><Message>The specified key does not exist.</Message></Error>'
+        self.send_response(404)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def parse_importtime(stderr):
+    """Split -X importtime output into init-phase and first-invocation top-level imports"""
+    phases = {'init': [], 'first_invocation': []}
+    phase = 'init'
+    for line in stderr.splitlines():
+        if line.strip() == PHASE_MARKER:
+            phase = 'first_invocation'
+            continue
+        match = IMPORTTIME_LINE.match(line)
+        # Only count top-level imports so nested modules are not double counted
+        if match and len(match.group(3)) == 1:
+            phases[phase].append((match.group(4), int(match.group(2)) / 1000))
+    return phases
+
+def run_once(endpoint, eager):
+    env = dict(
+        os.environ,
+        S3_BUCKET='cold-start-benchmark',
+        S3_ENDPOINT_URL=endpoint,
+        AWS_ACCESS_KEY_ID='testing',
+        AWS_SECRET_ACCESS_KEY='testing',
+        AWS_DEFAULT_REGION='eu-west-1',
+        LOG_LEVEL='WARNING',
+        # Measure the ingest path alone, whatever the calling shell has configured
+        SNAPSHOT_KEY='',
+        EAGER_INIT='true' if eager else 'false'
+    )
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT],
+        cwd=INGESTION_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    result_line = next(line for line in proc.stdout.splitlines() if line.startswith('RESULT '))
+    timings = json.loads(result_line[len('RESULT '):])
+    timings['cold_start_ms'] = timings['import_ms'] + timings['first_invocation_ms']
+    return timings, parse_importtime(proc.stderr)
+
+def summarize(runs):
+    return {
+        key: statistics.median(run[key] for run in runs)
+        for key in ('import_ms', 'first_invocation_ms', 'cold_start_ms', 'warm_invocation_ms')
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='top-level imports to list per phase')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--max-cold-start-ms', type=float,
+                        help='fail if the default mode\'s median import plus first invocation exceeds this')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), S3StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = {}
+    try:
+        for mode, eager in (('eager', True), ('lazy', False)):
+            runs, imports = [], None
+            for _ in range(args.runs):
+                timings, imports = run_once(endpoint, eager)
+                runs.append(timings)
+            results[mode] = {'median': summarize(runs), 'runs': runs, 'imports': imports}
+    finally:
+        server.shutdown()
+
+    print(f"Cold-start benchmark: median of {args.runs} fresh interpreters")
+    print(f"{'mode':<8} {'import ms':>10} {'1st call ms':>12} {'warm ms':>9} {'cold total ms':>14}")
+    for mode, result in results.items():
+        m = result['median']
+        print(f"{mode:<8} {m['import_ms']:>10.1f} {m['first_invocation_ms']:>12.1f} "
+              f"{m['warm_invocation_ms']:>9.1f} {m['cold_start_ms']:>14.1f}")
+    lazy, eager = (results[mode]['median']['cold_start_ms'] for mode in ('lazy', 'eager'))
+    print(f"Cold start (import + first invocation): lazy {lazy:.1f} ms, eager {eager:.1f} ms, "
+          f"difference {lazy - eager:+.1f} ms")
+
+    for mode, result in results.items():
+        for phase, modules in result['imports'].items():
+            top = sorted(modules, key=lambda item: item[1], reverse=True)[:args.top]
+            if not top:
+                continue
+            print(f"\n{mode}: slowest top-level imports during {phase.replace('_', ' ')} (cumulative ms)")
+            for name, ms in top:
+                print(f"  {name:<40} {ms:>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.max_cold_start_ms is not None:
+        cold_start_ms = results['eager']['median']['cold_start_ms']
+        if cold_start_ms > args.max_cold_start_ms:
+            print(f"\nFAIL: cold start took {cold_start_ms:.1f} ms, budget is {args.max_cold_start_ms:.1f} ms")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compression ratio versus CPU cost for ingestion output objects.
+
+Serializes synthetic partition batches exactly as the ingestion handler does
+(newline-delimited JSON) and compresses them with every codec the handler
+supports, reporting compression ratio and CPU time per batch.
+
+Usage:
+    python benchmark/compression_benchmark.py [--sizes 10 100 1000 10000] [--repeat 20]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'ingestion'))
+
+from index import compress_body, serialize_json_batch
+from synthetic import generate_records
+
+# (codec, level) pairs to compare; level None means the handler default
+CODECS = [
+    ('none', None),
+    ('gzip', 1),
+    ('gzip', 6),
+    ('gzip', 9),
+    ('zstd', 1),
+    ('zstd', 3),
+    ('zstd', 9),
+]
+
+def build_batch(size):
+    """Build a (record, message) batch like the handler passes to the serializer"""
+    return [(record, json.loads(record['value'])) for record in generate_records(size, hours=1)]
+
+def measure(body, codec, level, repeat):
+    """Return (compressed_size, best CPU ms) for one codec"""
+    best = float('inf')
+    compressed = body
+    for _ in range(repeat):
+        start = time.process_time()
+        compressed = compress_body(body, codec, level)
+        best = min(best, time.process_time() - start)
+    return len(compressed), best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        import zstandard  # noqa: F401
+        codecs = CODECS
+    except ImportError:
+        print("zstandard is not installed; skipping zstd codecs")
+        codecs = [c for c in CODECS if c[0] != 'zstd']
+
+    print(f"{'records':>8} {'codec':<8} {'raw bytes':>10} {'stored':>10} {'ratio':>7} {'cpu ms':>8} {'MB/s':>8}")
+    for size in args.sizes:
+        body = serialize_json_batch(build_batch(size))
+        for codec, level in codecs:
+            stored, cpu_ms = measure(body, codec, level, args.repeat)
+            name = codec if level is None else f"{codec}-{level}"
+            throughput = len(body) / 1e6 / (cpu_ms / 1000) if cpu_ms > 0 else float('inf')
+            print(f"{size:>8} {name:<8} {len(body):>10} {stored:>10} {len(body) / stored:>6.2f}x {cpu_ms:>8.3f} {throughput:>8.0f}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Microbenchmark for the ingestion decode path.
+
+Compares the original per-record json.loads + strptime partitioning against
+the decoder in lambda/ingestion/decoding.py (cached partition paths), for both the flat test
+event shape and the native MSK shape with base64-encoded values.
+
+Usage:
+    python benchmark/decode_benchmark.py [--records 10000] [--repeat 20]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'ingestion'))
+
+from decoding import decode_records, partition_path
+from synthetic import generate_records, to_msk_event
+
+def legacy_decode(event):
+    """The original handler loop: json.loads and strptime for every record"""
+    partitions = {}
+    for record in event['records']:
+        message = json.loads(record['value'])
+        timestamp = datetime.strptime(message['timestamp'], "%Y-%m-%dT%H:%M:%SZ")
+        path = f"year={timestamp.year}/month={timestamp.month:02d}/day={timestamp.day:02d}/hour={timestamp.hour:02d}"
+        partitions.setdefault(path, []).append((record, message))
+    return partitions
+
+def handler_decode(event):
+    """The decoding layer used by the handler"""
+    partitions = {}
+    decoded, _ = decode_records(event)
+    for record, message in decoded:
+        partitions.setdefault(partition_path(message['timestamp']), []).append((record, message))
+    return partitions
+
+def measure(func, event, record_count, repeat):
+    """Return the best records/sec over several runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(event)
+        best = min(best, time.perf_counter() - start)
+    return record_count / best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(42)
+    records = generate_records(args.records)
+    flat_event = {'records': records}
+    msk_event = to_msk_event(records)
+
+    # Both paths must agree before their speed is worth comparing
+    assert legacy_decode(flat_event).keys() == handler_decode(msk_event).keys()
+
+    results = [
+        ('legacy (flat)', measure(legacy_decode, flat_event, args.records, args.repeat)),
+        ('decoder (flat)', measure(handler_decode, flat_event, args.records, args.repeat)),
+        ('decoder (MSK base64)', measure(handler_decode, msk_event, args.records, args.repeat)),
+    ]
+
+    baseline = results[0][1]
+    print(f"Decode benchmark: {args.records} records, best of {args.repeat}")
+    print(f"{'path':<20} {'records/sec':>14} {'speedup':>8}")
+    for name, rate in results:
+        print(f"{name:<20} {rate:>14,.0f} {rate / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Offline end-to-end throughput benchmark for the ingestion handler.
+
+Builds synthetic MSK batches of varying size and hour-partition spread, runs
+lambda/ingestion/index.py:handler against S3 mocked with moto, and reports
+records/sec, S3 PUTs per record, bytes written and peak Python memory.
+The handler is configured from the usual environment variables, so output
+modes can be compared, e.g. OUTPUT_FORMAT=parquet or OUTPUT_COMPRESSION=zstd.
+
+Results are written as JSON; pass a previous results file with --compare to
+print the change in records/sec per scenario.
+
+Usage:
+    python benchmark/handler_benchmark.py [--sizes 1 10 100 1000 10000] [--spreads 1 4 24]
+        [--repeat 3] [--output handler_benchmark.json] [--compare previous.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import contextlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'ingestion'))
+
+from synthetic import generate_records, to_msk_event
+
+BENCHMARK_BUCKET = 'parking-monitoring-benchmark'
+
+# Settings that change what the handler writes, recorded with every run
+CONFIG_VARIABLES = (
+    'OUTPUT_FORMAT', 'PARQUET_COMPRESSION', 'OUTPUT_COMPRESSION', 'COMPRESSION_LEVEL',
+    'UPLOAD_CONCURRENCY', 'S3_MAX_POOL_CONNECTIONS', 'LOG_SAMPLE_RATE'
+)
+
+class PutCounter:
+    """Counts PutObject calls made through the handler's S3 client"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, **kwargs):
+        self.count += 1
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def invoke(index, event):
+    """Invoke the handler, discarding the EMF record it prints"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return json.loads(index.handler(event, None)['body'])
+
+def run_scenario(index, puts, size, spread, repeat):
+    """Benchmark one batch size and partition spread"""
+    event = to_msk_event(generate_records(size, hours=spread))
+
+    best = float('inf')
+    for _ in range(repeat):
+        puts.count = 0
+        start = time.perf_counter()
+        body = invoke(index, event)
+        best = min(best, time.perf_counter() - start)
+    put_count = puts.count
+
+    # Peak memory is measured on a separate pass because tracemalloc slows the handler down
+    tracemalloc.start()
+    invoke(index, event)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'records': size,
+        'partition_spread_hours': spread,
+        'records_per_sec': size / best,
+        'invocation_ms': best * 1000,
+        'puts': put_count,
+        'puts_per_record': put_count / size,
+        'objects_written': body['objects_written'],
+        'bytes_written': body['bytes_written'],
+        'peak_memory_bytes': peak
+    }
+
+def print_results(scenarios, previous=None):
+    baseline = {}
+    if previous:
+        baseline = {
+            (s['records'], s['partition_spread_hours']): s['records_per_sec']
+            for s in previous['scenarios']
+        }
+
+    header = f"{'records':>8} {'hours':>6} {'records/s':>12} {'ms':>9} {'PUTs/rec':>9} {'bytes':>11} {'peak MB':>8}"
+    print(header + (f" {'vs prev':>8}" if previous else ""))
+    for s in scenarios:
+        line = (
+            f"{s['records']:>8} {s['partition_spread_hours']:>6} {s['records_per_sec']:>12,.0f} "
+            f"{s['invocation_ms']:>9.2f} {s['puts_per_record']:>9.4f} {s['bytes_written']:>11,} "
+            f"{s['peak_memory_bytes'] / 1e6:>8.2f}"
+        )
+        before = baseline.get((s['records'], s['partition_spread_hours']))
+        if previous:
+            line += f" {s['records_per_sec'] / before:>7.2f}x" if before else f" {'-':>8}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    parser.add_argument('--spreads', type=int, nargs='+', default=[1, 4, 24],
+                        help='number of hour partitions the events of a batch are spread over')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='handler_benchmark.json')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    args = parser.parse_args()
+
+    from moto import mock_aws
+
+    os.environ['S3_BUCKET'] = BENCHMARK_BUCKET
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    random.seed(42)
+    scenarios = []
+    with mock_aws():
+        import index
+
+        client = index.get_s3_client()
+        client.create_bucket(
+            Bucket=BENCHMARK_BUCKET,
+            CreateBucketConfiguration={'LocationConstraint': os.environ['AWS_DEFAULT_REGION']}
+        )
+        puts = PutCounter()
+        client.meta.events.register('before-call.s3.PutObject', puts)
+
+        for size in args.sizes:
+            for spread in args.spreads:
+                scenarios.append(run_scenario(index, puts, size, spread, args.repeat))
+
+    results = {
+        'created_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'config': {name: os.environ[name] for name in CONFIG_VARIABLES if name in os.environ},
+        'note': 'S3 is mocked with moto; records/sec includes moto request handling',
+        'scenarios': scenarios
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    print(f"Handler benchmark (best of {args.repeat}, S3 mocked with moto)")
+    print_results(scenarios, previous)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
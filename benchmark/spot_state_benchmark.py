@@ -0,0 +1,100 @@
+"""
+Memory and speed of per-spot state: dicts of Python strings versus SpotRegistry.
+
+Builds the live view of --spots spots both ways - the aggregator's dict of
+spot_id -> (occupied, epoch seconds) and an analytics.spots.SpotRegistry -
+measures the memory each holds with tracemalloc, times a lot-wide occupied
+count (a Python loop over the dict against a bitset popcount) and a
+per-zone count, and streams --events events through OccupancyAggregator in
+both modes.
+
+Usage:
+    python benchmark/spot_state_benchmark.py [--spots 1000000] [--events 1000000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analytics.spots import SpotRegistry
+from realtime.aggregator import OccupancyAggregator
+
+START = 1710928800
+
+def spot_ids(count):
+    # Zones A-H, as the simulator and the availability service name spots
+    return [f"{chr(ord('A') + i % 8)}{i // 8 + 1}" for i in range(count)]
+
+def measure_memory(build):
+    """(result, bytes allocated while building it)"""
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+def timed(function, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--spots', type=int, default=1000000)
+    parser.add_argument('--events', type=int, default=1000000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    ids = spot_ids(args.spots)
+    rng = np.random.default_rng(42)
+    occupied_flags = rng.random(args.spots) < 0.6
+    seconds = START + np.arange(args.spots) % 3600
+
+    # Fresh strings and tuples, as decoded events deliver them
+    spots, dict_bytes = measure_memory(lambda: {
+        spot_id.encode().decode(): (bool(occupied), int(t)) for spot_id, occupied, t in zip(ids, occupied_flags, seconds)
+    })
+
+    def build_registry():
+        registry = SpotRegistry(capacity=args.spots)
+        registry.update(registry.codes(ids), occupied_flags, seconds)
+        return registry
+
+    registry, registry_bytes = measure_memory(build_registry)
+
+    occupied, dict_count = timed(lambda: sum(occupied for occupied, _ in spots.values()))
+    assert registry.occupied_count() == occupied
+    _, registry_count = timed(registry.occupied_count)
+
+    zones = np.frombuffer(registry.ids().astype('S1'), dtype=np.uint8) - ord('A')
+    _, dict_zones = timed(lambda: [sum(spots[s][0] for s in ids[zone::8]) for zone in range(8)])
+    _, registry_zones = timed(lambda: registry.counts_by(zones))
+
+    events = [(random.choice(ids), random.choice(('occupied', 'vacant')), START + i * 3600 // args.events)
+              for i in range(args.events)]
+    rates = {}
+    for name, make in (('dict', OccupancyAggregator), ('registry', lambda: OccupancyAggregator(registry=SpotRegistry()))):
+        aggregator = make()
+        start = time.perf_counter()
+        aggregator.add_many(events)
+        aggregator.flush()
+        rates[name] = args.events / (time.perf_counter() - start)
+
+    print(f"Spot state benchmark: {args.spots:,} spots, {args.events:,} events")
+    print(f"{'':<28} {'dict':>14} {'SpotRegistry':>14}")
+    print(f"{'memory (MB)':<28} {dict_bytes / 2**20:>14,.1f} {registry_bytes / 2**20:>14,.1f}")
+    print(f"{'lot occupied count (ms)':<28} {dict_count * 1000:>14,.2f} {registry_count * 1000:>14,.2f}")
+    print(f"{'per-zone counts (ms)':<28} {dict_zones * 1000:>14,.2f} {registry_zones * 1000:>14,.2f}")
+    print(f"{'aggregator events/sec':<28} {rates['dict']:>14,.0f} {rates['registry']:>14,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Throughput benchmark for the streaming occupancy aggregator.
+
+Feeds synthetic sensor events - near time order with some out-of-order
+jitter, as Kafka delivers them - to realtime/aggregator.py in-process and
+reports events/sec for three input shapes: decoded events with epoch-second
+timestamps, decoded events with the sensors' ISO-8601 string timestamps, and
+raw JSON lines as in a file replay (json.loads included). The decoded
+shapes are fed both through add() per event and through add_many().
+
+Usage:
+    python benchmark/stream_benchmark.py [--events 2000000] [--spots 5000] [--hours 6] [--repeat 3]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import calendar
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from realtime.aggregator import OccupancyAggregator, format_epoch
+from synthetic import DEFAULT_START
+
+def generate_events(count, spots, hours, jitter=10):
+    """(spot_id, status, epoch) tuples spread evenly over the hours, each up to jitter seconds out of order"""
+    start = calendar.timegm(DEFAULT_START.timetuple())
+    step = hours * 3600 / count
+    return [
+        (f"A{random.randint(1, spots)}",
+         random.choice(('occupied', 'vacant')),
+         start + int(i * step) - random.randint(0, jitter))
+        for i in range(count)
+    ]
+
+def feed_events(aggregator, events):
+    add = aggregator.add
+    for spot_id, status, timestamp in events:
+        add(spot_id, status, timestamp)
+
+def feed_batch(aggregator, events):
+    aggregator.add_many(events)
+
+def feed_json(aggregator, lines):
+    add = aggregator.add
+    loads = json.loads
+    for line in lines:
+        event = loads(line)
+        add(event['spot_id'], event['status'], event['timestamp'])
+
+def measure(feed, data, repeat):
+    """Best events/sec over several runs, each with a fresh aggregator, and its final snapshot"""
+    best, snapshot = float('inf'), None
+    for _ in range(repeat):
+        aggregator = OccupancyAggregator()
+        start = time.perf_counter()
+        feed(aggregator, data)
+        aggregator.flush()
+        best = min(best, time.perf_counter() - start)
+        snapshot = aggregator.snapshot()
+    return len(data) / best, snapshot
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=2000000)
+    parser.add_argument('--spots', type=int, default=5000)
+    parser.add_argument('--hours', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(42)
+    events = generate_events(args.events, args.spots, args.hours)
+    iso_events = [(spot_id, status, format_epoch(timestamp)) for spot_id, status, timestamp in events]
+    lines = [
+        json.dumps({'spot_id': spot_id, 'status': status, 'timestamp': timestamp}).encode('utf-8')
+        for spot_id, status, timestamp in iso_events
+    ]
+
+    results = [
+        ('decoded, epoch', *measure(feed_events, events, args.repeat)),
+        ('decoded, ISO-8601', *measure(feed_events, iso_events, args.repeat)),
+        ('add_many, epoch', *measure(feed_batch, events, args.repeat)),
+        ('add_many, ISO-8601', *measure(feed_batch, iso_events, args.repeat)),
+        ('JSON lines', *measure(feed_json, lines, args.repeat)),
+    ]
+    # Every input shape must end in the same state before their speed is worth comparing
+    assert all(snapshot == results[0][2] for _, _, snapshot in results)
+
+    print(f"Stream benchmark: {args.events:,} events, {args.spots} spots over {args.hours}h, best of {args.repeat}")
+    print(f"{'input':<20} {'events/sec':>14}")
+    for name, rate, _ in results:
+        print(f"{name:<20} {rate:>14,.0f}")
+    print(json.dumps(results[0][2]['windows']))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Synthetic parking events and Lambda event batches shared by the benchmarks."""
+import json
+import base64
+import random
+from datetime import datetime, timedelta
+
+DEFAULT_START = datetime(2024, 3, 20, 10, 0, 0)
+
+def generate_records(count, hours=2, spots=500, kafka_partitions=4, start=DEFAULT_START):
+    """Generate flat test records with timestamps spread over the given number of hours"""
+    records = []
+    for offset in range(count):
+        timestamp = start + timedelta(seconds=random.randint(0, hours * 3600 - 1))
+        records.append({
+            'topic': 'parking-events',
+            'partition': offset % kafka_partitions,
+            'offset': offset,
+            'value': json.dumps({
+                'spot_id': f"A{random.randint(1, spots)}",
+                'status': random.choice(['occupied', 'vacant']),
+                'timestamp': timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+            })
+        })
+    return records
+
+def to_msk_event(records):
+    """Convert flat records to the MSK event source shape with base64 values"""
+    grouped = {}
+    for record in records:
+        encoded = dict(record, value=base64.b64encode(record['value'].encode('utf-8')).decode('ascii'))
+        grouped.setdefault(f"{record['topic']}-{record['partition']}", []).append(encoded)
+    return {'eventSource': 'aws:kafka', 'records': grouped}
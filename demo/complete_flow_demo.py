@@ -1,3 +1,5 @@
+import os
+import sys
 import json
 import time
 import random
@@ -5,6 +7,9 @@ import boto3
 from datetime import datetime
 import logging
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'glue'))
+from compact_partitions import S3Store, iter_records
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -17,6 +22,7 @@ s3 = boto3.client('s3')
 lambda_client = boto3.client('lambda')
 glue = boto3.client('glue')
 athena = boto3.client('athena')
+store = S3Store('parking-monitoring-data', client=s3)
 
 def generate_parking_event():
     """Generate a sample parking event"""
@@ -70,9 +76,9 @@ def check_s3_data():
             logger.info("Found data in S3:")
             for obj in response['Contents'][:5]:
                 logger.info(f"- {obj['Key']}")
-                content = s3.get_object(Bucket='parking-monitoring-data', Key=obj['Key'])
-                data = json.loads(content['Body'].read().decode('utf-8'))
-                logger.info(f"  Content: {json.dumps(data, indent=2)}")
+                # Read with the compaction job's reader, which handles every format and compression
+                for record in iter_records(store, obj['Key']):
+                    logger.info(f"  Content: {json.dumps(record, indent=2)}")
         else:
             logger.info("No data found in S3")
     except Exception as e:
@@ -1,35 +1,46 @@
 -- Current parking status for all spots
-SELECT spot_id, 
-       status,
-       timestamp,
-       CONCAT(year, '-', month, '-', day, ' ', hour, ':00:00') as event_time
+-- Scans the whole table; dashboards read s3://parking-monitoring-data/parking-state/current_status.json,
+-- which the ingestion Lambda keeps up to date, instead.
+SELECT spot_id,
+       max_by(status, timestamp) as status,
+       max(timestamp) as timestamp
 FROM parking_analytics.parking_events
-ORDER BY timestamp DESC
-LIMIT 10;
+GROUP BY spot_id
+ORDER BY spot_id;
+
+-- These queries cover the whole history. For a bounded time window, generate SQL with
+-- partition predicates that Athena can prune on, e.g.
+--   python -m analytics.query hourly_occupancy --hours 24 --source rollup
+
+-- The queries below read the spot_hourly rollup (glue/rollup_hourly.py, one row per spot
+-- and closed hour) instead of raw events, so months of history scan kilobytes. Hours and spots
+-- without events still carry occupied time, so they are kept; their event rates are NULL.
 
 -- Occupancy rate by hour
 SELECT CONCAT(year, '-', month, '-', day, ' ', hour, ':00:00') as hour_slot,
-       COUNT(CASE WHEN status = 'occupied' THEN 1 END) * 100.0 / COUNT(*) as occupancy_rate,
-       COUNT(*) as total_events
-FROM parking_analytics.parking_events
+       SUM(occupied_count) * 100.0 / NULLIF(SUM(event_count), 0) as occupancy_rate,
+       SUM(event_count) as total_events,
+       SUM(occupied_seconds) * 100.0 / (COUNT(*) * 3600) as time_occupied_pct
+FROM parking_analytics.spot_hourly
 GROUP BY year, month, day, hour
 ORDER BY year, month, day, hour DESC;
 
 -- Most active parking spots
 SELECT spot_id,
-       COUNT(*) as total_events,
-       COUNT(CASE WHEN status = 'occupied' THEN 1 END) as times_occupied,
-       COUNT(CASE WHEN status = 'vacant' THEN 1 END) as times_vacant,
-       ROUND(COUNT(CASE WHEN status = 'occupied' THEN 1 END) * 100.0 / COUNT(*), 2) as occupancy_rate
-FROM parking_analytics.parking_events
+       SUM(event_count) as total_events,
+       SUM(occupied_count) as times_occupied,
+       SUM(vacant_count) as times_vacant,
+       ROUND(SUM(occupied_count) * 100.0 / NULLIF(SUM(event_count), 0), 2) as occupancy_rate,
+       ROUND(SUM(occupied_seconds) * 100.0 / (COUNT(*) * 3600), 2) as time_occupied_pct
+FROM parking_analytics.spot_hourly
 GROUP BY spot_id
 ORDER BY total_events DESC;
 
 -- Daily occupancy patterns
 SELECT CONCAT(year, '-', month, '-', day) as date,
        hour,
-       COUNT(CASE WHEN status = 'occupied' THEN 1 END) as occupied_spots,
-       COUNT(CASE WHEN status = 'vacant' THEN 1 END) as vacant_spots
-FROM parking_analytics.parking_events
+       SUM(occupied_count) as occupied_spots,
+       SUM(vacant_count) as vacant_spots
+FROM parking_analytics.spot_hourly
 GROUP BY year, month, day, hour
-ORDER BY year, month, day, hour; 
\ No newline at end of file
+ORDER BY year, month, day, hour;
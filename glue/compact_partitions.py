@@ -0,0 +1,406 @@
+"""
+Compact the small files of a closed hour partition into a few large ones.
+
+The ingestion Lambda writes one object per batch (and older deployments one
+per record), so each year=/month=/day=/hour= prefix collects many small
+files and Athena's per-file overhead dominates query time. This job rewrites
+a closed hour into one or a few newline-delimited JSON (optionally gzip/zstd)
+or Parquet files.
+
+Records are streamed through temporary files, so memory stays bounded
+regardless of partition size. The new files are staged under names Athena
+ignores (leading underscore), re-read to check that the record count matches
+the sources, and only then promoted and the sources deleted. A manifest
+written before promotion lets an interrupted run be resumed, and re-running
+on an already compacted hour is a no-op.
+
+A table never mixes file types, so compacting into another format writes
+the files under that format's table prefix (parking-data-parquet/ for
+Parquet) unless --output-prefix names another table.
+
+Usage:
+    python glue/compact_partitions.py --bucket parking-monitoring-data --hour 2024-03-20T10
+    python glue/compact_partitions.py --local-dir ./data --hour 2024-03-20T10 --output-format parquet
+    python glue/compact_partitions.py --local-dir ./data --hour 2024-03-20T10 --output-format parquet \
+        --output-prefix parking-data-archive
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+MANIFEST_NAME = '_compaction_manifest.json'
+STAGING_PREFIX = '_staging-'
+COMPACTED_PREFIX = 'compacted-'
+DEFAULT_MAX_RECORDS_PER_FILE = 5_000_000
+# Table prefix of each file format, as the ingestion Lambda lays them out
+TABLE_PREFIXES = {
+    'json': 'parking-data',
+    'parquet': 'parking-data-parquet'
+}
+PARQUET_ROW_GROUP_SIZE = 100_000
+
+class LocalStore:
+    """Object store over a local directory, keys are relative paths"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def list(self, prefix):
+        directory = self._path(prefix)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f"{prefix}/{name}" for name in os.listdir(directory)
+                      if os.path.isfile(os.path.join(directory, name)))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def upload(self, local_path, key):
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        shutil.copyfile(local_path, self._path(key))
+
+    def copy(self, source_key, dest_key):
+        os.makedirs(os.path.dirname(self._path(dest_key)), exist_ok=True)
+        shutil.copyfile(self._path(source_key), self._path(dest_key))
+
+    def delete(self, keys):
+        for key in keys:
+            if os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+
+    def read_json(self, key):
+        with self.open(key) as f:
+            return json.load(f)
+
+    def write_json(self, key, data):
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        with open(self._path(key), 'w') as f:
+            json.dump(data, f)
+
+class S3Store:
+    """Object store over an S3 bucket"""
+
+    def __init__(self, bucket, client=None):
+        import boto3
+        self.bucket = bucket
+        self.s3 = client or boto3.client('s3')
+
+    def list(self, prefix):
+        keys = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{prefix}/", Delimiter='/'):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return sorted(keys)
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def open(self, key):
+        # Spool to disk so large objects never sit in memory and Parquet can seek
+        f = tempfile.TemporaryFile()
+        self.s3.download_fileobj(self.bucket, key, f)
+        f.seek(0)
+        return f
+
+    def upload(self, local_path, key):
+        self.s3.upload_file(local_path, self.bucket, key)
+
+    def copy(self, source_key, dest_key):
+        self.s3.copy_object(Bucket=self.bucket, Key=dest_key,
+                            CopySource={'Bucket': self.bucket, 'Key': source_key})
+
+    def delete(self, keys):
+        keys = list(keys)
+        for start in range(0, len(keys), 1000):
+            self.s3.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': key} for key in keys[start:start + 1000]],
+                'Quiet': True
+            })
+
+    def read_json(self, key):
+        return json.loads(self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read())
+
+    def write_json(self, key, data):
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=json.dumps(data).encode('utf-8'),
+                           ContentType='application/json')
+
+def is_data_file(key):
+    """Athena and Hive skip files whose name starts with '_' or '.'"""
+    name = key.rsplit('/', 1)[-1]
+    return not name.startswith(('_', '.'))
+
+def iter_records(store, key):
+    """Stream the events of one data file as dicts with string timestamps"""
+    with store.open(key) as f:
+        if key.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(f).iter_batches(batch_size=PARQUET_ROW_GROUP_SIZE):
+                for row in batch.to_pylist():
+                    if isinstance(row['timestamp'], datetime):
+                        row['timestamp'] = row['timestamp'].strftime(TIMESTAMP_FORMAT)
+                    yield row
+            return
+
+        if key.endswith('.gz'):
+            stream = gzip.GzipFile(fileobj=f)
+        elif key.endswith('.zst'):
+            import zstandard
+            stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f))
+        else:
+            stream = f
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+class JsonPartWriter:
+    """Writes newline-delimited JSON to a temporary file, optionally compressed"""
+
+    def __init__(self, path, compression='none'):
+        raw = open(path, 'wb')
+        if compression == 'gzip':
+            self._raw, self._stream = raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0)
+        elif compression == 'zstd':
+            import zstandard
+            self._raw, self._stream = raw, zstandard.ZstdCompressor().stream_writer(raw)
+        else:
+            self._raw, self._stream = None, raw
+
+    def write(self, record):
+        self._stream.write((json.dumps(record) + "\n").encode('utf-8'))
+
+    def close(self):
+        self._stream.close()
+        if self._raw is not None and not self._raw.closed:
+            self._raw.close()
+
+class ParquetPartWriter:
+    """Writes Parquet with the ingestion schema, buffering one row group at a time"""
+
+    def __init__(self, path, compression='snappy'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._schema = pa.schema([
+            ('spot_id', pa.string()),
+            ('status', pa.dictionary(pa.int32(), pa.string())),
+            ('timestamp', pa.timestamp('ms'))
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema, compression=compression)
+        self._rows = []
+
+    def write(self, record):
+        self._rows.append(record)
+        if len(self._rows) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        pa = self._pa
+        table = pa.table({
+            'spot_id': pa.array([r['spot_id'] for r in self._rows], type=pa.string()),
+            'status': pa.array([r['status'] for r in self._rows], type=pa.string()).dictionary_encode(),
+            'timestamp': pa.array(
+                [datetime.strptime(r['timestamp'], TIMESTAMP_FORMAT) for r in self._rows],
+                type=pa.timestamp('ms')
+            )
+        }, schema=self._schema)
+        self._writer.write_table(table)
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+def file_format(key):
+    """'parquet' or 'json' (plain, gzip or zstd) for a data file"""
+    return 'parquet' if key.endswith('.parquet') else 'json'
+
+def output_extension(output_format, compression):
+    if output_format == 'parquet':
+        return 'parquet'
+    return {'none': 'json', 'gzip': 'json.gz', 'zstd': 'json.zst'}[compression]
+
+def partition_path_for_hour(hour):
+    """Partition path in the handler's layout for a datetime truncated to the hour"""
+    return f"year={hour.year}/month={hour.month:02d}/day={hour.day:02d}/hour={hour.hour:02d}"
+
+def resume_previous_run(store, partition_prefix):
+    """
+    Finish an interrupted compaction: promote staged files listed in the
+    manifest, delete its sources and drop the manifest. Staged files left
+    without a manifest come from a run that never verified, so they are removed.
+    """
+    manifest_key = f"{partition_prefix}/{MANIFEST_NAME}"
+    if store.exists(manifest_key):
+        manifest = store.read_json(manifest_key)
+        for staged_key, final_key in manifest['outputs']:
+            if store.exists(staged_key):
+                store.copy(staged_key, final_key)
+                store.delete([staged_key])
+        store.delete([key for key in manifest['inputs'] if store.exists(key)])
+        store.delete([manifest_key])
+        print(f"Resumed interrupted compaction of {partition_prefix}")
+
+    orphans = [key for key in store.list(partition_prefix)
+               if key.rsplit('/', 1)[-1].startswith(STAGING_PREFIX)]
+    store.delete(orphans)
+
+def compact_partition(store, partition_prefix, output_prefix=None, output_format='json',
+                      compression='none', max_records_per_file=DEFAULT_MAX_RECORDS_PER_FILE):
+    """
+    Compact every data file under partition_prefix into as few files as
+    max_records_per_file allows, written under output_prefix (defaults to the
+    same partition). Returns a summary dict; a partition that is already
+    compacted is left untouched. Raises ValueError rather than writing
+    another format into the partition itself, which would mix file types in
+    one table.
+    """
+    output_prefix = output_prefix or partition_prefix
+    resume_previous_run(store, partition_prefix)
+
+    inputs = [key for key in store.list(partition_prefix) if is_data_file(key)]
+    if output_prefix == partition_prefix and any(file_format(key) != output_format for key in inputs):
+        raise ValueError(
+            f"Writing {output_format} files into {partition_prefix} would mix file types in one table; "
+            f"pass an output prefix under the {output_format} table"
+        )
+    extension = output_extension(output_format, compression)
+    already_compacted = all(
+        key.rsplit('/', 1)[-1].startswith(COMPACTED_PREFIX) and key.endswith(f".{extension}")
+        for key in inputs
+    )
+    if not inputs or already_compacted:
+        return {'partition': partition_prefix, 'status': 'skipped', 'inputs': len(inputs)}
+
+    # Output names derive from the input set, so a retry produces the same keys
+    digest = hashlib.sha256("\n".join(inputs).encode('utf-8')).hexdigest()[:12]
+    if output_format == 'parquet':
+        writer_class, writer_compression = ParquetPartWriter, 'snappy' if compression == 'none' else compression
+    else:
+        writer_class, writer_compression = JsonPartWriter, compression
+
+    outputs = []
+    records_read = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        writer, part_records, local_path = None, 0, None
+
+        def finish_part():
+            writer.close()
+            part = len(outputs)
+            name = f"{digest}-{part:04d}.{extension}"
+            staged_key = f"{partition_prefix}/{STAGING_PREFIX}{name}"
+            store.upload(local_path, staged_key)
+            os.remove(local_path)
+            outputs.append((staged_key, f"{output_prefix}/{COMPACTED_PREFIX}{name}", part_records))
+
+        for key in inputs:
+            for record in iter_records(store, key):
+                if writer is None:
+                    local_path = os.path.join(workdir, f"part-{len(outputs):04d}")
+                    writer, part_records = writer_class(local_path, writer_compression), 0
+                writer.write(record)
+                part_records += 1
+                records_read += 1
+                if part_records >= max_records_per_file:
+                    finish_part()
+                    writer = None
+        if writer is not None:
+            finish_part()
+
+    # Re-read what was staged before anything is deleted
+    records_written = sum(1 for staged_key, _, _ in outputs for _ in iter_records(store, staged_key))
+    if records_written != records_read:
+        store.delete([staged_key for staged_key, _, _ in outputs])
+        raise RuntimeError(
+            f"Record count mismatch compacting {partition_prefix}: "
+            f"read {records_read}, wrote {records_written}; sources kept"
+        )
+
+    manifest_key = f"{partition_prefix}/{MANIFEST_NAME}"
+    store.write_json(manifest_key, {
+        'inputs': inputs,
+        'outputs': [[staged_key, final_key] for staged_key, final_key, _ in outputs],
+        'records': records_read
+    })
+    for staged_key, final_key, _ in outputs:
+        store.copy(staged_key, final_key)
+        store.delete([staged_key])
+    final_keys = {final_key for _, final_key, _ in outputs}
+    store.delete([key for key in inputs if key not in final_keys])
+    store.delete([manifest_key])
+
+    return {
+        'partition': partition_prefix,
+        'status': 'compacted',
+        'inputs': len(inputs),
+        'outputs': [final_key for _, final_key, _ in outputs],
+        'records': records_read
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--bucket', help='S3 bucket holding the table data')
+    target.add_argument('--local-dir', help='local directory with the same layout as the bucket')
+    parser.add_argument('--prefix', default='parking-data', help='table prefix inside the bucket')
+    parser.add_argument('--output-prefix',
+                        help='write compacted files under another table prefix '
+                             '(default: the source table, or the output format\'s table when it differs)')
+    parser.add_argument('--hour', help='hour to compact as YYYY-MM-DDTHH (default: the last closed hour)')
+    parser.add_argument('--grace-minutes', type=int, default=15,
+                        help='how long after an hour ends before it counts as closed')
+    parser.add_argument('--output-format', choices=['json', 'parquet'], default='json')
+    parser.add_argument('--compression', choices=['none', 'gzip', 'zstd'], default='none',
+                        help='JSON object compression, or the Parquet codec when not "none"')
+    parser.add_argument('--max-records-per-file', type=int, default=DEFAULT_MAX_RECORDS_PER_FILE)
+    args = parser.parse_args()
+
+    closed_before = datetime.utcnow() - timedelta(minutes=args.grace_minutes)
+    if args.hour:
+        hour = datetime.strptime(args.hour, "%Y-%m-%dT%H")
+    else:
+        hour = closed_before.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+    if hour + timedelta(hours=1) > closed_before:
+        print(f"Hour {hour:%Y-%m-%dT%H} is not closed yet; refusing to compact it")
+        sys.exit(1)
+
+    output_table = args.output_prefix
+    source_format = 'parquet' if args.prefix == TABLE_PREFIXES['parquet'] else 'json'
+    if output_table is None and args.output_format != source_format:
+        if args.prefix not in TABLE_PREFIXES.values():
+            parser.error(f"--output-prefix is required to write {args.output_format} files from {args.prefix}")
+        output_table = TABLE_PREFIXES[args.output_format]
+
+    store = S3Store(args.bucket) if args.bucket else LocalStore(args.local_dir)
+    partition = partition_path_for_hour(hour)
+    output_prefix = f"{output_table}/{partition}" if output_table else None
+    summary = compact_partition(
+        store, f"{args.prefix}/{partition}", output_prefix,
+        args.output_format, args.compression, args.max_records_per_file
+    )
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -11,4 +11,19 @@ PARTITIONED BY (
 )
 ROW FORMAT SERDE 'org.openx.data.jsonserde.JsonSerDe'
 LOCATION 's3://parking-monitoring-data/parking-data/'
-TBLPROPERTIES ('has_encrypted_data'='false'); 
\ No newline at end of file
+TBLPROPERTIES (
+    'has_encrypted_data'='false',
+    'projection.enabled'='true',
+    'projection.year.type'='integer',
+    'projection.year.range'='2024,2030',
+    'projection.month.type'='integer',
+    'projection.month.range'='1,12',
+    'projection.month.digits'='2',
+    'projection.day.type'='integer',
+    'projection.day.range'='1,31',
+    'projection.day.digits'='2',
+    'projection.hour.type'='integer',
+    'projection.hour.range'='0,23',
+    'projection.hour.digits'='2',
+    'storage.location.template'='s3://parking-monitoring-data/parking-data/year=${year}/month=${month}/day=${day}/hour=${hour}'
+); 
\ No newline at end of file
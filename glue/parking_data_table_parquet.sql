@@ -0,0 +1,29 @@
+CREATE EXTERNAL TABLE IF NOT EXISTS parking_analytics.parking_events (
+    spot_id string,
+    status string,
+    timestamp timestamp
+)
+PARTITIONED BY (
+    year string,
+    month string,
+    day string,
+    hour string
+)
+STORED AS PARQUET
+LOCATION 's3://parking-monitoring-data/parking-data-parquet/'
+TBLPROPERTIES (
+    'has_encrypted_data'='false',
+    'projection.enabled'='true',
+    'projection.year.type'='integer',
+    'projection.year.range'='2024,2030',
+    'projection.month.type'='integer',
+    'projection.month.range'='1,12',
+    'projection.month.digits'='2',
+    'projection.day.type'='integer',
+    'projection.day.range'='1,31',
+    'projection.day.digits'='2',
+    'projection.hour.type'='integer',
+    'projection.hour.range'='0,23',
+    'projection.hour.digits'='2',
+    'storage.location.template'='s3://parking-monitoring-data/parking-data-parquet/year=${year}/month=${month}/day=${day}/hour=${hour}'
+);
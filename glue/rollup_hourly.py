@@ -0,0 +1,59 @@
+"""
+Append closed hours to the spot_hourly rollup table.
+
+Creates parking_analytics.spot_hourly if needed, then runs one INSERT INTO
+per closed hour after the newest hour already in the table. Hours are
+processed oldest first because each one carries spot status over from the
+previous hour. An hour that already has rows is skipped, so the job is safe
+to re-run; schedule it hourly after the grace period.
+
+Usage:
+    python glue/rollup_hourly.py --from-hour 2024-03-01T00    # first run / backfill
+    python glue/rollup_hourly.py                              # append new closed hours
+"""
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analytics.athena import AthenaClient
+from analytics.rollup import (
+    create_table_sql, hour_exists_sql, hours_to_process, latest_hour_sql,
+    parse_athena_timestamp, rollup_hour_sql
+)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--from-hour', help='first hour to roll up as YYYY-MM-DDTHH (required while the table is empty)')
+    parser.add_argument('--grace-minutes', type=int, default=15,
+                        help='how long after an hour ends before it is rolled up')
+    # Must match OUTPUT_FORMAT of the ingestion Lambda and glue/setup_catalog.py
+    parser.add_argument('--source-format', choices=['json', 'parquet'],
+                        default=os.environ.get('OUTPUT_FORMAT', 'json').lower())
+    args = parser.parse_args()
+
+    athena = AthenaClient(database='parking_analytics', output_location='s3://parking-monitoring-data/athena-results/')
+    athena.run(create_table_sql())
+
+    if args.from_hour:
+        last = datetime.strptime(args.from_hour, "%Y-%m-%dT%H") - timedelta(hours=1)
+    else:
+        latest = athena.run(latest_hour_sql()).rows[0][0]
+        if not latest:
+            print("Rollup table is empty; pass --from-hour to start the backfill")
+            sys.exit(1)
+        last = parse_athena_timestamp(latest)
+
+    hours = hours_to_process(last, datetime.utcnow(), timedelta(minutes=args.grace_minutes))
+    print(f"{len(hours)} closed hours to roll up")
+    for hour in hours:
+        if int(athena.run(hour_exists_sql(hour)).rows[0][0]):
+            print(f"{hour:%Y-%m-%dT%H} already rolled up, skipping")
+            continue
+        result = athena.run(rollup_hour_sql(hour, args.source_format))
+        print(f"{hour:%Y-%m-%dT%H} rolled up ({result.data_scanned_bytes / 1e6:.1f} MB scanned)")
+
+if __name__ == "__main__":
+    main()
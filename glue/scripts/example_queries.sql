@@ -1,13 +1,15 @@
+-- Hourly counts come from the spot_hourly rollup (glue/rollup_hourly.py)
+
 -- Get hourly occupancy rate
 SELECT 
     year,
     month,
     day,
     hour,
-    COUNT(*) as total_events,
-    COUNT(CASE WHEN status = 'occupied' THEN 1 END) as occupied_spots,
-    CAST(COUNT(CASE WHEN status = 'occupied' THEN 1 END) AS DOUBLE) / COUNT(*) * 100 as occupancy_rate
-FROM parking_data
+    SUM(event_count) as total_events,
+    SUM(occupied_count) as occupied_spots,
+    CAST(SUM(occupied_count) AS DOUBLE) / NULLIF(SUM(event_count), 0) * 100 as occupancy_rate
+FROM spot_hourly
 GROUP BY year, month, day, hour
 ORDER BY year, month, day, hour;
 
@@ -17,22 +19,22 @@ SELECT
     month,
     day,
     hour,
-    COUNT(*) as total_events,
-    COUNT(CASE WHEN status = 'occupied' THEN 1 END) as occupied_spots,
-    CAST(COUNT(CASE WHEN status = 'occupied' THEN 1 END) AS DOUBLE) / COUNT(*) * 100 as occupancy_rate
-FROM parking_data
+    SUM(event_count) as total_events,
+    SUM(occupied_count) as occupied_spots,
+    CAST(SUM(occupied_count) AS DOUBLE) / NULLIF(SUM(event_count), 0) * 100 as occupancy_rate
+FROM spot_hourly
 GROUP BY year, month, day, hour
 ORDER BY occupancy_rate DESC
 LIMIT 10;
 
 -- Get average occupancy by day of week
 SELECT 
-    day_of_week(from_iso8601_timestamp(timestamp)) as day_of_week,
-    COUNT(*) as total_events,
-    COUNT(CASE WHEN status = 'occupied' THEN 1 END) as occupied_spots,
-    CAST(COUNT(CASE WHEN status = 'occupied' THEN 1 END) AS DOUBLE) / COUNT(*) * 100 as avg_occupancy_rate
-FROM parking_data
-GROUP BY day_of_week(from_iso8601_timestamp(timestamp))
+    day_of_week(hour_start) as day_of_week,
+    SUM(event_count) as total_events,
+    SUM(occupied_count) as occupied_spots,
+    CAST(SUM(occupied_count) AS DOUBLE) / NULLIF(SUM(event_count), 0) * 100 as avg_occupancy_rate
+FROM spot_hourly
+GROUP BY day_of_week(hour_start)
 ORDER BY day_of_week;
 
 -- Get average duration of occupancy per spot
@@ -1,6 +1,12 @@
+import os
+import sys
 import boto3
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analytics.athena import AthenaClient, QueryFailed
+
 # Initialize Glue client
 glue = boto3.client('glue')
 
@@ -29,8 +35,88 @@ def delete_table_if_exists():
     except glue.exceptions.EntityNotFoundException:
         print("Table does not exist")
 
-def create_table():
-    """Create Glue table"""
+# Storage settings for each output format written by the ingestion Lambda
+TABLE_FORMATS = {
+    'json': {
+        'Location': 's3://parking-monitoring-data/parking-data',
+        'Classification': 'json',
+        'Columns': [
+            {'Name': 'spot_id', 'Type': 'string'},
+            {'Name': 'status', 'Type': 'string'},
+            {'Name': 'timestamp', 'Type': 'string'}
+        ],
+        'InputFormat': 'org.apache.hadoop.mapred.TextInputFormat',
+        'OutputFormat': 'org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat',
+        'SerdeInfo': {
+            'SerializationLibrary': 'org.openx.data.jsonserde.JsonSerDe',
+            'Parameters': {
+                'serialization.format': '1',
+                'paths': 'spot_id,status,timestamp'
+            }
+        }
+    },
+    'parquet': {
+        'Location': 's3://parking-monitoring-data/parking-data-parquet',
+        'Classification': 'parquet',
+        'Columns': [
+            {'Name': 'spot_id', 'Type': 'string'},
+            {'Name': 'status', 'Type': 'string'},
+            {'Name': 'timestamp', 'Type': 'timestamp'}
+        ],
+        'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
+        'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
+        'SerdeInfo': {
+            'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe',
+            'Parameters': {
+                'serialization.format': '1'
+            }
+        }
+    }
+}
+
+def projection_parameters(location, year_range='2024,2030'):
+    """
+    Athena partition projection for the year=/month=/day=/hour= layout the
+    ingestion Lambda writes. Month, day and hour are zero-padded to two digits,
+    the year is not. Partitions are computed from query predicates, so new
+    hours are queryable immediately without MSCK REPAIR TABLE; queries should
+    filter on the partition columns to keep the projected partition set small.
+    """
+    return {
+        'projection.enabled': 'true',
+        'projection.year.type': 'integer',
+        'projection.year.range': year_range,
+        'projection.month.type': 'integer',
+        'projection.month.range': '1,12',
+        'projection.month.digits': '2',
+        'projection.day.type': 'integer',
+        'projection.day.range': '1,31',
+        'projection.day.digits': '2',
+        'projection.hour.type': 'integer',
+        'projection.hour.range': '0,23',
+        'projection.hour.digits': '2',
+        'storage.location.template': f"{location}/year=${{year}}/month=${{month}}/day=${{day}}/hour=${{hour}}"
+    }
+
+def create_table(table_format='json', compression='none', projection=False, year_range='2024,2030'):
+    """
+    Create Glue table for the given ingestion output format ('json' or 'parquet')
+    and JSON object compression ('none', 'gzip' or 'zstd'). Athena picks the
+    codec from the .gz/.zst file extension; the table records it for tools
+    that read the catalog. With projection=True the table uses Athena
+    partition projection over year_range instead of registered partitions.
+    """
+    fmt = TABLE_FORMATS[table_format]
+    parameters = {
+        'classification': fmt['Classification'],
+        'typeOfData': 'file',
+        'EXTERNAL': 'TRUE'
+    }
+    compressed = table_format == 'json' and compression != 'none'
+    if compressed:
+        parameters['compressionType'] = compression
+    if projection:
+        parameters.update(projection_parameters(fmt['Location'], year_range))
     try:
         glue.create_table(
             DatabaseName='parking_analytics',
@@ -38,28 +124,14 @@ def create_table():
                 'Name': 'parking_events',
                 'Description': 'Parking events data',
                 'TableType': 'EXTERNAL_TABLE',
-                'Parameters': {
-                    'classification': 'json',
-                    'typeOfData': 'file',
-                    'EXTERNAL': 'TRUE'
-                },
+                'Parameters': parameters,
                 'StorageDescriptor': {
-                    'Columns': [
-                        {'Name': 'spot_id', 'Type': 'string'},
-                        {'Name': 'status', 'Type': 'string'},
-                        {'Name': 'timestamp', 'Type': 'string'}
-                    ],
-                    'Location': 's3://parking-monitoring-data/parking-data',
-                    'InputFormat': 'org.apache.hadoop.mapred.TextInputFormat',
-                    'OutputFormat': 'org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat',
-                    'SerdeInfo': {
-                        'SerializationLibrary': 'org.openx.data.jsonserde.JsonSerDe',
-                        'Parameters': {
-                            'serialization.format': '1',
-                            'paths': 'spot_id,status,timestamp'
-                        }
-                    },
-                    'Compressed': False
+                    'Columns': fmt['Columns'],
+                    'Location': fmt['Location'],
+                    'InputFormat': fmt['InputFormat'],
+                    'OutputFormat': fmt['OutputFormat'],
+                    'SerdeInfo': fmt['SerdeInfo'],
+                    'Compressed': compressed
                 },
                 'PartitionKeys': [
                     {'Name': 'year', 'Type': 'string'},
@@ -69,50 +141,37 @@ def create_table():
                 ]
             }
         )
-        print("Created table: parking_events")
+        print(
+            f"Created table: parking_events ({table_format}, compression: {compression}, "
+            f"partition projection: {'on' if projection else 'off'})"
+        )
     except Exception as e:
         print(f"Error creating table: {str(e)}")
 
 def update_partitions():
     """Update table partitions using Athena"""
-    athena = boto3.client('athena')
+    athena = AthenaClient(database='parking_analytics', output_location='s3://parking-monitoring-data/athena-results/')
     
     try:
         # Run MSCK REPAIR TABLE
         query = "MSCK REPAIR TABLE parking_analytics.parking_events"
-        response = athena.start_query_execution(
-            QueryString=query,
-            QueryExecutionContext={
-                'Database': 'parking_analytics'
-            },
-            ResultConfiguration={
-                'OutputLocation': 's3://parking-monitoring-data/athena-results/'
-            }
-        )
-        
-        # Wait for query to complete
-        query_execution_id = response['QueryExecutionId']
-        print(f"Started partition update: {query_execution_id}")
-        
-        while True:
-            query_status = athena.get_query_execution(QueryExecutionId=query_execution_id)
-            state = query_status['QueryExecution']['Status']['State']
-            
-            if state == 'SUCCEEDED':
-                print("Successfully updated partitions")
-                break
-            elif state in ['FAILED', 'CANCELLED']:
-                print(f"Failed to update partitions: {state}")
-                break
-            
-            print(f"Partition update status: {state}")
-            time.sleep(2)
-            
+        execution_id = athena.start(query)
+        print(f"Started partition update: {execution_id}")
+        athena.wait(execution_id)
+        print("Successfully updated partitions")
+    except QueryFailed as e:
+        print(f"Failed to update partitions: {e.state}")
     except Exception as e:
         print(f"Error updating partitions: {str(e)}")
 
 def main():
-    print("Setting up Glue Catalog...")
+    # Must match OUTPUT_FORMAT and OUTPUT_COMPRESSION of the ingestion Lambda
+    table_format = os.environ.get('OUTPUT_FORMAT', 'json').lower()
+    compression = os.environ.get('OUTPUT_COMPRESSION', 'none').lower()
+    # Partition projection replaces MSCK REPAIR TABLE; set PARTITION_PROJECTION=false to register partitions
+    projection = os.environ.get('PARTITION_PROJECTION', 'true').lower() in ('1', 'true', 'yes')
+    year_range = os.environ.get('PROJECTION_YEAR_RANGE', '2024,2030')
+    print(f"Setting up Glue Catalog ({table_format})...")
     
     # Create database
     create_database()
@@ -121,11 +180,16 @@ def main():
     delete_table_if_exists()
     
     # Create table
-    create_table()
+    create_table(table_format, compression, projection, year_range)
     
-    # Update partitions
-    print("\nUpdating partitions...")
-    update_partitions()
+    # Update partitions; projected tables compute them at query time
+    if projection:
+        print("\nPartition projection enabled, skipping partition update")
+    else:
+        # One-off backfill of existing data; new hours are registered by the
+        # ingestion Lambda when it runs with REGISTER_PARTITIONS=true
+        print("\nRegistering existing partitions...")
+        update_partitions()
     
     print("\nGlue Catalog setup complete!")
 
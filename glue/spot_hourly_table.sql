@@ -0,0 +1,18 @@
+CREATE EXTERNAL TABLE IF NOT EXISTS parking_analytics.spot_hourly (
+    spot_id string,
+    hour_start timestamp,
+    day string,
+    hour string,
+    event_count bigint,
+    occupied_count bigint,
+    vacant_count bigint,
+    occupied_seconds double,
+    last_status string
+)
+PARTITIONED BY (
+    year string,
+    month string
+)
+STORED AS PARQUET
+LOCATION 's3://parking-monitoring-data/rollups/spot_hourly/'
+TBLPROPERTIES ('parquet.compression'='SNAPPY');
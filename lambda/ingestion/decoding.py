@@ -0,0 +1,115 @@
+import re
+import json
+import base64
+from datetime import datetime
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# Fixed layout of TIMESTAMP_FORMAT, checked on every record; ASCII digits only
+_TIMESTAMP_LAYOUT = re.compile(r'\d{4}-\d\d-\d\dT\d\d:[0-5]\d:[0-5]\dZ', re.ASCII)
+
+# Cache of "YYYY-MM-DDTHH" prefixes to partition paths. Events arrive in
+# near time order, so a batch typically touches one or two hours.
+_partition_cache = {}
+_PARTITION_CACHE_LIMIT = 4096
+
+REQUIRED_FIELDS = ('spot_id', 'status', 'timestamp')
+
+def iter_raw_records(event):
+    """
+    Yield (record, encoded) pairs from a Lambda event.
+
+    Supports both the MSK event source shape, where 'records' is a dict keyed
+    by "topic-partition" with base64-encoded values, and the flat list with
+    plain JSON values used by test_complete_flow.py.
+    """
+    records = event['records']
+    if isinstance(records, dict):
+        for partition_records in records.values():
+            for record in partition_records:
+                yield record, True
+    else:
+        for record in records:
+            yield record, False
+
+def count_records(event):
+    """Count records in either event shape without decoding them"""
+    records = event['records']
+    if isinstance(records, dict):
+        return sum(len(partition_records) for partition_records in records.values())
+    return len(records)
+
+def raw_value(record, encoded):
+    """Return a record's value as text, base64-decoding MSK values"""
+    value = base64.b64decode(record['value'], validate=True) if encoded else record['value']
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+def validate_message(message):
+    """Raise ValueError unless the message is a well-formed parking event"""
+    if not isinstance(message, dict):
+        raise ValueError("Event is not a JSON object")
+    missing = [field for field in REQUIRED_FIELDS if not isinstance(message.get(field), str)]
+    if missing:
+        raise ValueError(f"Missing or non-string fields: {', '.join(missing)}")
+    partition_path(message['timestamp'])
+
+def decode_records(event):
+    """
+    Decode and validate every record value in the event.
+    Returns (decoded, failures): decoded is [(record, message), ...] in
+    delivery order and failures is [(record, value, error), ...] for records
+    that could not be decoded or are not valid parking events.
+
+    Each value is parsed on its own, so a value that holds several JSON
+    documents fails alone instead of shifting other records' messages. No
+    malformed record raises: failing the batch would only make the event
+    source replay it forever. Records that are not objects are reported
+    with an empty record and themselves as the value.
+    """
+    decoded, failures = [], []
+    loads = json.loads
+    for record, encoded in iter_raw_records(event):
+        if not isinstance(record, dict):
+            failures.append(({}, record, "Record is not an object"))
+            continue
+        try:
+            value = raw_value(record, encoded)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            failures.append((record, record.get('value'), f"Undecodable value: {e}"))
+            continue
+        try:
+            message = loads(value)
+        except (TypeError, ValueError) as e:
+            failures.append((record, value, f"Invalid JSON: {e}"))
+            continue
+        try:
+            validate_message(message)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            failures.append((record, value, str(e)))
+            continue
+        decoded.append((record, message))
+    return decoded, failures
+
+def partition_path(timestamp):
+    """
+    Return the year/month/day/hour partition path for an event timestamp in
+    "YYYY-MM-DDTHH:MM:SSZ" form. Every timestamp's layout, minutes and seconds
+    are checked; the date and hour are validated with strptime the first time
+    the hour is seen, and only the resulting path is cached.
+    """
+    if _TIMESTAMP_LAYOUT.fullmatch(timestamp) is None:
+        raise ValueError(f"Invalid timestamp: {timestamp!r}")
+
+    hour_prefix = timestamp[:13]
+    path = _partition_cache.get(hour_prefix)
+    if path is None:
+        parsed = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+        path = f"year={parsed.year}/month={parsed.month:02d}/day={parsed.day:02d}/hour={parsed.hour:02d}"
+        if len(_partition_cache) >= _PARTITION_CACHE_LIMIT:
+            _partition_cache.clear()
+        _partition_cache[hour_prefix] = path
+    return path
+
+def parse_timestamp(timestamp):
+    """Parse an event timestamp into a naive UTC datetime"""
+    # fromisoformat is much cheaper than strptime for this fixed layout
+    return datetime.fromisoformat(timestamp[:-1])
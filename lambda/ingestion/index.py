@@ -1,20 +1,232 @@
+import io
 import os
+import gzip
 import json
-import boto3
+import time
 from datetime import datetime
 import logging
 
+from decoding import count_records, decode_records, parse_timestamp, partition_path
+from metrics import emit_invocation_metrics, log_record
+from settings import get_settings
+from snapshot import latest_by_spot, update_snapshot
+from partitions import register_partitions
+
 # Configure logging
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# Shared AWS clients. The S3 client is built at import time unless EAGER_INIT=false
+# (see the end of this module); the Glue client is only needed with REGISTER_PARTITIONS.
+_s3 = None
+_glue = None
+
+def create_client(service_name, endpoint_url=None, **config_options):
+    """
+    Create a client from a bare botocore session, imported here rather than at
+    module load; boto3 would also pull in s3transfer, which is never used.
+    """
+    import botocore.session
+    from botocore.config import Config
+
+    settings = get_settings()
+    config = Config(
+        retries={'mode': settings.s3_retry_mode, 'max_attempts': settings.s3_max_attempts},
+        **config_options
+    )
+    return botocore.session.get_session().create_client(service_name, endpoint_url=endpoint_url, config=config)
+
+def get_s3_client():
+    """Return the S3 client shared by all upload threads and warm invocations"""
+    global _s3
+    if _s3 is None:
+        settings = get_settings()
+        _s3 = create_client(
+            's3',
+            endpoint_url=settings.s3_endpoint_url,
+            max_pool_connections=settings.s3_max_pool_connections,
+            s3={'addressing_style': 'path'} if settings.s3_endpoint_url else None
+        )
+    return _s3
+
+def get_glue_client():
+    """Return the Glue client used to register new partitions"""
+    global _glue
+    if _glue is None:
+        _glue = create_client('glue')
+    return _glue
+
+def group_by_partition(decoded):
+    """
+    Group decoded (record, message) pairs by their hour partition.
+    Returns {partition_prefix: [(record, message), ...]} preserving the
+    order in which records were delivered.
+    """
+    sample_rate = get_settings().log_sample_rate
+    partitions = {}
+    for record, message in decoded:
+        log_record(record, message, sample_rate)
+        partitions.setdefault(partition_path(message['timestamp']), []).append((record, message))
+    return partitions
+
+def build_object_key(partition_prefix, batch, output=None):
+    """
+    Build a deterministic S3 key from the first and last record of a batch,
+    so a replayed batch overwrites the same object instead of duplicating it.
+    """
+    first, last = batch[0][0], batch[-1][0]
+    name = (
+        f"{first['topic']}-{first['partition']}-{first['offset']}_"
+        f"{last['topic']}-{last['partition']}-{last['offset']}"
+    )
+    settings = get_settings()
+    output = output or settings.output
+    return f"{output['prefix']}/{partition_prefix}/{name}.{output['extension']}{settings.compression['suffix']}"
+
+def serialize_json_batch(batch):
+    """Serialize a batch as newline-delimited JSON, one event per line"""
+    return "".join(json.dumps(message) + "\n" for _, message in batch).encode('utf-8')
+
+def serialize_parquet_batch(batch, compression='snappy'):
+    """
+    Serialize a batch as a Parquet file with typed columns: timestamp as a
+    real timestamp and status dictionary-encoded.
+    """
+    # pyarrow is only needed in parquet mode, so import it on demand
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    messages = [message for _, message in batch]
+    table = pa.table({
+        'spot_id': pa.array([m['spot_id'] for m in messages], type=pa.string()),
+        'status': pa.array([m['status'] for m in messages], type=pa.string()).dictionary_encode(),
+        'timestamp': pa.array(
+            [parse_timestamp(m['timestamp']) for m in messages],
+            type=pa.timestamp('ms')
+        )
+    })
+
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression=compression)
+    return buffer.getvalue()
+
+def compress_body(body, codec, level=None):
+    """Compress an object body with 'gzip' or 'zstd'; 'none' returns it unchanged"""
+    if codec == 'gzip':
+        # A fixed mtime keeps output byte-identical when a batch is replayed
+        return gzip.compress(body, compresslevel=level or 6, mtime=0)
+    if codec == 'zstd':
+        # zstandard is only needed for zstd output, so import it on demand
+        import zstandard
+        return zstandard.ZstdCompressor(level=level or 3).compress(body)
+    return body
+
+def serialize_batch(batch):
+    """Serialize a batch in the configured output format and compression"""
+    settings = get_settings()
+    if settings.output_format == 'parquet':
+        return serialize_parquet_batch(batch, settings.parquet_compression)
+    return compress_body(serialize_json_batch(batch), settings.output_compression, settings.compression_level)
+
+def upload_batch(partition_prefix, batch):
+    """Serialize and store one partition batch, returning its key and size"""
+    settings = get_settings()
+    s3_key = build_object_key(partition_prefix, batch)
+    body = serialize_batch(batch)
 
-# Initialize S3 client
-s3 = boto3.client('s3')
-S3_BUCKET = os.environ['S3_BUCKET']
+    get_s3_client().put_object(
+        Bucket=settings.s3_bucket,
+        Key=s3_key,
+        Body=body,
+        ContentType=settings.compression['content_type'] or settings.output['content_type']
+    )
+
+    logger.debug(f"Stored {len(batch)} events in S3: s3://{settings.s3_bucket}/{s3_key}")
+    return s3_key, len(body)
+
+def upload_partitions(partitions):
+    """
+    Upload every partition batch concurrently through a bounded thread pool.
+    Returns ([(s3_key, bytes_written), ...], elapsed_ms); the first failed
+    upload is re-raised after the pool has drained.
+    """
+    start = time.perf_counter()
+    concurrency = get_settings().upload_concurrency
+
+    if len(partitions) <= 1 or concurrency <= 1:
+        results = [upload_batch(path, batch) for path, batch in partitions.items()]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        # Make sure the client exists before threads race to create it
+        get_s3_client()
+        workers = min(concurrency, len(partitions))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(upload_batch, path, batch) for path, batch in partitions.items()]
+            results = [future.result() for future in futures]
+
+    return results, (time.perf_counter() - start) * 1000
+
+def build_dead_letter_key(failures):
+    """
+    Build a deterministic dead-letter key from the first and last failed record.
+    It depends on nothing but the records, so a batch replayed on another day
+    overwrites its earlier dead-letter object instead of adding a second one.
+    """
+    # Records that were not objects carry no topic, partition or offset
+    records = [record for record, _, _ in failures if record] or [{}]
+    first, last = records[0], records[-1]
+    name = (
+        f"{first.get('topic')}-{first.get('partition')}-{first.get('offset')}_"
+        f"{last.get('topic')}-{last.get('partition')}-{last.get('offset')}"
+    )
+    return f"{get_settings().dead_letter_prefix}/{name}.json"
+
+def write_dead_letters(failures):
+    """Store failed records with their offset and error as newline-delimited JSON"""
+    bucket = get_settings().s3_bucket
+    s3_key = build_dead_letter_key(failures)
+    body = "".join(
+        json.dumps({
+            'topic': record.get('topic'),
+            'partition': record.get('partition'),
+            'offset': record.get('offset'),
+            'error': error,
+            'value': value if isinstance(value, str) else repr(value)
+        }) + "\n"
+        for record, value, error in failures
+    )
+
+    get_s3_client().put_object(
+        Bucket=bucket,
+        Key=s3_key,
+        Body=body.encode('utf-8'),
+        ContentType='application/x-ndjson'
+    )
+
+    logger.warning(
+        f"Sent {len(failures)} invalid records to s3://{bucket}/{s3_key} "
+        f"(first error: {failures[0][2]})"
+    )
+    return s3_key
 
 def handler(event, context):
     """
     Process parking events from MSK and store them in S3.
+    Accepts the native MSK event shape (records keyed by topic-partition with
+    base64-encoded values) as well as a flat list of plain-JSON records.
+    Records are grouped by hour partition and written as one object per
+    partition per invocation, as newline-delimited JSON or Parquet
+    depending on OUTPUT_FORMAT.
+    Records that fail to decode or validate are written to DEAD_LETTER_PREFIX
+    and reported in the response instead of failing the whole batch, so the
+    event source does not replay records that were already stored.
+    With SNAPSHOT_KEY, the latest status of every spot in the batch is merged
+    into a single snapshot object so dashboards can read it with one GET; a
+    failed snapshot update is logged and counted, not retried by replaying
+    the batch.
+    With REGISTER_PARTITIONS, hour partitions seen for the first time are
+    added to the Glue table so they are queryable without MSCK REPAIR TABLE.
     Event format:
     {
         "spot_id": "A1",
@@ -23,38 +235,87 @@ def handler(event, context):
     }
     """
     try:
-        logger.info(f"Processing {len(event['records'])} records")
-        
-        for record in event['records']:
-            # Decode and parse the message
-            message = json.loads(record['value'])
-            logger.info(f"Processing message: {message}")
-            
-            # Extract timestamp for partitioning
-            timestamp = datetime.strptime(message['timestamp'], "%Y-%m-%dT%H:%M:%SZ")
-            partition_path = f"year={timestamp.year}/month={timestamp.month:02d}/day={timestamp.day:02d}/hour={timestamp.hour:02d}"
-            
-            # Generate S3 key
-            s3_key = f"parking-data/{partition_path}/{record['topic']}-{record['partition']}-{record['offset']}.json"
-            
-            # Store the event in S3
-            s3.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_key,
-                Body=json.dumps(message),
-                ContentType='application/json'
+        record_count = count_records(event)
+        logger.info(f"Processing {record_count} records")
+
+        decode_start = time.perf_counter()
+        decoded, failures = decode_records(event)
+        partitions = group_by_partition(decoded)
+        decode_ms = (time.perf_counter() - decode_start) * 1000
+
+        uploads, upload_ms = upload_partitions(partitions)
+        dead_letter_key = write_dead_letters(failures) if failures else None
+
+        settings = get_settings()
+        partitions_created = 0
+        if settings.register_partitions and partitions:
+            partitions_created = register_partitions(
+                get_glue_client(),
+                settings.glue_database,
+                settings.glue_table,
+                f"s3://{settings.s3_bucket}/{settings.output['prefix']}",
+                partitions.keys()
             )
-            
-            logger.info(f"Stored event in S3: s3://{S3_BUCKET}/{s3_key}")
-        
+
+        # Only advance the snapshot once the events themselves are stored. The events are
+        # already durable, so a failure here must not make the event source replay the batch.
+        snapshot_updated = False
+        snapshot_failures = 0
+        if settings.snapshot_key and decoded:
+            try:
+                snapshot_updated = update_snapshot(
+                    get_s3_client(), settings.s3_bucket, settings.snapshot_key, latest_by_spot(decoded)
+                )
+            except Exception as e:
+                snapshot_failures = 1
+                logger.warning(f"Snapshot s3://{settings.s3_bucket}/{settings.snapshot_key} not updated: {e}")
+        bytes_written = sum(size for _, size in uploads)
+        logger.info(f"Uploaded {len(uploads)} objects in {upload_ms:.1f} ms")
+
+        metrics = {
+            'RecordsProcessed': len(decoded),
+            'RecordsFailed': len(failures),
+            'ObjectsWritten': len(uploads),
+            'BytesWritten': bytes_written,
+            'DecodeTime': round(decode_ms, 3),
+            'UploadTime': round(upload_ms, 3)
+        }
+        if settings.snapshot_key:
+            metrics['SnapshotFailures'] = snapshot_failures
+        if decoded:
+            # Lag of the oldest event in the batch; fixed-format timestamps sort as strings
+            oldest = parse_timestamp(min(message['timestamp'] for _, message in decoded))
+            metrics['EndToEndLag'] = round((datetime.utcnow() - oldest).total_seconds() * 1000)
+        emit_invocation_metrics(
+            getattr(context, 'function_name', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'parking-processor'),
+            metrics,
+            get_settings().metrics_namespace
+        )
+
         return {
             'statusCode': 200,
             'body': json.dumps({
-                'message': f'Successfully processed {len(event["records"])} records',
+                'message': f'Successfully processed {len(decoded)} of {record_count} records',
+                'records_processed': len(decoded),
+                'records_failed': len(failures),
+                'dead_letter_key': dead_letter_key,
+                'objects_written': len(uploads),
+                'bytes_written': bytes_written,
+                'upload_ms': round(upload_ms, 1),
+                'snapshot_updated': snapshot_updated,
+                'partitions_created': partitions_created,
                 'timestamp': datetime.utcnow().isoformat()
             })
         }
-        
+
     except Exception as e:
         logger.error(f"Error processing records: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
+
+# Build the S3 client during the init phase, which runs with a burst of CPU and, with
+# provisioned concurrency, ahead of traffic. Deferring it to the first invocation does not
+# shorten the cold start (see benchmark/cold_start_benchmark.py), it only moves the cost
+# into billed invocation time; EAGER_INIT=false defers it, e.g. for tests that import the
+# module without configuration.
+if os.environ.get('EAGER_INIT', 'true').lower() in ('1', 'true', 'yes'):
+    get_s3_client()
@@ -0,0 +1,69 @@
+import json
+import time
+import random
+import logging
+
+# Default CloudWatch namespace for the per-invocation Embedded Metric Format record
+METRICS_NAMESPACE = 'ParkingMonitoring/Ingestion'
+
+# Metric name -> CloudWatch unit, in the order they appear in the record
+INVOCATION_METRICS = {
+    'RecordsProcessed': 'Count',
+    'RecordsFailed': 'Count',
+    'ObjectsWritten': 'Count',
+    'BytesWritten': 'Bytes',
+    'DecodeTime': 'Milliseconds',
+    'UploadTime': 'Milliseconds',
+    'EndToEndLag': 'Milliseconds',
+    'SnapshotFailures': 'Count'
+}
+
+logger = logging.getLogger(__name__)
+
+def should_sample(sample_rate):
+    """Decide whether this record gets a per-record log line (0 disables, 1 logs all)"""
+    return sample_rate >= 1 or (sample_rate > 0 and random.random() < sample_rate)
+
+def log_record(record, message, sample_rate):
+    """Write a structured, sampled log line for a single record"""
+    if not should_sample(sample_rate):
+        return
+    logger.info(json.dumps({
+        'event': 'record',
+        'topic': record.get('topic'),
+        'partition': record.get('partition'),
+        'offset': record.get('offset'),
+        'spot_id': message.get('spot_id'),
+        'status': message.get('status'),
+        'timestamp': message.get('timestamp')
+    }))
+
+def build_emf_record(function_name, values, namespace=METRICS_NAMESPACE, now_ms=None):
+    """
+    Build a CloudWatch Embedded Metric Format record for one invocation.
+    `values` maps names from INVOCATION_METRICS to numbers; missing metrics
+    are omitted.
+    """
+    metrics = [
+        {'Name': name, 'Unit': unit}
+        for name, unit in INVOCATION_METRICS.items()
+        if name in values
+    ]
+    record = {
+        '_aws': {
+            'Timestamp': int(now_ms if now_ms is not None else time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [['FunctionName']],
+                'Metrics': metrics
+            }]
+        },
+        'FunctionName': function_name
+    }
+    for metric in metrics:
+        record[metric['Name']] = values[metric['Name']]
+    return record
+
+def emit_invocation_metrics(function_name, values, namespace=METRICS_NAMESPACE):
+    """Print the EMF record to stdout, where CloudWatch extracts the metrics"""
+    print(json.dumps(build_emf_record(function_name, values, namespace)), flush=True)
@@ -0,0 +1,64 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Glue accepts at most 100 partitions per BatchCreatePartition call
+BATCH_CREATE_LIMIT = 100
+
+# Partition paths this process has already registered or seen as existing
+_known_partitions = set()
+# Storage descriptor of the target table, fetched once per process
+_table_descriptors = {}
+
+def partition_values(partition_path):
+    """Turn "year=2024/month=03/day=20/hour=10" into ['2024', '03', '20', '10']"""
+    return [part.split('=', 1)[1] for part in partition_path.split('/')]
+
+def table_storage_descriptor(glue, database, table):
+    """Return the table's storage descriptor, cached so GetTable runs once per process"""
+    key = (database, table)
+    if key not in _table_descriptors:
+        _table_descriptors[key] = glue.get_table(DatabaseName=database, Name=table)['Table']['StorageDescriptor']
+    return _table_descriptors[key]
+
+def register_partitions(glue, database, table, location_prefix, partition_paths):
+    """
+    Register partitions the process has not seen before with BatchCreatePartition.
+    Partitions that already exist count as registered. location_prefix is the
+    s3:// URI the partition paths are relative to.
+    Returns the number of partitions newly created.
+    """
+    new_paths = sorted(set(partition_paths) - _known_partitions)
+    if not new_paths:
+        return 0
+
+    descriptor = table_storage_descriptor(glue, database, table)
+    created = 0
+    for start in range(0, len(new_paths), BATCH_CREATE_LIMIT):
+        chunk = new_paths[start:start + BATCH_CREATE_LIMIT]
+        response = glue.batch_create_partition(
+            DatabaseName=database,
+            TableName=table,
+            PartitionInputList=[
+                {
+                    'Values': partition_values(path),
+                    'StorageDescriptor': dict(descriptor, Location=f"{location_prefix}/{path}")
+                }
+                for path in chunk
+            ]
+        )
+
+        failed = [
+            (error['PartitionValues'], error['ErrorDetail']['ErrorCode'])
+            for error in response.get('Errors', [])
+            if error['ErrorDetail']['ErrorCode'] != 'AlreadyExistsException'
+        ]
+        if failed:
+            raise RuntimeError(f"Failed to register partitions: {failed}")
+
+        created += len(chunk) - len(response.get('Errors', []))
+        _known_partitions.update(chunk)
+
+    if created:
+        logger.info(f"Registered {created} new partitions in {database}.{table}")
+    return created
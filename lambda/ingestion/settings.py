@@ -0,0 +1,116 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+# Each output format lives under its own prefix so a table never mixes file types
+OUTPUT_FORMATS = {
+    'json': {
+        'prefix': 'parking-data',
+        'extension': 'json',
+        'content_type': 'application/x-ndjson'
+    },
+    'parquet': {
+        'prefix': 'parking-data-parquet',
+        'extension': 'parquet',
+        'content_type': 'application/vnd.apache.parquet'
+    }
+}
+
+# Compression codecs for JSON output, using the extensions Athena recognises
+COMPRESSION_CODECS = {
+    'none': {'suffix': '', 'content_type': None, 'default_level': None},
+    'gzip': {'suffix': '.gz', 'content_type': 'application/gzip', 'default_level': 6},
+    'zstd': {'suffix': '.zst', 'content_type': 'application/zstd', 'default_level': 3}
+}
+
+@dataclass(frozen=True)
+class Settings:
+    """Configuration of the ingestion function, read from the environment once"""
+    s3_bucket: str
+    # Output format: 'json' (newline-delimited JSON) or 'parquet'
+    output_format: str = 'json'
+    parquet_compression: str = 'snappy'
+    # Whole-object compression of JSON output; Parquet compresses internally
+    output_compression: str = 'none'
+    compression_level: Optional[int] = None
+    # Records that cannot be decoded or validated are written here, outside the table location
+    dead_letter_prefix: str = 'parking-data-errors'
+    # Latest status per spot, maintained at ingest time; empty (the default) disables it.
+    # Every invocation read-modify-writes this one object, so it is opt-in.
+    snapshot_key: str = ''
+    # Register new hour partitions in Glue, for tables without partition projection
+    register_partitions: bool = False
+    glue_database: str = 'parking_analytics'
+    glue_table: str = 'parking_events'
+    # Connection pool and retry settings for the shared S3 client
+    s3_max_pool_connections: int = 16
+    s3_retry_mode: str = 'standard'
+    s3_max_attempts: int = 5
+    s3_endpoint_url: Optional[str] = None
+    # Number of partition objects uploaded in parallel, bounded by the pool size
+    upload_concurrency: int = 8
+    log_sample_rate: float = 0.01
+    metrics_namespace: str = 'ParkingMonitoring/Ingestion'
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """Build settings from environment variables, failing on missing or invalid values"""
+        bucket = environ.get('S3_BUCKET')
+        if not bucket:
+            raise RuntimeError("S3_BUCKET environment variable is not set")
+
+        output_format = environ.get('OUTPUT_FORMAT', 'json').lower()
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported OUTPUT_FORMAT: {output_format}")
+
+        compression = environ.get('OUTPUT_COMPRESSION', 'none').lower()
+        if compression not in COMPRESSION_CODECS:
+            raise ValueError(f"Unsupported OUTPUT_COMPRESSION: {compression}")
+        if output_format == 'parquet':
+            compression = 'none'
+        level = environ.get('COMPRESSION_LEVEL')
+
+        pool_size = int(environ.get('S3_MAX_POOL_CONNECTIONS', '16'))
+        return cls(
+            s3_bucket=bucket,
+            output_format=output_format,
+            parquet_compression=environ.get('PARQUET_COMPRESSION', 'snappy').lower(),
+            output_compression=compression,
+            compression_level=int(level) if level else COMPRESSION_CODECS[compression]['default_level'],
+            dead_letter_prefix=environ.get('DEAD_LETTER_PREFIX', 'parking-data-errors'),
+            snapshot_key=environ.get('SNAPSHOT_KEY', ''),
+            register_partitions=environ.get('REGISTER_PARTITIONS', 'false').lower() in ('1', 'true', 'yes'),
+            glue_database=environ.get('GLUE_DATABASE', 'parking_analytics'),
+            glue_table=environ.get('GLUE_TABLE', 'parking_events'),
+            s3_max_pool_connections=pool_size,
+            s3_retry_mode=environ.get('S3_RETRY_MODE', 'standard'),
+            s3_max_attempts=int(environ.get('S3_MAX_ATTEMPTS', '5')),
+            s3_endpoint_url=environ.get('S3_ENDPOINT_URL') or None,
+            upload_concurrency=min(int(environ.get('UPLOAD_CONCURRENCY', '8')), pool_size),
+            log_sample_rate=float(environ.get('LOG_SAMPLE_RATE', '0.01')),
+            metrics_namespace=environ.get('METRICS_NAMESPACE', 'ParkingMonitoring/Ingestion')
+        )
+
+    @property
+    def output(self):
+        """Prefix, extension and content type of the configured output format"""
+        return OUTPUT_FORMATS[self.output_format]
+
+    @property
+    def compression(self):
+        """Key suffix and content type of the configured compression codec"""
+        return COMPRESSION_CODECS[self.output_compression]
+
+_settings = None
+
+def get_settings():
+    """Return the process-wide settings, reading the environment on first use"""
+    global _settings
+    if _settings is None:
+        _settings = Settings.from_env()
+    return _settings
+
+def reset_settings():
+    """Forget cached settings so the next call re-reads the environment"""
+    global _settings
+    _settings = None
@@ -0,0 +1,97 @@
+import json
+import time
+import random
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# S3 error codes returned when a conditional write loses a race
+CONFLICT_CODES = ('PreconditionFailed', 'ConditionalRequestConflict')
+# Full-jitter backoff between attempts after a lost race, in seconds
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 1.0
+
+def latest_by_spot(decoded):
+    """
+    Reduce a batch to the newest event per spot.
+    Returns {spot_id: {'status': ..., 'timestamp': ...}}; on equal timestamps
+    the record delivered last wins. Fixed-format timestamps compare as strings.
+    """
+    latest = {}
+    for _, message in decoded:
+        current = latest.get(message['spot_id'])
+        if current is None or message['timestamp'] >= current['timestamp']:
+            latest[message['spot_id']] = {
+                'status': message['status'],
+                'timestamp': message['timestamp']
+            }
+    return latest
+
+def merge_snapshot(spots, updates):
+    """
+    Apply updates to a snapshot's spots with last-writer-wins on timestamp.
+    Returns (merged, changed); events no newer than the stored state are ignored,
+    so replaying a batch leaves the snapshot unchanged.
+    """
+    merged = dict(spots)
+    changed = False
+    for spot_id, update in updates.items():
+        current = merged.get(spot_id)
+        if current is None or update['timestamp'] > current['timestamp']:
+            merged[spot_id] = update
+            changed = True
+    return merged, changed
+
+def read_snapshot(client, bucket, key):
+    """Return (spots, etag) for the stored snapshot, or ({}, None) if there is none yet"""
+    from botocore.exceptions import ClientError
+
+    try:
+        response = client.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return {}, None
+        raise
+    return json.loads(response['Body'].read())['spots'], response['ETag']
+
+def update_snapshot(client, bucket, key, updates, max_attempts=5, sleep=time.sleep):
+    """
+    Merge per-spot updates into the snapshot object with an optimistic
+    read-modify-write. The write is conditional on the ETag that was read
+    (or on the object not existing yet), so concurrent invocations never
+    overwrite each other's updates; a lost race waits a jittered backoff,
+    re-reads and retries. Returns True if the snapshot was rewritten and
+    raises RuntimeError when every attempt lost a race.
+    """
+    from botocore.exceptions import ClientError
+
+    for attempt in range(1, max_attempts + 1):
+        spots, etag = read_snapshot(client, bucket, key)
+        merged, changed = merge_snapshot(spots, updates)
+        if not changed:
+            return False
+
+        body = json.dumps({
+            'updated_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'spots': merged
+        }, separators=(',', ':'))
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        try:
+            client.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=body.encode('utf-8'),
+                ContentType='application/json',
+                **condition
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] not in CONFLICT_CODES:
+                raise
+            logger.info(f"Snapshot write conflict on attempt {attempt}")
+            if attempt < max_attempts:
+                # Spread out invocations that collided, so they do not collide again
+                sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+
+    raise RuntimeError(f"Could not update snapshot s3://{bucket}/{key} after {max_attempts} attempts")
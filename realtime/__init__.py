@@ -0,0 +1 @@
+"""Real-time occupancy aggregation over the parking event stream."""
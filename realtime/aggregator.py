@@ -0,0 +1,260 @@
+"""
+Streaming sliding-window occupancy over parking events.
+
+OccupancyAggregator consumes the {spot_id, status, timestamp} events the
+sensors publish and keeps two views of the lot:
+
+- the live view: every spot's latest status (last writer wins on event time)
+  and lot-wide occupied/known counters, updated as each event arrives;
+- sliding windows (by default 1 minute, 5 minutes and 1 hour) of
+  time-weighted occupancy and arrivals in event time. Events wait in
+  per-second buckets until the watermark passes them, and are then applied
+  in time order, so out-of-order delivery within the allowed lateness does
+  not skew the windows. The watermark is the last second before the newest
+  event time seen minus the allowed lateness; events at or before it only
+  update the live view and are counted as late.
+
+Every update is O(1): an event is a few dict operations, and each second of
+event time the watermark passes adds one bucket to ring buffers whose
+running sums are adjusted by the bucket entering and the bucket leaving
+each window.
+
+For very large lots pass an analytics.spots.SpotRegistry: the live view
+then lives in its arrays instead of a dict keyed by spot id, and the
+windows track spots by their registry codes in a bytearray.
+"""
+import time
+from collections import defaultdict
+
+from analytics.timestamps import epoch_seconds, format_epoch
+
+# Window name -> length in seconds
+DEFAULT_WINDOWS = {'1m': 60, '5m': 300, '1h': 3600}
+DEFAULT_ALLOWED_LATENESS = 30
+
+class OccupancyAggregator:
+    def __init__(self, windows=None, allowed_lateness=DEFAULT_ALLOWED_LATENESS, registry=None):
+        self.windows = dict(windows or DEFAULT_WINDOWS)
+        self.allowed_lateness = allowed_lateness
+        self.late_events = 0
+
+        # Live view: spot_id -> (occupied, epoch seconds), or the registry's arrays
+        self.registry = registry
+        self.spots = {} if registry is None else None
+        self.occupied = 0 if registry is None else registry.occupied_count()
+
+        # Event-time view, applied once the watermark passes: spot key -> 0 unknown, 1 vacant, 2 occupied
+        self._pending = {}
+        self._applied = defaultdict(int) if registry is None else bytearray()
+        self._applied_known = 0
+        self._applied_occupied = 0
+        self._max_time = None
+        # Last second folded into the windows, and the second before the first one
+        self._finalized = None
+        self._origin = None
+
+        # Per-second ring buffers of occupied spots, known spots and arrivals
+        self._size = max(self.windows.values())
+        self._occupied_ring = [0] * self._size
+        self._known_ring = [0] * self._size
+        self._arrival_ring = [0] * self._size
+        self._sums = {name: [0, 0, 0] for name in self.windows}
+
+    @property
+    def watermark(self):
+        """Event time up to which the windows are final, or None before the first event"""
+        return self._finalized
+
+    @property
+    def spot_count(self):
+        """Spots with a known status"""
+        return len(self.spots) if self.registry is None else self.registry.known_count()
+
+    def status(self, spot_id):
+        """(occupied, epoch seconds) of a spot's latest event, or None if it was never seen"""
+        return self.spots.get(spot_id) if self.registry is None else self.registry.status(spot_id)
+
+    def add(self, spot_id, status, timestamp):
+        """Fold one event in; timestamp is epoch seconds or a "%Y-%m-%dT%H:%M:%SZ" string"""
+        if type(timestamp) is str:
+            timestamp = epoch_seconds(timestamp)
+        occupied = status == 'occupied'
+
+        if self.registry is None:
+            current = self.spots.get(spot_id)
+            if current is None:
+                self.spots[spot_id] = (occupied, timestamp)
+                self.occupied += occupied
+            elif timestamp >= current[1]:
+                self.spots[spot_id] = (occupied, timestamp)
+                self.occupied += occupied - current[0]
+        else:
+            # The windows key spots by code
+            spot_id = self.registry.code(spot_id)
+            previous = self.registry.set(spot_id, occupied, timestamp)
+            if previous is not None:
+                self.occupied += occupied - (previous == 1)
+
+        if self._finalized is None:
+            self._finalized = self._origin = timestamp - self.allowed_lateness - 1
+        elif timestamp <= self._finalized:
+            self.late_events += 1
+            return
+        bucket = self._pending.get(timestamp)
+        if bucket is None:
+            self._pending[timestamp] = [(spot_id, occupied)]
+        else:
+            bucket.append((spot_id, occupied))
+        if self._max_time is None or timestamp > self._max_time:
+            self._max_time = timestamp
+            if timestamp - self.allowed_lateness - 1 > self._finalized:
+                self._advance_to(timestamp - self.allowed_lateness - 1)
+
+    def add_event(self, event):
+        self.add(event['spot_id'], event['status'], event['timestamp'])
+
+    def add_many(self, events):
+        """
+        Fold in an iterable of (spot_id, status, timestamp) tuples; the same as
+        calling add() for each, with the per-event work inlined
+        """
+        spots = self.spots
+        registry = self.registry
+        if registry is not None:
+            code_of, set_state = registry.code, registry.set
+        pending = self._pending
+        lateness = self.allowed_lateness
+        occupied_count, late = self.occupied, 0
+        finalized, max_time = self._finalized, self._max_time
+        # Events of the same second share the timestamp string, so parse each once
+        parsed = {}
+        try:
+            for spot_id, status, timestamp in events:
+                if type(timestamp) is str:
+                    seconds = parsed.get(timestamp)
+                    if seconds is None:
+                        seconds = parsed[timestamp] = epoch_seconds(timestamp)
+                    timestamp = seconds
+                occupied = status == 'occupied'
+
+                if registry is None:
+                    current = spots.get(spot_id)
+                    if current is None:
+                        spots[spot_id] = (occupied, timestamp)
+                        occupied_count += occupied
+                    elif timestamp >= current[1]:
+                        spots[spot_id] = (occupied, timestamp)
+                        occupied_count += occupied - current[0]
+                else:
+                    spot_id = code_of(spot_id)
+                    previous = set_state(spot_id, occupied, timestamp)
+                    if previous is not None:
+                        occupied_count += occupied - (previous == 1)
+
+                if finalized is None:
+                    finalized = self._finalized = self._origin = timestamp - lateness - 1
+                elif timestamp <= finalized:
+                    late += 1
+                    continue
+                bucket = pending.get(timestamp)
+                if bucket is None:
+                    pending[timestamp] = [(spot_id, occupied)]
+                else:
+                    bucket.append((spot_id, occupied))
+                if max_time is None or timestamp > max_time:
+                    max_time = self._max_time = timestamp
+                    if timestamp - lateness - 1 > finalized:
+                        self._advance_to(timestamp - lateness - 1)
+                        finalized = self._finalized
+        finally:
+            self.occupied = occupied_count
+            self.late_events += late
+
+    def advance(self, now=None):
+        """
+        Move the watermark with processing time while the stream is idle, so
+        the windows keep sliding without new events
+        """
+        if self._finalized is None:
+            return
+        target = int(now if now is not None else time.time()) - self.allowed_lateness - 1
+        if target > self._finalized:
+            self._advance_to(target)
+
+    def flush(self):
+        """Fold every pending event into the windows, e.g. at the end of a replay"""
+        if self._max_time is not None and self._max_time > self._finalized:
+            self._advance_to(self._max_time)
+
+    def _advance_to(self, target):
+        size = self._size
+        pending = self._pending
+        applied = self._applied
+        if self.registry is not None and len(applied) < self.registry.size:
+            applied.extend(bytes(self.registry.size - len(applied)))
+        occupied_ring, known_ring, arrival_ring = self._occupied_ring, self._known_ring, self._arrival_ring
+        windows = [(length, self._sums[name]) for name, length in self.windows.items()]
+
+        second = self._finalized
+        while second < target:
+            # No events due for more than a whole ring: the state is constant, so fill instead of stepping
+            if target - second > size:
+                next_event = min(pending) if pending else target + 1
+                if next_event - second > size + 1:
+                    second = min(next_event - 1, target)
+                    known = self._applied_known
+                    occupied_ring[:] = [self._applied_occupied] * size
+                    known_ring[:] = [known] * size
+                    arrival_ring[:] = [0] * size
+                    for length, sums in windows:
+                        sums[0], sums[1], sums[2] = self._applied_occupied * length, known * length, 0
+                    continue
+
+            second += 1
+            arrivals = 0
+            events = pending.pop(second, None)
+            if events:
+                for key, occupied in events:
+                    previous = applied[key]
+                    applied[key] = occupied + 1
+                    if not previous:
+                        self._applied_known += 1
+                        self._applied_occupied += occupied
+                    elif previous != occupied + 1:
+                        self._applied_occupied += 1 if occupied else -1
+                        arrivals += occupied
+
+            slot = second % size
+            occupied, known = self._applied_occupied, self._applied_known
+            for length, sums in windows:
+                leaving = (second - length) % size
+                sums[0] += occupied - occupied_ring[leaving]
+                sums[1] += known - known_ring[leaving]
+                sums[2] += arrivals - arrival_ring[leaving]
+            occupied_ring[slot] = occupied
+            known_ring[slot] = known
+            arrival_ring[slot] = arrivals
+        self._finalized = second
+
+    def window(self, name):
+        """Time-weighted occupancy and arrivals over the named window ending at the watermark"""
+        occupied_seconds, known_seconds, arrivals = self._sums[name]
+        # Until the stream is as old as the window, average over the time seen so far
+        covered = min(self.windows[name], self._finalized - self._origin) if self._finalized is not None else 0
+        return {
+            'occupancy_pct': round(occupied_seconds * 100.0 / known_seconds, 2) if known_seconds else None,
+            'avg_occupied_spots': round(occupied_seconds / covered, 2) if covered else None,
+            'arrivals': arrivals
+        }
+
+    def snapshot(self):
+        """Live counters and every window, as a JSON-serializable dict"""
+        spots = self.spot_count
+        return {
+            'spots': spots,
+            'occupied': self.occupied,
+            'available': spots - self.occupied,
+            'watermark': format_epoch(self._finalized) if self._finalized is not None else None,
+            'late_events': self.late_events,
+            'windows': {name: self.window(name) for name in self.windows}
+        }
@@ -0,0 +1,150 @@
+"""
+Run the occupancy aggregator over the live Kafka topic or a replayed file.
+
+Both sources feed the same OccupancyAggregator and print its snapshot as one
+JSON line every --report-seconds. Kafka uses the simulator's topic and MSK
+bootstrap servers; a replay reads newline-delimited JSON events, e.g. the
+ingestion Lambda's output objects (plain, .gz or .zst), in file order.
+
+Usage:
+    python -m realtime.consumer kafka --bootstrap-servers b-1...:9094 --topic parking-events
+    python -m realtime.consumer replay data/parking-data/year=2024/month=03/day=20/*/*.json.gz
+"""
+import os
+import sys
+import json
+import time
+import gzip
+import logging
+import argparse
+
+from realtime.aggregator import DEFAULT_ALLOWED_LATENESS, OccupancyAggregator
+
+logger = logging.getLogger(__name__)
+
+def open_events(path):
+    """Binary line iterator over an NDJSON file, decompressing .gz and .zst"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        import io
+        import zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'rb')
+
+def replay(aggregator, paths, report=None, report_seconds=None):
+    """
+    Feed every event of the files to the aggregator in file order. With
+    report_seconds, report(snapshot) is called each time the watermark
+    moves that far in event time. Returns (events, malformed) counts.
+    """
+    add = aggregator.add
+    loads = json.loads
+    events = malformed = 0
+    next_report = None
+    for path in paths:
+        with open_events(path) as lines:
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    event = loads(line)
+                    add(event['spot_id'], event['status'], event['timestamp'])
+                except (ValueError, KeyError, TypeError):
+                    malformed += 1
+                    continue
+                events += 1
+                if report_seconds and aggregator.watermark is not None:
+                    if next_report is None:
+                        next_report = aggregator.watermark + report_seconds
+                    elif aggregator.watermark >= next_report:
+                        report(aggregator.snapshot())
+                        next_report = aggregator.watermark + report_seconds
+    return events, malformed
+
+def create_consumer(bootstrap_servers, topic, group_id=None, security_protocol='SSL'):
+    """KafkaConsumer on the parking topic, starting from new events"""
+    from kafka import KafkaConsumer
+
+    return KafkaConsumer(
+        topic,
+        bootstrap_servers=bootstrap_servers.split(','),
+        security_protocol=security_protocol,
+        group_id=group_id,
+        auto_offset_reset='latest',
+        enable_auto_commit=group_id is not None
+    )
+
+def consume_kafka(aggregator, bootstrap_servers, topic, group_id=None, security_protocol='SSL',
+                  report=None, report_seconds=5, poll_timeout_ms=1000, max_runtime=None):
+    """
+    Consume the topic until interrupted (or for max_runtime seconds). Between
+    polls the watermark follows the wall clock, so the windows keep sliding
+    while no events arrive.
+    """
+    consumer = create_consumer(bootstrap_servers, topic, group_id, security_protocol)
+    started = next_report = time.monotonic()
+    malformed = 0
+    try:
+        while max_runtime is None or time.monotonic() - started < max_runtime:
+            batches = consumer.poll(timeout_ms=poll_timeout_ms)
+            for records in batches.values():
+                for record in records:
+                    try:
+                        event = json.loads(record.value)
+                        aggregator.add(event['spot_id'], event['status'], event['timestamp'])
+                    except (ValueError, KeyError, TypeError) as e:
+                        malformed += 1
+                        logger.warning(f"Skipping malformed record at offset {record.offset}: {e}")
+            if not batches:
+                aggregator.advance()
+            if report and time.monotonic() >= next_report:
+                report(dict(aggregator.snapshot(), malformed=malformed))
+                next_report = time.monotonic() + report_seconds
+    except KeyboardInterrupt:
+        logger.info("Consumer stopped by user")
+    finally:
+        consumer.close()
+
+def print_snapshot(snapshot):
+    print(json.dumps(snapshot), flush=True)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--allowed-lateness', type=int, default=DEFAULT_ALLOWED_LATENESS,
+                        help='seconds an event may lag the newest event before it no longer counts in the windows')
+    parser.add_argument('--report-seconds', type=int, default=5,
+                        help='seconds between snapshots (wall clock for Kafka, event time for a replay)')
+    parser.add_argument('--compact', action='store_true',
+                        help='keep spot state in a SpotRegistry of NumPy arrays, for very large lots')
+    sources = parser.add_subparsers(dest='source', required=True)
+    kafka = sources.add_parser('kafka')
+    kafka.add_argument('--bootstrap-servers', default=os.environ.get('MSK_BOOTSTRAP_SERVERS'))
+    kafka.add_argument('--topic', default=os.environ.get('KAFKA_TOPIC', 'parking-events'))
+    kafka.add_argument('--group-id', help='commit offsets under this consumer group')
+    kafka.add_argument('--security-protocol', default='SSL')
+    replayed = sources.add_parser('replay')
+    replayed.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    registry = None
+    if args.compact:
+        from analytics.spots import SpotRegistry
+        registry = SpotRegistry()
+    aggregator = OccupancyAggregator(allowed_lateness=args.allowed_lateness, registry=registry)
+    if args.source == 'kafka':
+        if not args.bootstrap_servers:
+            parser.error('--bootstrap-servers or MSK_BOOTSTRAP_SERVERS is required')
+        consume_kafka(aggregator, args.bootstrap_servers, args.topic, args.group_id, args.security_protocol,
+                      report=print_snapshot, report_seconds=args.report_seconds)
+    else:
+        start = time.perf_counter()
+        events, malformed = replay(aggregator, args.paths, print_snapshot, args.report_seconds)
+        aggregator.flush()
+        elapsed = time.perf_counter() - start
+        print_snapshot(aggregator.snapshot())
+        print(f"{events} events ({malformed} malformed) in {elapsed:.2f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
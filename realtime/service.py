@@ -0,0 +1,400 @@
+"""
+Real-time parking availability over HTTP.
+
+An asyncio HTTP/1.1 server that keeps every spot's latest status in memory,
+fed from the parking-events Kafka topic or a local stand-in (simulated
+sensors or a replayed NDJSON file), and serves it without touching Athena:
+
+    GET /availability                 lot-wide counters and per-zone summary
+    GET /availability/zones/<zone>    one zone and the status of its spots
+    GET /availability/spots/<spot>    one spot
+    GET /availability/windows         1m/5m/1h sliding-window occupancy
+    GET /health
+
+Every resource has a version that changes only when its content does; it is
+sent as the ETag, and a request with a matching If-None-Match gets 304. With
+?wait=<seconds> such a request long-polls instead: it is answered as soon as
+the resource changes, or with 304 when the wait runs out. Response bodies are
+encoded once per version and shared by every client that asks for it.
+
+Usage:
+    python -m realtime.service --source simulate --spots 500
+    python -m realtime.service --source replay data/parking-data/year=2024/month=03/day=20/hour=*/*
+    python -m realtime.service --source kafka --bootstrap-servers "$MSK_BOOTSTRAP_SERVERS"
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import threading
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from realtime.aggregator import OccupancyAggregator, epoch_seconds, format_epoch
+from realtime.consumer import create_consumer, open_events
+
+logger = logging.getLogger(__name__)
+
+# Longest long-poll a client may ask for, in seconds
+MAX_WAIT_SECONDS = 60
+# Largest request head accepted, in bytes
+MAX_REQUEST_HEAD = 16 * 1024
+
+_ZONE = re.compile(r'[A-Za-z]+')
+
+def zone_of(spot_id):
+    """Zone of a spot: its leading letters, e.g. 'A' for 'A12'"""
+    match = _ZONE.match(spot_id)
+    return match.group(0) if match else 'default'
+
+class AvailabilityStore:
+    """
+    Per-spot state on top of the aggregator's live view, with zone counters
+    and versions for ETags and long-polling. Must be used from the event loop
+    thread.
+    """
+    def __init__(self, aggregator=None):
+        self.aggregator = aggregator or OccupancyAggregator()
+        self.version = 0
+        # zone -> {'spots': n, 'occupied': n, 'version': v}
+        self.zones = {}
+        # spot_id -> (version, epoch seconds of the last status change)
+        self.changes = {}
+        self.zone_spots = {}
+        self._changed = set()
+        self._published_watermark = None
+        self._waiters = {}
+        self._bodies = {}
+
+    def apply(self, spot_id, status, timestamp):
+        """Fold in one event; returns True if the spot's status changed"""
+        before = self.aggregator.status(spot_id)
+        self.aggregator.add(spot_id, status, timestamp)
+        after = self.aggregator.status(spot_id)
+        if before is not None and before[0] == after[0]:
+            return False
+
+        self.version += 1
+        zone = zone_of(spot_id)
+        counters = self.zones.get(zone)
+        if counters is None:
+            counters = self.zones[zone] = {'spots': 0, 'occupied': 0, 'version': 0}
+        if before is None:
+            self.zone_spots.setdefault(zone, []).append(spot_id)
+            counters['spots'] += 1
+            counters['occupied'] += after[0]
+        else:
+            counters['occupied'] += after[0] - before[0]
+        counters['version'] = self.version
+        self.changes[spot_id] = (self.version, after[1])
+        self._changed.update((('lot',), ('zone', zone), ('spot', spot_id)))
+        return True
+
+    def apply_many(self, events):
+        """Fold in (spot_id, status, timestamp) events and wake the long-polls they answer"""
+        for spot_id, status, timestamp in events:
+            try:
+                self.apply(spot_id, status, timestamp)
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Skipping malformed event for {spot_id!r}: {e}")
+        self.publish()
+
+    def tick(self, now=None):
+        """Let the windows slide with the clock while no events arrive"""
+        self.aggregator.advance(now)
+        self.publish()
+
+    def publish(self):
+        """Wake clients waiting on resources changed since the last publish"""
+        if self.aggregator.watermark != self._published_watermark:
+            self._published_watermark = self.aggregator.watermark
+            self._changed.add(('windows',))
+        for key in self._changed:
+            waiter = self._waiters.pop(key, None)
+            if waiter is not None:
+                waiter.set()
+        self._changed.clear()
+
+    def resource_version(self, key):
+        kind = key[0]
+        if kind == 'lot':
+            return self.version
+        if kind == 'zone':
+            return self.zones[key[1]]['version'] if key[1] in self.zones else None
+        if kind == 'spot':
+            return self.changes[key[1]][0] if key[1] in self.changes else None
+        return self.aggregator.watermark
+
+    async def wait_for_change(self, key, version, timeout):
+        """Wait until the resource's version differs from version, or the timeout passes"""
+        deadline = time.monotonic() + timeout
+        while self.resource_version(key) == version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            waiter = self._waiters.get(key)
+            if waiter is None:
+                waiter = self._waiters[key] = asyncio.Event()
+            try:
+                await asyncio.wait_for(waiter.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def body(self, key):
+        """(version, JSON bytes) of a resource, encoded once per version; None if it does not exist"""
+        version = self.resource_version(key)
+        if version is None:
+            return None
+        cached = self._bodies.get(key)
+        if cached is not None and cached[0] == version:
+            return cached
+        cached = self._bodies[key] = (version, json.dumps(self._render(key), separators=(',', ':')).encode('utf-8'))
+        return cached
+
+    def _render(self, key):
+        status = self.aggregator.status
+        if key[0] == 'lot':
+            spots = self.aggregator.spot_count
+            return {
+                'spots': spots,
+                'occupied': self.aggregator.occupied,
+                'available': spots - self.aggregator.occupied,
+                'zones': {
+                    zone: {'spots': c['spots'], 'occupied': c['occupied'], 'available': c['spots'] - c['occupied']}
+                    for zone, c in sorted(self.zones.items())
+                }
+            }
+        if key[0] == 'zone':
+            counters = self.zones[key[1]]
+            return {
+                'zone': key[1],
+                'spots': counters['spots'],
+                'occupied': counters['occupied'],
+                'available': counters['spots'] - counters['occupied'],
+                'status': {
+                    spot_id: 'occupied' if status(spot_id)[0] else 'vacant'
+                    for spot_id in sorted(self.zone_spots[key[1]])
+                }
+            }
+        if key[0] == 'spot':
+            return {
+                'spot_id': key[1],
+                'zone': zone_of(key[1]),
+                'status': 'occupied' if status(key[1])[0] else 'vacant',
+                'since': format_epoch(self.changes[key[1]][1])
+            }
+        return self.aggregator.snapshot()
+
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+class AvailabilityServer:
+    def __init__(self, store):
+        self.store = store
+        self.requests = 0
+
+    def route(self, path):
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if parts == ['availability']:
+            return ('lot',)
+        if parts == ['availability', 'windows']:
+            return ('windows',)
+        if len(parts) == 3 and parts[0] == 'availability' and parts[1] in ('zones', 'spots'):
+            return (parts[1][:-1], parts[2])
+        return None
+
+    async def respond(self, method, target, headers):
+        """(status, extra headers, body) for one request"""
+        if method not in ('GET', 'HEAD'):
+            return 405, {'Allow': 'GET, HEAD'}, b''
+        url = urlsplit(target)
+        if url.path == '/health':
+            return 200, {}, b'{"status":"ok"}'
+        key = self.route(url.path)
+        if key is None:
+            return 404, {}, b'{"error":"not found"}'
+        try:
+            wait = min(float(parse_qs(url.query).get('wait', ['0'])[0]), MAX_WAIT_SECONDS)
+        except ValueError:
+            return 400, {}, b'{"error":"wait must be a number of seconds"}'
+
+        current = self.store.body(key)
+        if current is None and wait <= 0:
+            return 404, {}, b'{"error":"not found"}'
+        client_etag = headers.get('if-none-match')
+        if wait > 0 and (current is None or client_etag == f'"{current[0]}"'):
+            await self.store.wait_for_change(key, current[0] if current else None, wait)
+            current = self.store.body(key)
+            if current is None:
+                return 404, {}, b'{"error":"not found"}'
+        etag = f'"{current[0]}"'
+        if client_etag == etag:
+            return 304, {'ETag': etag}, b''
+        return 200, {'ETag': etag}, current[1]
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                request_line, *header_lines = head[:-4].decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ', 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = headers.get('content-length') or '0'
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                # Only ASCII digits; str.isdigit also accepts characters such as '²'
+                if length.isascii() and length.isdigit():
+                    if int(length):
+                        await reader.readexactly(int(length))
+                    status, extra, body = await self.respond(method, target, headers)
+                else:
+                    # Without a valid length the next request cannot be found, so close after replying
+                    status, extra, body = 400, {}, b'{"error":"invalid content-length"}'
+                    keep_alive = False
+                self.requests += 1
+                response = [
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}",
+                    f"Content-Length: {len(body)}",
+                    "Cache-Control: no-cache"
+                ]
+                if body:
+                    response.append("Content-Type: application/json")
+                response += [f"{name}: {value}" for name, value in extra.items()]
+                if not keep_alive:
+                    response.append("Connection: close")
+                writer.write(("\r\n".join(response) + "\r\n\r\n").encode('latin-1') + (body if method == 'GET' else b''))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def simulate(store, spots=500, events_per_second=100, tick=0.1):
+    """Local stand-in for the sensors: random status changes stamped with the current time"""
+    spot_ids = [f"{chr(ord('A') + i % 8)}{i // 8 + 1}" for i in range(spots)]
+    store.apply_many((spot_id, random.choice(('occupied', 'vacant')), int(time.time())) for spot_id in spot_ids)
+    while True:
+        await asyncio.sleep(tick)
+        now = int(time.time())
+        store.apply_many(
+            (random.choice(spot_ids), random.choice(('occupied', 'vacant')), now)
+            for _ in range(max(1, int(events_per_second * tick)))
+        )
+        store.tick(now)
+
+async def replay_files(store, paths, speed=60.0):
+    """Replay NDJSON events at speed x real time (0 for as fast as possible)"""
+    first_event = started = None
+    for path in paths:
+        with open_events(path) as lines:
+            for line in lines:
+                try:
+                    event = json.loads(line)
+                    timestamp = epoch_seconds(event['timestamp'])
+                    spot_id, status = event['spot_id'], event['status']
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if speed:
+                    if first_event is None:
+                        first_event, started = timestamp, time.monotonic()
+                    delay = (timestamp - first_event) / speed - (time.monotonic() - started)
+                    if delay > 0:
+                        store.publish()
+                        await asyncio.sleep(delay)
+                store.apply(spot_id, status, timestamp)
+        store.publish()
+        await asyncio.sleep(0)
+    store.aggregator.flush()
+    store.publish()
+    logger.info("Replay finished; serving the final state")
+
+def consume_kafka_thread(store, loop, bootstrap_servers, topic, group_id=None, security_protocol='SSL'):
+    """Poll Kafka on a background thread and hand each batch to the event loop"""
+    def run():
+        try:
+            consume(create_consumer(bootstrap_servers, topic, group_id, security_protocol))
+        except Exception:
+            logger.exception("Kafka consumer stopped")
+
+    def consume(consumer):
+        while True:
+            batches = consumer.poll(timeout_ms=1000)
+            events = []
+            for records in batches.values():
+                for record in records:
+                    try:
+                        event = json.loads(record.value)
+                        events.append((event['spot_id'], event['status'], event['timestamp']))
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.warning(f"Skipping malformed record at offset {record.offset}: {e}")
+            if events:
+                loop.call_soon_threadsafe(store.apply_many, events)
+            else:
+                loop.call_soon_threadsafe(store.tick)
+
+    thread = threading.Thread(target=run, name='kafka-consumer', daemon=True)
+    thread.start()
+    return thread
+
+async def serve(args):
+    store = AvailabilityStore(OccupancyAggregator(allowed_lateness=args.allowed_lateness))
+    server = AvailabilityServer(store)
+    loop = asyncio.get_running_loop()
+    if args.source == 'simulate':
+        feed = asyncio.create_task(simulate(store, args.spots, args.events_per_second))
+    elif args.source == 'replay':
+        feed = asyncio.create_task(replay_files(store, args.paths, args.speed))
+    else:
+        consume_kafka_thread(store, loop, args.bootstrap_servers, args.topic, args.group_id, args.security_protocol)
+        feed = None
+
+    http = await asyncio.start_server(server.handle, args.host, args.port, backlog=args.backlog, limit=MAX_REQUEST_HEAD)
+    logger.info(f"Serving availability on http://{args.host}:{args.port} from {args.source}")
+    async with http:
+        await http.serve_forever()
+    if feed is not None:
+        feed.cancel()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--backlog', type=int, default=4096)
+    parser.add_argument('--allowed-lateness', type=int, default=30)
+    parser.add_argument('--source', choices=['simulate', 'replay', 'kafka'], default='simulate')
+    parser.add_argument('paths', nargs='*', help='NDJSON files for --source replay')
+    parser.add_argument('--spots', type=int, default=500, help='simulated spots')
+    parser.add_argument('--events-per-second', type=float, default=100, help='simulated event rate')
+    parser.add_argument('--speed', type=float, default=60.0, help='replay speed-up, 0 for as fast as possible')
+    parser.add_argument('--bootstrap-servers', default=os.environ.get('MSK_BOOTSTRAP_SERVERS'))
+    parser.add_argument('--topic', default=os.environ.get('KAFKA_TOPIC', 'parking-events'))
+    parser.add_argument('--group-id')
+    parser.add_argument('--security-protocol', default='SSL')
+    args = parser.parse_args()
+    if args.source == 'replay' and not args.paths:
+        parser.error('--source replay needs NDJSON paths')
+    if args.source == 'kafka' and not args.bootstrap_servers:
+        parser.error('--bootstrap-servers or MSK_BOOTSTRAP_SERVERS is required')
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        logger.info("Service stopped by user")
+
+if __name__ == "__main__":
+    main()
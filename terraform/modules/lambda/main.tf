@@ -66,6 +66,14 @@ resource "aws_iam_role_policy" "lambda_msk" {
           "arn:aws:s3:::${var.s3_bucket}",
           "arn:aws:s3:::${var.s3_bucket}/*"
         ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "glue:GetTable",
+          "glue:BatchCreatePartition"
+        ]
+        Resource = ["*"]
       }
     ]
   })
@@ -0,0 +1,567 @@
+import os
+import json
+import sys
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from moto import mock_aws
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analytics.athena import AthenaClient, QueryFailed, QueryResult, result_dataframe
+from analytics.cache import QueryCache, normalize_sql, window_watermark
+from analytics.local import LocalEngine
+from analytics.occupancy import OccupancyAccumulator
+from analytics.query import build_query, floor_hour, partition_predicate
+from analytics.rollup import hours_to_process, rollup_hour_sql
+from analytics.spots import SpotRegistry
+
+def make_client():
+    athena = boto3.client('athena', region_name='eu-west-1',
+                          aws_access_key_id='testing', aws_secret_access_key='testing')
+    return AthenaClient(client=athena, initial_delay=0, max_delay=0), Stubber(athena)
+
+def execution(state, reason=None, statement_type='DML'):
+    status = {'State': state}
+    if reason:
+        status['StateChangeReason'] = reason
+    return {'QueryExecution': {'QueryExecutionId': 'q1', 'Status': status, 'StatementType': statement_type}}
+
+def results_page(rows, next_token=None, header=False):
+    page = {'ResultSet': {
+        'Rows': [{'Data': [{'VarCharValue': value} for value in row]} for row in rows],
+        'ResultSetMetadata': {'ColumnInfo': [
+            {'Name': 'spot_id', 'Label': 'spot_id', 'Type': 'varchar'},
+            {'Name': 'events', 'Label': 'events', 'Type': 'bigint'}
+        ]}
+    }}
+    if next_token:
+        page['NextToken'] = next_token
+    return page
+
+def test_run_polls_until_done_and_reads_every_page():
+    client, stubber = make_client()
+    stubber.add_response('start_query_execution', {'QueryExecutionId': 'q1'})
+    stubber.add_response('get_query_execution', execution('QUEUED'))
+    stubber.add_response('get_query_execution', execution('RUNNING'))
+    stubber.add_response('get_query_execution', execution('SUCCEEDED'))
+    stubber.add_response('get_query_results',
+                         results_page([['spot_id', 'events'], ['A1', '3']], next_token='t1'))
+    stubber.add_response('get_query_results', results_page([['A2', '5']]),
+                         {'QueryExecutionId': 'q1', 'NextToken': 't1'})
+
+    with stubber:
+        result = client.run("SELECT spot_id, count(*) AS events FROM parking_events GROUP BY spot_id")
+
+    assert result.columns == ['spot_id', 'events']
+    assert result.types == ['varchar', 'bigint']
+    assert result.rows == [['A1', '3'], ['A2', '5']]
+    stubber.assert_no_pending_responses()
+
+def test_failed_query_raises_with_reason():
+    client, stubber = make_client()
+    stubber.add_response('start_query_execution', {'QueryExecutionId': 'q1'})
+    stubber.add_response('get_query_execution', execution('FAILED', 'SYNTAX_ERROR: line 1:1'))
+
+    with stubber, pytest.raises(QueryFailed) as raised:
+        client.run("SELEC 1")
+    assert raised.value.state == 'FAILED'
+    assert 'SYNTAX_ERROR' in raised.value.reason
+
+def test_timeout_stops_query():
+    client, stubber = make_client()
+    client.timeout = 0
+    stubber.add_response('get_query_execution', execution('RUNNING'))
+    stubber.add_response('stop_query_execution', {}, {'QueryExecutionId': 'q1'})
+
+    with stubber, pytest.raises(QueryFailed, match='TIMED_OUT'):
+        client.wait('q1')
+    stubber.assert_no_pending_responses()
+
+def test_run_many_keeps_query_order(monkeypatch):
+    client, _ = make_client()
+    monkeypatch.setattr(client, 'run', lambda query: query.upper())
+
+    assert client.run_many(['a', 'b', 'c']) == ['A', 'B', 'C']
+    client.close()
+
+class FakeAthena:
+    """Counts executions and returns one row naming the query"""
+
+    def __init__(self, scanned=1000):
+        self.calls = 0
+        self.scanned = scanned
+
+    def run(self, query):
+        self.calls += 1
+        return QueryResult(f"q{self.calls}", ['query'], ['varchar'], [[query]], self.scanned)
+
+def test_normalize_sql_ignores_layout_but_not_literals():
+    a = "SELECT spot_id  -- latest\nFROM parking_events WHERE status = 'Occupied';"
+    b = "select spot_id from PARKING_EVENTS\n  where status = 'Occupied'"
+
+    assert normalize_sql(a) == normalize_sql(b)
+    assert normalize_sql(b) != normalize_sql(b.replace('Occupied', 'occupied'))
+
+def test_cache_hits_until_watermark_moves(tmp_path):
+    athena = FakeAthena()
+    cache = QueryCache(athena, directory=str(tmp_path), watermark='hour=10@1')
+
+    cache.run("SELECT 1")
+    result = cache.run("select   1")
+    assert athena.calls == 1
+    assert result.rows == [["SELECT 1"]]
+
+    cache.run("SELECT 1", watermark='hour=11@1')
+    assert athena.calls == 2
+    assert cache.stats() == {
+        'hits': 1, 'misses': 2, 'hit_rate': 1 / 3,
+        'bytes_saved': 1000, 'bytes_scanned': 2000, 'server_reuses': 0
+    }
+
+def test_expired_entries_are_rerun(tmp_path):
+    athena = FakeAthena()
+    cache = QueryCache(athena, directory=str(tmp_path), ttl_seconds=-1)
+
+    cache.run("SELECT 1")
+    cache.run("SELECT 1")
+    assert athena.calls == 2
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    athena = FakeAthena()
+    cache = QueryCache(athena, directory=str(tmp_path))
+    cache.run("SELECT 1")
+    entry_size = os.path.getsize(next(tmp_path.iterdir()))
+    cache.max_bytes = entry_size * 2 + 10
+
+    old = cache.key("SELECT 1")
+    os.utime(cache._path(old), (1, 1))
+    cache.run("SELECT 2")
+    os.utime(cache._path(cache.key("SELECT 2")), (2, 2))
+    cache.run("SELECT 3")
+
+    assert not os.path.exists(cache._path(old))
+    assert len(list(tmp_path.iterdir())) == 2
+
+def test_window_watermark_covers_only_the_query_window():
+    from datetime import datetime
+
+    with mock_aws():
+        s3 = boto3.client('s3', region_name='eu-west-1')
+        s3.create_bucket(Bucket='parking-monitoring-test',
+                         CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+        def put(key, body=b'{}'):
+            s3.put_object(Bucket='parking-monitoring-test', Key=key, Body=body)
+        def watermark(prefix='parking-data', **kwargs):
+            return window_watermark(s3, 'parking-monitoring-test', prefix,
+                                    datetime(2024, 3, 20, 8), datetime(2024, 3, 20, 11), **kwargs)
+
+        put('parking-data/year=2024/month=03/day=20/hour=09/a.json')
+        first = watermark()
+        assert first.startswith('parking-data@1:')
+
+        # New data after the window, in another table or another hour of the same day
+        put('parking-data/year=2024/month=03/day=20/hour=11/b.json')
+        put('parking-data/year=2024/month=03/day=20/hour=07/b.json')
+        put('parking-data-parquet/year=2024/month=03/day=20/hour=09/b.parquet')
+        assert watermark() == first
+
+        # A late event into an hour that already had data, and a compaction rewrite
+        put('parking-data/year=2024/month=03/day=20/hour=08/late.json')
+        late = watermark()
+        assert late != first
+        put('parking-data/year=2024/month=03/day=20/hour=08/late.json', b'{"compacted": true}')
+        assert watermark() != late
+
+        # Staging output, table metadata and keys outside the hour layout are not read by queries
+        put('parking-data/year=2024/month=03/day=20/_staging-1/hour=09/c.json')
+        put('parking-data/year=2024/month=03/day=20/hour=09/.metadata')
+        put('parking-data/year=2024/month=03/day=20/hour=9/c.json')
+        put('parking-data/year=2024/month=03/day=20/c.json')
+        assert watermark().startswith('parking-data@2:')
+
+        put('rollups/spot_hourly/year=2024/month=03/part-0.parquet')
+        put('rollups/spot_hourly/year=2024/month=03/_SUCCESS')
+        assert watermark('rollups/spot_hourly', monthly=True).startswith('rollups/spot_hourly@1:')
+
+def test_cache_evaluates_per_query_watermark(tmp_path):
+    athena = FakeAthena()
+    cache = QueryCache(athena, directory=str(tmp_path))
+    watermarks = iter(['a', 'a', 'b'])
+    for _ in range(3):
+        cache.run("SELECT 1", watermark=lambda: next(watermarks))
+    assert athena.calls == 2
+
+def test_uncached_queries_skip_the_watermark(tmp_path):
+    athena = FakeAthena()
+    cache = QueryCache(athena, directory=str(tmp_path), watermark=lambda: 1 / 0)
+    for _ in range(2):
+        cache.run("SELECT 1", cache=False)
+    assert athena.calls == 2
+    assert cache.stats()['misses'] == 2
+    assert list(tmp_path.iterdir()) == []
+
+def test_entry_evicted_while_read_is_a_miss(tmp_path, monkeypatch):
+    athena = FakeAthena()
+    cache = QueryCache(athena, directory=str(tmp_path), watermark='w')
+    cache.run("SELECT 1")
+
+    def utime(path):
+        os.remove(path)
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(os, 'utime', utime)
+    cache.run("SELECT 1")
+    assert athena.calls == 2
+
+def test_failed_write_leaves_no_temporary_file(tmp_path):
+    cache = QueryCache(FakeAthena(), directory=str(tmp_path))
+
+    def write(path):
+        with open(path, 'w') as f:
+            f.write('{')
+        raise OSError("disk full")
+    with pytest.raises(OSError):
+        cache._write('k', '.json', write)
+    assert list(tmp_path.iterdir()) == []
+
+def test_cache_run_many_runs_concurrently(tmp_path):
+    import time
+
+    class SlowAthena(FakeAthena):
+        max_workers = 4
+
+        def run(self, query):
+            time.sleep(0.2)
+            return super().run(query)
+
+    cache = QueryCache(SlowAthena(), directory=str(tmp_path), watermark='w')
+    start = time.perf_counter()
+    results = cache.run_many(["SELECT 1", "SELECT 2", "SELECT 3"])
+    cache.close()
+
+    assert [r.rows[0][0] for r in results] == ["SELECT 1", "SELECT 2", "SELECT 3"]
+    assert time.perf_counter() - start < 0.5
+
+def test_rollup_hours_to_process_only_closed_hours():
+    from datetime import datetime, timedelta
+
+    last = datetime(2024, 3, 20, 8)
+    hours = hours_to_process(last, datetime(2024, 3, 20, 11, 10), timedelta(minutes=15))
+    assert hours == [datetime(2024, 3, 20, 9)]
+    assert hours_to_process(last, datetime(2024, 3, 20, 11, 20)) == [datetime(2024, 3, 20, 9), datetime(2024, 3, 20, 10)]
+
+def test_rollup_sql_carries_status_across_month_boundary():
+    from datetime import datetime
+
+    sql = rollup_hour_sql(datetime(2024, 4, 1, 0), 'parquet')
+    assert "year = '2024' AND month = '04'" in sql and "day = '01' AND hour = '00'" in sql
+    # The carried-over status comes from the last hour of March
+    assert "year = '2024' AND month = '03' AND hour_start = TIMESTAMP '2024-03-31 23:00:00'" in sql
+    assert "TIMESTAMP '2024-04-01 01:00:00'" in sql
+    assert 'date_parse' in rollup_hour_sql(datetime(2024, 4, 1, 0), 'json')
+
+def test_run_dataframe_reads_result_csv_with_types():
+    client, stubber = make_client()
+    with mock_aws():
+        s3 = boto3.client('s3', region_name='eu-west-1')
+        s3.create_bucket(Bucket='parking-monitoring-test',
+                         CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+        s3.put_object(Bucket='parking-monitoring-test', Key='athena-results/q1.csv', Body=(
+            '"spot_id","events","rate","last_seen"\n'
+            '"A1","3","37.5","2024-03-20 10:00:00.000"\n'
+            '"",,,\n'
+        ).encode('utf-8'))
+        client._s3 = s3
+
+        finished = execution('SUCCEEDED')
+        finished['QueryExecution']['ResultConfiguration'] = {
+            'OutputLocation': 's3://parking-monitoring-test/athena-results/q1.csv'
+        }
+        finished['QueryExecution']['Statistics'] = {'DataScannedInBytes': 2048}
+        stubber.add_response('start_query_execution', {'QueryExecutionId': 'q1'})
+        stubber.add_response('get_query_execution', finished)
+        metadata = results_page([['spot_id', 'events', 'rate', 'last_seen']])
+        metadata['ResultSet']['ResultSetMetadata']['ColumnInfo'] = [
+            {'Name': n, 'Label': n, 'Type': t} for n, t in
+            [('spot_id', 'varchar'), ('events', 'bigint'), ('rate', 'double'), ('last_seen', 'timestamp')]
+        ]
+        stubber.add_response('get_query_results', metadata, {'QueryExecutionId': 'q1', 'MaxResults': 1})
+
+        with stubber:
+            df = client.run_dataframe("SELECT ...")
+
+    assert str(df['events'].dtype) == 'Int64'
+    assert df['rate'].dtype == 'float64'
+    assert str(df['last_seen'].dtype).startswith('datetime64')
+    assert df['spot_id'].tolist()[1] == ''
+    assert df['events'].isna().tolist() == [False, True]
+    assert df.attrs['data_scanned_bytes'] == 2048
+
+def test_result_dataframe_types_paginated_rows():
+    result = QueryResult('q1', ['spot_id', 'events'], ['varchar', 'bigint'], [['A1', '3'], ['A2', None]])
+    df = result_dataframe(result)
+    assert df['events'].tolist()[0] == 3 and df['events'].isna().tolist() == [False, True]
+
+def test_cache_stores_typed_frames(tmp_path):
+    import pandas as pd
+
+    class FrameAthena:
+        calls = 0
+
+        def run_dataframe(self, query):
+            self.calls += 1
+            df = pd.DataFrame({'events': pd.array([1, None], dtype='Int64'), 'rate': [0.5, 1.0]})
+            df.attrs['data_scanned_bytes'] = 500
+            return df
+
+    athena = FrameAthena()
+    cache = QueryCache(athena, directory=str(tmp_path), watermark='w')
+    cache.run_dataframe("SELECT 1")
+    df = cache.run_dataframe("SELECT 1")
+
+    assert athena.calls == 1
+    assert str(df['events'].dtype) == 'Int64'
+    assert cache.stats()['bytes_saved'] == 500
+
+def partitions_selected(predicate, first, last):
+    """Evaluate a partition predicate with sqlite over every hour partition between first and last"""
+    import sqlite3
+    from datetime import timedelta
+
+    db = sqlite3.connect(':memory:')
+    db.execute('CREATE TABLE p (year TEXT, month TEXT, day TEXT, hour TEXT, ts TEXT)')
+    hour = first
+    while hour <= last:
+        db.execute('INSERT INTO p VALUES (?, ?, ?, ?, ?)', (
+            str(hour.year), f"{hour.month:02d}", f"{hour.day:02d}", f"{hour.hour:02d}", hour.isoformat()
+        ))
+        hour += timedelta(hours=1)
+    return {row[0] for row in db.execute(f'SELECT ts FROM p WHERE {predicate}')}
+
+@pytest.mark.parametrize('start, end', [
+    ('2024-03-20T10:15', '2024-03-20T12:00'),
+    ('2024-02-27T22:30', '2024-05-02T03:10'),
+    ('2024-12-31T23:00', '2026-01-01T01:00'),
+    ('2024-03-01T00:00', '2024-04-01T00:00'),
+])
+def test_partition_predicate_selects_exactly_the_window(start, end):
+    from datetime import datetime, timedelta
+
+    start, end = datetime.fromisoformat(start), datetime.fromisoformat(end)
+    expected = set()
+    hour = floor_hour(start)
+    while hour < end:
+        expected.add(hour.isoformat())
+        hour += timedelta(hours=1)
+
+    selected = partitions_selected(partition_predicate(start, end), datetime(2023, 12, 1), datetime(2026, 2, 1))
+    assert selected == expected
+
+def test_build_query_filters_partitions_time_and_spots():
+    from datetime import datetime
+
+    sql = build_query('spot_activity', datetime(2024, 3, 20, 10), datetime(2024, 3, 20, 12),
+                      spot_ids=['A1', "B'2"], source_format='parquet')
+    assert "(year = '2024' AND month = '03' AND day = '20' AND hour BETWEEN '10' AND '11')" in sql
+    assert "timestamp >= TIMESTAMP '2024-03-20 10:00:00'" in sql
+    assert "spot_id IN ('A1', 'B''2')" in sql
+
+    with pytest.raises(ValueError):
+        build_query('latest_status', datetime(2024, 3, 20), datetime(2024, 3, 21), source='rollup')
+
+def test_rollup_queries_keep_hours_and_spots_without_events():
+    import sqlite3
+
+    db = sqlite3.connect(':memory:')
+    db.execute("ATTACH ':memory:' AS parking_analytics")
+    db.execute("""CREATE TABLE parking_analytics.spot_hourly (spot_id TEXT, year TEXT, month TEXT, day TEXT, hour TEXT,
+                  event_count INTEGER, occupied_count INTEGER, vacant_count INTEGER, occupied_seconds REAL)""")
+    db.executemany("INSERT INTO parking_analytics.spot_hourly VALUES (?, '2024', '03', '20', ?, ?, ?, ?, ?)", [
+        ('A1', '10', 2, 1, 1, 1800.0),
+        # A1 stays occupied through 11:00 without an event; A2 has been parked since before the window
+        ('A1', '11', 0, 0, 0, 3600.0),
+        ('A2', '10', 0, 0, 0, 3600.0),
+    ])
+
+    hourly = db.execute(build_query('hourly_occupancy', source='rollup')).fetchall()
+    assert hourly == [('2024', '03', '20', '10', 2, 1, 50.0, 75.0), ('2024', '03', '20', '11', 0, 0, None, 100.0)]
+    spots = db.execute(build_query('spot_activity', source='rollup')).fetchall()
+    assert spots == [('A1', 2, 1, 1, 50.0, 75.0), ('A2', 0, 0, 0, None, 100.0)]
+
+def write_local_partitions(root, source_format='json'):
+    """Two hours of events for two spots in the bucket layout, in every file encoding the handler writes"""
+    import gzip
+    import zstandard
+
+    events = {
+        'year=2024/month=03/day=20/hour=09': [
+            {'spot_id': 'A1', 'status': 'occupied', 'timestamp': '2024-03-20T09:10:00Z'},
+            {'spot_id': 'A2', 'status': 'vacant', 'timestamp': '2024-03-20T09:20:00Z'},
+        ],
+        'year=2024/month=03/day=20/hour=10': [
+            {'spot_id': 'A1', 'status': 'vacant', 'timestamp': '2024-03-20T10:05:00Z'},
+            {'spot_id': 'A2', 'status': 'occupied', 'timestamp': '2024-03-20T10:30:00Z'},
+            {'spot_id': 'A2', 'status': 'occupied', 'timestamp': '2024-03-20T10:45:00Z'},
+        ],
+        'year=2024/month=03/day=21/hour=00': [
+            {'spot_id': 'A1', 'status': 'occupied', 'timestamp': '2024-03-21T00:01:00Z'},
+        ],
+    }
+    for partition, rows in events.items():
+        directory = root / ('parking-data' if source_format == 'json' else 'parking-data-parquet') / partition
+        directory.mkdir(parents=True)
+        if source_format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            from datetime import datetime
+            pq.write_table(pa.table({
+                'spot_id': [r['spot_id'] for r in rows],
+                'status': pa.array([r['status'] for r in rows]).dictionary_encode(),
+                'timestamp': pa.array([datetime.strptime(r['timestamp'], '%Y-%m-%dT%H:%M:%SZ') for r in rows],
+                                      type=pa.timestamp('ms'))
+            }), directory / 'part.parquet')
+            continue
+        body = [(json.dumps(r) + "\n").encode('utf-8') for r in rows]
+        (directory / 'a.json').write_bytes(body[0])
+        if len(body) > 1:
+            (directory / 'b.json.gz').write_bytes(gzip.compress(body[1]))
+        if len(body) > 2:
+            (directory / 'c.json.zst').write_bytes(zstandard.ZstdCompressor().compress(b''.join(body[2:])))
+        (directory / '_staging-x.json').write_bytes(b''.join(body))
+
+@pytest.mark.parametrize('source_format', ['json', 'parquet'])
+def test_local_engine_matches_athena_metrics(tmp_path, source_format):
+    from datetime import datetime
+
+    write_local_partitions(tmp_path, source_format)
+    engine = LocalEngine(str(tmp_path), source_format)
+
+    hourly = engine.run_metric('hourly_occupancy', datetime(2024, 3, 20, 10), datetime(2024, 3, 21, 1))
+    # Like the rollup, the quiet hours in between carry both spots' state
+    assert len(hourly) == 15 and hourly['occupancy_rate'].isna().sum() == 13
+    hourly = hourly[hourly['total_events'] > 0]
+    assert hourly[['day', 'hour', 'total_events', 'occupied_events']].values.tolist() == [
+        ['20', '10', 3, 2], ['21', '00', 1, 1]
+    ]
+    assert str(hourly['total_events'].dtype) == 'Int64' and hourly['occupancy_rate'].tolist() == [66.67, 100.0]
+    limited = engine.run_metric('hourly_occupancy', datetime(2024, 3, 20, 10), datetime(2024, 3, 21, 1), limit=2)
+    assert limited[['hour', 'total_events']].values.tolist() == [['10', 3], ['11', 0]]
+
+    activity = engine.run_metric('spot_activity')
+    assert activity[['spot_id', 'total_events', 'times_occupied']].values.tolist() == [['A1', 3, 2], ['A2', 3, 2]]
+
+    latest = engine.run_metric('latest_status')
+    assert latest[['spot_id', 'status']].values.tolist() == [['A1', 'occupied'], ['A2', 'occupied']]
+    if source_format == 'json':
+        assert latest['timestamp'].tolist() == ['2024-03-21T00:01:00Z', '2024-03-20T10:45:00Z']
+
+    days = engine.run_metric('day_of_week', spot_ids=['A1'])
+    assert days[['day', 'total_events']].values.tolist() == [[3, 2], [4, 1]]
+
+def test_local_engine_prunes_partitions(tmp_path):
+    from datetime import datetime
+
+    write_local_partitions(tmp_path)
+    engine = LocalEngine(str(tmp_path))
+
+    dirs = engine.partition_dirs(datetime(2024, 3, 20, 10, 30), datetime(2024, 3, 20, 11))
+    assert [os.path.basename(d) for d in dirs] == ['hour=10']
+    assert len(engine.run_metric('events', datetime(2024, 3, 20, 10, 30), datetime(2024, 3, 20, 11))) == 2
+
+def test_occupancy_is_weighted_by_time_and_carried_across_chunks():
+    import pandas as pd
+    from datetime import datetime
+
+    events = pd.DataFrame([
+        ('A1', 'vacant', '2024-03-20T09:50:00Z'),
+        ('A1', 'occupied', '2024-03-20T10:15:00Z'),
+        ('A1', 'occupied', '2024-03-20T10:30:00Z'),
+        ('A1', 'vacant', '2024-03-20T11:45:00Z'),
+        # A chatty sensor: four reports in two minutes, then silence
+        ('A2', 'occupied', '2024-03-20T10:00:00Z'),
+        ('A2', 'occupied', '2024-03-20T10:00:30Z'),
+        ('A2', 'vacant', '2024-03-20T10:01:00Z'),
+        ('A2', 'vacant', '2024-03-20T10:01:30Z'),
+    ], columns=['spot_id', 'status', 'timestamp'])
+    accumulator = OccupancyAccumulator(datetime(2024, 3, 20, 10), datetime(2024, 3, 20, 12))
+    for chunk in (events.iloc[:3], events.iloc[3:]):
+        accumulator.add(chunk)
+
+    spots = accumulator.spots()
+    assert spots[['spot_id', 'event_count', 'arrivals', 'stays']].values.tolist() == [['A1', 3, 1, 1], ['A2', 4, 0, 0]]
+    # A1 occupied 10:15-11:45; A2's first-seen stay has no known start, so it is not a dwell
+    assert spots['occupancy_pct'].tolist() == [75.0, 0.83]
+    assert spots['mean_dwell_minutes'].tolist()[0] == 90.0
+
+    hourly = accumulator.hourly()
+    assert hourly['occupied_seconds'].tolist() == [2700.0 + 60.0, 2700.0]
+    assert hourly[['arrivals', 'departures']].values.tolist() == [[1, 0], [0, 1]]
+    assert accumulator.dwell_histogram().set_index('dwell')['stays']['60-120m'] == 1
+
+def test_local_engine_occupancy_reads_hour_by_hour(tmp_path):
+    from datetime import datetime
+
+    write_local_partitions(tmp_path)
+    engine = LocalEngine(str(tmp_path))
+    start, end = datetime(2024, 3, 20, 9), datetime(2024, 3, 20, 11)
+
+    assert len(list(engine.iter_hours(start, end))) == 2
+    spots = engine.occupancy(start, end).spots()
+    # A1: occupied 09:10-10:05 of 09:10-11:00; A2: occupied 10:30-11:00 of 09:20-11:00
+    assert spots['occupancy_pct'].tolist() == [50.0, 30.0]
+    # A1 was first seen occupied, so its stay has no known start and is not a dwell
+    assert spots[['arrivals', 'stays']].values.tolist() == [[0, 0], [1, 0]]
+
+    # As in the rollup, each hour in which a spot is known counts in full: A2 is vacant before 09:20
+    hourly = engine.run_metric('hourly_occupancy', start, end)
+    assert hourly['time_occupied_pct'].tolist() == [round(50 * 100 / 120, 2), round(35 * 100 / 120, 2)]
+
+def test_local_engine_time_occupied_matches_rollup_denominator(tmp_path):
+    from datetime import datetime
+
+    write_local_partitions(tmp_path)
+    engine = LocalEngine(str(tmp_path))
+
+    # A2 is first seen occupied at 10:30: half of the hour, as the rollup reports it
+    activity = engine.run_metric('spot_activity', datetime(2024, 3, 20, 10), datetime(2024, 3, 20, 11), spot_ids=['A2'])
+    assert activity['time_occupied_pct'].tolist() == [50.0]
+
+    # A1 was parked at 09:10; the lookback seeds that state for a window without A1 events
+    hourly = engine.run_metric('hourly_occupancy', datetime(2024, 3, 20, 11), datetime(2024, 3, 20, 13))
+    assert hourly[['hour', 'total_events', 'time_occupied_pct']].values.tolist() == [['11', 0, 50.0], ['12', 0, 50.0]]
+    assert hourly['occupancy_rate'].isna().all()
+    assert engine.occupancy(datetime(2024, 3, 20, 10, 30), datetime(2024, 3, 20, 11)).spots()['occupancy_pct'].tolist() == [0.0, 100.0]
+
+def test_spot_registry_interns_ids_and_keeps_newest_state():
+    import numpy as np
+
+    registry = SpotRegistry(capacity=8, id_width=2)
+    codes = registry.codes(['B1', 'A1', 'B1', 'A10'])
+    assert codes.tolist() == [0, 1, 0, 2] and registry.code('A10') == 2 and registry.code('C1') == 3
+    assert registry.code('Z9', create=False) is None
+
+    # Out of order within the batch: the newest event per spot wins
+    changed = registry.update(codes, [True, True, False, True], [100, 100, 90, 100])
+    assert sorted(changed.tolist()) == [0, 1, 2]
+    assert registry.set(0, False, 80) is None and registry.set(0, False, 120) == 1
+    assert registry.status('B1') == (False, 120) and registry.status('C1') is None
+    assert (registry.occupied_count(), registry.known_count()) == (2, 3)
+
+    spots, occupied = registry.counts_by(np.array([0, 0, 1, 1]))
+    assert spots.tolist() == [2, 1] and occupied.tolist() == [1, 1]
+    assert registry.frame()['spot_id'].tolist() == ['A1', 'A10', 'B1']
+
+def test_occupancy_accumulator_with_shared_registry_reports_only_its_spots():
+    import pandas as pd
+    from datetime import datetime
+
+    registry = SpotRegistry()
+    registry.codes(['Z1'])
+    events = pd.DataFrame([('A1', 'occupied', '2024-03-20T10:00:00Z')], columns=['spot_id', 'status', 'timestamp'])
+    accumulator = OccupancyAccumulator(datetime(2024, 3, 20, 10), datetime(2024, 3, 20, 11), registry=registry)
+    accumulator.add(events)
+    registry.codes(['Z2'])
+
+    assert accumulator.spots()['spot_id'].tolist() == ['A1']
+    assert accumulator.spot_hours()['occupancy_pct'].tolist() == [100.0]
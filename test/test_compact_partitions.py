@@ -0,0 +1,154 @@
+import os
+import sys
+import gzip
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'glue'))
+
+from compact_partitions import LocalStore, S3Store, compact_partition, iter_records, main, MANIFEST_NAME
+
+PARTITION = 'parking-data/year=2024/month=03/day=20/hour=10'
+TEST_BUCKET = 'parking-monitoring-test'
+
+def events(start, count):
+    return [
+        {'spot_id': f"A{i % 7}", 'status': 'occupied' if i % 2 else 'free',
+         'timestamp': f"2024-03-20T10:{i % 60:02d}:00Z"}
+        for i in range(start, start + count)
+    ]
+
+def write_small_files(root, files=10, per_file=5):
+    directory = os.path.join(root, *PARTITION.split('/'))
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for n in range(files):
+        batch = events(n * per_file, per_file)
+        body = "".join(json.dumps(e) + "\n" for e in batch).encode('utf-8')
+        name = f"parking-events-0-{n}_parking-events-0-{n}.json"
+        if n % 2:
+            name, body = name + '.gz', gzip.compress(body)
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(body)
+        written.extend(batch)
+    return written
+
+def read_all(store, prefix):
+    return [r for key in store.list(prefix) for r in iter_records(store, key)]
+
+def sort_key(record):
+    return (record['timestamp'], record['spot_id'], record['status'])
+
+def test_compacts_local_partition(tmp_path):
+    expected = write_small_files(str(tmp_path))
+    store = LocalStore(str(tmp_path))
+
+    summary = compact_partition(store, PARTITION)
+
+    assert summary['status'] == 'compacted'
+    assert summary['inputs'] == 10 and summary['records'] == 50
+    assert [key.rsplit('/', 1)[-1][:10] for key in store.list(PARTITION)] == ['compacted-']
+    assert sorted(read_all(store, PARTITION), key=sort_key) == sorted(expected, key=sort_key)
+
+def test_rerun_is_noop(tmp_path):
+    write_small_files(str(tmp_path))
+    store = LocalStore(str(tmp_path))
+    compact_partition(store, PARTITION, max_records_per_file=20)
+    keys = store.list(PARTITION)
+
+    assert len(keys) == 3
+    assert compact_partition(store, PARTITION, max_records_per_file=20)['status'] == 'skipped'
+    assert store.list(PARTITION) == keys
+
+def test_late_file_is_merged_with_compacted_output(tmp_path):
+    write_small_files(str(tmp_path))
+    store = LocalStore(str(tmp_path))
+    compact_partition(store, PARTITION)
+
+    late = os.path.join(str(tmp_path), *PARTITION.split('/'), 'parking-events-0-99_parking-events-0-99.json')
+    with open(late, 'w') as f:
+        f.write(json.dumps(events(99, 1)[0]) + "\n")
+
+    assert compact_partition(store, PARTITION)['records'] == 51
+    assert len(store.list(PARTITION)) == 1
+
+def test_resumes_after_interrupted_promotion(tmp_path, monkeypatch):
+    write_small_files(str(tmp_path))
+    store = LocalStore(str(tmp_path))
+
+    # Fail while deleting the sources, after the manifest and outputs are in place
+    original_delete = LocalStore.delete
+    def failing_delete(self, keys):
+        keys = list(keys)
+        if any('parking-events' in key for key in keys):
+            raise OSError('interrupted')
+        original_delete(self, keys)
+    monkeypatch.setattr(LocalStore, 'delete', failing_delete)
+    with pytest.raises(OSError):
+        compact_partition(store, PARTITION)
+    monkeypatch.setattr(LocalStore, 'delete', original_delete)
+    assert store.exists(f"{PARTITION}/{MANIFEST_NAME}")
+
+    assert compact_partition(store, PARTITION)['status'] == 'skipped'
+    assert not store.exists(f"{PARTITION}/{MANIFEST_NAME}")
+    assert len(read_all(store, PARTITION)) == 50
+
+def test_count_mismatch_keeps_sources(tmp_path, monkeypatch):
+    write_small_files(str(tmp_path))
+    store = LocalStore(str(tmp_path))
+    keys = store.list(PARTITION)
+
+    import compact_partitions
+    original = compact_partitions.JsonPartWriter.write
+    calls = []
+    def dropping_write(self, record):
+        calls.append(record)
+        if len(calls) != 3:
+            original(self, record)
+    monkeypatch.setattr(compact_partitions.JsonPartWriter, 'write', dropping_write)
+
+    with pytest.raises(RuntimeError, match='mismatch'):
+        compact_partition(store, PARTITION)
+    assert store.list(PARTITION) == keys
+
+def test_compacts_s3_partition_to_parquet(tmp_path):
+    pytest.importorskip('pyarrow')
+    expected = write_small_files(str(tmp_path))
+    local = LocalStore(str(tmp_path))
+
+    with mock_aws():
+        client = boto3.client('s3', region_name='eu-west-1')
+        client.create_bucket(Bucket=TEST_BUCKET, CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+        for key in local.list(PARTITION):
+            with local.open(key) as f:
+                client.put_object(Bucket=TEST_BUCKET, Key=key, Body=f.read())
+        store = S3Store(TEST_BUCKET, client)
+
+        output = PARTITION.replace('parking-data/', 'parking-data-parquet/')
+        summary = compact_partition(store, PARTITION, output_prefix=output, output_format='parquet')
+
+        assert summary['outputs'][0].endswith('.parquet')
+        assert store.list(PARTITION) == []
+        assert sorted(read_all(store, output), key=sort_key) == sorted(expected, key=sort_key)
+
+def test_other_format_is_never_written_into_the_source_table(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    expected = write_small_files(str(tmp_path))
+    store = LocalStore(str(tmp_path))
+    keys = store.list(PARTITION)
+
+    with pytest.raises(ValueError, match='mix file types'):
+        compact_partition(store, PARTITION, output_format='parquet')
+    assert store.list(PARTITION) == keys
+
+    # The documented usage writes into the Parquet table
+    monkeypatch.setattr(sys, 'argv', ['compact_partitions.py', '--local-dir', str(tmp_path),
+                                      '--hour', '2024-03-20T10', '--output-format', 'parquet'])
+    main()
+    output = PARTITION.replace('parking-data/', 'parking-data-parquet/')
+    assert store.list(PARTITION) == []
+    assert all(key.endswith('.parquet') for key in store.list(output))
+    assert sorted(read_all(store, output), key=sort_key) == sorted(expected, key=sort_key)
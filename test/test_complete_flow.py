@@ -1,14 +1,20 @@
+import os
+import sys
 import json
 import boto3
 import time
 from datetime import datetime
 import random
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'glue'))
+from compact_partitions import S3Store, iter_records
+
 # Initialize AWS clients
 s3 = boto3.client('s3')
 lambda_client = boto3.client('lambda')
 glue = boto3.client('glue')
 athena = boto3.client('athena')
+store = S3Store('parking-monitoring-data', client=s3)
 
 def generate_parking_event():
     """Generate a sample parking event"""
@@ -59,9 +65,9 @@ def check_s3_data():
         for obj in response['Contents'][:5]:  # Show first 5 objects
             print(f"- {obj['Key']}")
             # Get and print the content of each file
-            content = s3.get_object(Bucket='parking-monitoring-data', Key=obj['Key'])
-            data = json.loads(content['Body'].read().decode('utf-8'))
-            print(f"  Content: {json.dumps(data, indent=2)}")
+            # Read with the compaction job's reader, which handles every format and compression
+            for record in iter_records(store, obj['Key']):
+                print(f"  Content: {json.dumps(record, indent=2)}")
     else:
         print("No data found in S3")
 
@@ -95,6 +101,12 @@ def repair_table_partitions():
     repair_query = "MSCK REPAIR TABLE parking_analytics.parking_events"
     
     try:
+        # Tables with partition projection have nothing to repair
+        table = glue.get_table(DatabaseName='parking_analytics', Name='parking_events')
+        if table['Table'].get('Parameters', {}).get('projection.enabled') == 'true':
+            print("Partition projection enabled, no repair needed")
+            return
+
         # Start repair query
         response = athena.start_query_execution(
             QueryString=repair_query,
@@ -0,0 +1,342 @@
+import io
+import os
+import gzip
+import base64
+import sys
+import json
+import importlib
+
+import boto3
+import pytest
+from moto import mock_aws
+
+# The Lambda source lives in lambda/ingestion, which is not an importable package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'ingestion'))
+
+TEST_BUCKET = 'parking-monitoring-test'
+
+def make_record(offset, timestamp, spot_id='A1', status='occupied', partition=0):
+    """Build a flat test record in the shape used by test_complete_flow.py"""
+    return {
+        'topic': 'parking-events',
+        'partition': partition,
+        'offset': offset,
+        'value': json.dumps({'spot_id': spot_id, 'status': status, 'timestamp': timestamp})
+    }
+
+def make_msk_event(records):
+    """Wrap flat test records in the MSK event source shape"""
+    grouped = {}
+    for record in records:
+        encoded = dict(record, value=base64.b64encode(record['value'].encode('utf-8')).decode('ascii'))
+        grouped.setdefault(f"{record['topic']}-{record['partition']}", []).append(encoded)
+    return {'eventSource': 'aws:kafka', 'records': grouped}
+
+@pytest.fixture
+def ingestion(monkeypatch):
+    """Import the handler against a mocked S3 bucket"""
+    monkeypatch.setenv('S3_BUCKET', TEST_BUCKET)
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+    with mock_aws():
+        boto3.client('s3').create_bucket(
+            Bucket=TEST_BUCKET,
+            CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'}
+        )
+        import index
+        import settings
+        settings.reset_settings()
+        yield importlib.reload(index)
+
+def list_keys(prefix='parking-data/'):
+    response = boto3.client('s3').list_objects_v2(Bucket=TEST_BUCKET, Prefix=prefix)
+    return sorted(obj['Key'] for obj in response.get('Contents', []))
+
+def read_lines(key):
+    body = boto3.client('s3').get_object(Bucket=TEST_BUCKET, Key=key)['Body'].read()
+    return [json.loads(line) for line in body.decode('utf-8').splitlines()]
+
+def test_one_object_per_partition(ingestion):
+    records = [
+        make_record(0, '2024-03-20T10:00:00Z'),
+        make_record(1, '2024-03-20T10:59:59Z', spot_id='A2'),
+        make_record(2, '2024-03-20T11:00:00Z'),
+    ]
+    response = ingestion.handler({'records': records}, None)
+    body = json.loads(response['body'])
+    assert body['objects_written'] == 2
+    assert 'upload_ms' in body
+
+    keys = list_keys()
+    assert keys == [
+        'parking-data/year=2024/month=03/day=20/hour=10/parking-events-0-0_parking-events-0-1.json',
+        'parking-data/year=2024/month=03/day=20/hour=11/parking-events-0-2_parking-events-0-2.json',
+    ]
+    assert [e['spot_id'] for e in read_lines(keys[0])] == ['A1', 'A2']
+
+def test_replayed_batch_is_idempotent(ingestion):
+    records = [make_record(offset, '2024-03-20T10:00:00Z') for offset in range(5)]
+    ingestion.handler({'records': records}, None)
+    ingestion.handler({'records': records}, None)
+
+    keys = list_keys()
+    assert len(keys) == 1
+    assert len(read_lines(keys[0])) == 5
+
+def test_msk_event_shape(ingestion):
+    records = [
+        make_record(7, '2024-03-20T10:00:00Z', partition=0),
+        make_record(3, '2024-03-20T10:30:00Z', spot_id='B4', partition=1),
+    ]
+    response = ingestion.handler(make_msk_event(records), None)
+    assert json.loads(response['body'])['records_processed'] == 2
+
+    keys = list_keys()
+    assert keys == ['parking-data/year=2024/month=03/day=20/hour=10/parking-events-0-7_parking-events-1-3.json']
+    assert [e['spot_id'] for e in read_lines(keys[0])] == ['A1', 'B4']
+
+def test_partition_path_rejects_malformed_timestamp(ingestion):
+    with pytest.raises(ValueError):
+        ingestion.partition_path('2024-03-20 10:00:00')
+    # Also once the hour's path is cached
+    assert ingestion.partition_path('2024-03-20T10:00:00Z') == 'year=2024/month=03/day=20/hour=10'
+    for timestamp in ('2024-03-20T10:7x:zzZ', '2024-03-20T10:61:00Z', '2024-03-20T10:00:00+', '2024-03-20T10:٠٠:00Z'):
+        with pytest.raises(ValueError):
+            ingestion.partition_path(timestamp)
+
+def test_value_holding_several_documents_does_not_shift_other_records():
+    from decoding import decode_records
+
+    fragment = json.dumps({'spot_id': 'X1', 'status': 'occupied', 'timestamp': '2024-03-20T10:00:00Z'})
+    records = [
+        make_record(0, '2024-03-20T10:00:00Z'),
+        dict(make_record(1, '2024-03-20T10:00:00Z'), value=fragment + ',' + fragment),
+        dict(make_record(2, '2024-03-20T10:00:00Z'), value='{not json'),
+        make_record(3, '2024-03-20T10:05:00Z', spot_id='A2'),
+    ]
+    decoded, failures = decode_records({'records': records})
+    assert [(record['offset'], message['spot_id']) for record, message in decoded] == [(0, 'A1'), (3, 'A2')]
+    assert [record['offset'] for record, _, _ in failures] == [1, 2]
+
+def test_non_object_values_and_records_go_to_dead_letters(ingestion):
+    records = [
+        dict(make_record(0, '2024-03-20T10:00:00Z'), value=None),
+        dict(make_record(1, '2024-03-20T10:00:00Z'), value=5),
+        dict(make_record(2, '2024-03-20T10:00:00Z'), value='null'),
+        dict(make_record(3, '2024-03-20T10:00:00Z'), value='{"spot_id": "A1"}'),
+        'not a record',
+        make_record(5, '2024-03-20T10:05:00Z', spot_id='A2'),
+    ]
+    response = ingestion.handler({'records': records}, None)
+    body = json.loads(response['body'])
+    assert response['statusCode'] == 200
+    assert (body['records_processed'], body['records_failed']) == (1, 5)
+
+    assert body['dead_letter_key'] == 'parking-data-errors/parking-events-0-0_parking-events-0-3.json'
+    dead_letters = read_lines(body['dead_letter_key'])
+    assert [d['offset'] for d in dead_letters] == [0, 1, 2, 3, None]
+    assert dead_letters[-1]['value'] == 'not a record'
+    assert [e['spot_id'] for e in read_lines(list_keys()[0])] == ['A2']
+
+def test_bad_records_go_to_dead_letter_prefix(ingestion):
+    records = [
+        make_record(0, '2024-03-20T10:00:00Z'),
+        dict(make_record(1, '2024-03-20T10:00:00Z'), value='{not json'),
+        make_record(2, 'yesterday'),
+        make_record(3, '2024-03-20T10:05:00Z', spot_id='A2'),
+    ]
+    response = ingestion.handler({'records': records}, None)
+    body = json.loads(response['body'])
+    assert response['statusCode'] == 200
+    assert body['records_processed'] == 2
+    assert body['records_failed'] == 2
+
+    # Good records are stored; bad ones are kept with their offset and error
+    stored = read_lines(list_keys()[0])
+    assert [e['spot_id'] for e in stored] == ['A1', 'A2']
+
+    dead_letters = read_lines(body['dead_letter_key'])
+    # Derived from the failed records only, so a replay on another day writes the same object
+    assert body['dead_letter_key'] == 'parking-data-errors/parking-events-0-1_parking-events-0-2.json'
+    assert [d['offset'] for d in dead_letters] == [1, 2]
+    assert dead_letters[0]['value'] == '{not json'
+    assert all(d['error'] for d in dead_letters)
+
+def test_snapshot_keeps_latest_status_per_spot(ingestion, monkeypatch):
+    import settings
+
+    monkeypatch.setenv('SNAPSHOT_KEY', 'parking-state/current_status.json')
+    settings.reset_settings()
+    ingestion.handler({'records': [
+        make_record(0, '2024-03-20T10:05:00Z', spot_id='A1', status='occupied'),
+        make_record(1, '2024-03-20T10:00:00Z', spot_id='A2', status='occupied'),
+        make_record(2, '2024-03-20T10:06:00Z', spot_id='A2', status='vacant'),
+    ]}, None)
+    # A late event for A1 must not overwrite its newer state
+    response = ingestion.handler({'records': [
+        make_record(3, '2024-03-20T10:01:00Z', spot_id='A1', status='vacant'),
+        make_record(4, '2024-03-20T10:07:00Z', spot_id='A3', status='occupied'),
+    ]}, None)
+    assert json.loads(response['body'])['snapshot_updated'] is True
+
+    body = boto3.client('s3').get_object(Bucket=TEST_BUCKET, Key='parking-state/current_status.json')['Body']
+    spots = json.loads(body.read())['spots']
+    assert spots == {
+        'A1': {'status': 'occupied', 'timestamp': '2024-03-20T10:05:00Z'},
+        'A2': {'status': 'vacant', 'timestamp': '2024-03-20T10:06:00Z'},
+        'A3': {'status': 'occupied', 'timestamp': '2024-03-20T10:07:00Z'},
+    }
+
+def test_snapshot_retries_after_conflicting_write(ingestion, monkeypatch):
+    import snapshot
+
+    client = ingestion.get_s3_client()
+    snapshot.update_snapshot(client, TEST_BUCKET, 'state.json', {'A1': {'status': 'vacant', 'timestamp': '2024-03-20T10:00:00Z'}})
+
+    # Simulate another invocation writing between our read and our write
+    original_read = snapshot.read_snapshot
+    def racing_read(*args):
+        result = original_read(*args)
+        if not racing_read.raced:
+            racing_read.raced = True
+            snapshot.update_snapshot(client, TEST_BUCKET, 'state.json', {'A2': {'status': 'occupied', 'timestamp': '2024-03-20T10:01:00Z'}})
+        return result
+    racing_read.raced = False
+    monkeypatch.setattr(snapshot, 'read_snapshot', racing_read)
+    snapshot.update_snapshot(client, TEST_BUCKET, 'state.json', {'A3': {'status': 'occupied', 'timestamp': '2024-03-20T10:02:00Z'}})
+
+    spots, _ = original_read(client, TEST_BUCKET, 'state.json')
+    assert sorted(spots) == ['A1', 'A2', 'A3']
+
+def test_snapshot_is_off_by_default(ingestion):
+    response = ingestion.handler({'records': [make_record(0, '2024-03-20T10:00:00Z')]}, None)
+    assert json.loads(response['body'])['snapshot_updated'] is False
+    assert list_keys('parking-state/') == []
+
+def test_snapshot_failure_does_not_fail_the_batch(ingestion, monkeypatch, capsys):
+    import settings
+
+    monkeypatch.setenv('SNAPSHOT_KEY', 'state.json')
+    settings.reset_settings()
+    # Every attempt loses a race against another invocation
+    def always_conflicting_put(client, bucket, key, updates):
+        raise RuntimeError(f"Could not update snapshot s3://{bucket}/{key} after 5 attempts")
+    monkeypatch.setattr(ingestion, 'update_snapshot', always_conflicting_put)
+
+    response = ingestion.handler({'records': [make_record(0, '2024-03-20T10:00:00Z')]}, None)
+    body = json.loads(response['body'])
+    assert response['statusCode'] == 200
+    assert body['snapshot_updated'] is False
+    assert len(list_keys()) == 1
+    assert '"SnapshotFailures": 1' in capsys.readouterr().out
+
+def test_snapshot_backs_off_between_conflicting_attempts(ingestion, monkeypatch):
+    import snapshot
+    from botocore.exceptions import ClientError
+
+    client = ingestion.get_s3_client()
+    def conflicting_put(**kwargs):
+        raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+    monkeypatch.setattr(client, 'put_object', conflicting_put)
+    delays = []
+    with pytest.raises(RuntimeError):
+        snapshot.update_snapshot(client, TEST_BUCKET, 'state.json', {'A1': {'status': 'vacant', 'timestamp': '2024-03-20T10:00:00Z'}},
+                                 max_attempts=4, sleep=delays.append)
+    assert len(delays) == 3
+    assert all(0 <= delay <= snapshot.BACKOFF_MAX_SECONDS for delay in delays)
+
+def test_registers_new_partitions_once(ingestion, monkeypatch):
+    import partitions
+    import settings
+
+    monkeypatch.setenv('REGISTER_PARTITIONS', 'true')
+    settings.reset_settings()
+    partitions._known_partitions.clear()
+    partitions._table_descriptors.clear()
+
+    glue = boto3.client('glue')
+    glue.create_database(DatabaseInput={'Name': 'parking_analytics'})
+    glue.create_table(DatabaseName='parking_analytics', TableInput={
+        'Name': 'parking_events',
+        'StorageDescriptor': {
+            'Columns': [{'Name': 'spot_id', 'Type': 'string'}],
+            'Location': f's3://{TEST_BUCKET}/parking-data'
+        },
+        'PartitionKeys': [{'Name': name, 'Type': 'string'} for name in ('year', 'month', 'day', 'hour')]
+    })
+
+    records = [make_record(0, '2024-03-20T10:00:00Z'), make_record(1, '2024-03-20T11:00:00Z')]
+    response = ingestion.handler({'records': records}, None)
+    assert json.loads(response['body'])['partitions_created'] == 2
+
+    # A fresh process does not know the partitions but treats "already exists" as success
+    partitions._known_partitions.clear()
+    response = ingestion.handler({'records': records}, None)
+    assert json.loads(response['body'])['partitions_created'] == 0
+
+    stored = glue.get_partitions(DatabaseName='parking_analytics', TableName='parking_events')['Partitions']
+    assert sorted(p['Values'] for p in stored) == [['2024', '03', '20', '10'], ['2024', '03', '20', '11']]
+    assert stored[0]['StorageDescriptor']['Location'].startswith(f's3://{TEST_BUCKET}/parking-data/year=2024/')
+
+def test_emits_one_emf_record_per_invocation(ingestion, capsys):
+    records = [make_record(offset, '2024-03-20T10:00:00Z') for offset in range(4)]
+    ingestion.handler({'records': records}, None)
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    emf = [line for line in lines if '_aws' in line]
+    assert len(emf) == 1
+    assert emf[0]['RecordsProcessed'] == 4
+    assert emf[0]['ObjectsWritten'] == 1
+    assert emf[0]['BytesWritten'] > 0
+    declared = {m['Name'] for m in emf[0]['_aws']['CloudWatchMetrics'][0]['Metrics']}
+    assert {'DecodeTime', 'UploadTime', 'EndToEndLag'} <= declared
+
+def test_import_requires_configuration_only_with_eager_init(monkeypatch):
+    monkeypatch.delenv('S3_BUCKET', raising=False)
+    import index
+    import settings
+
+    # By default the client is built at import time, so missing configuration fails the init phase
+    settings.reset_settings()
+    with pytest.raises(RuntimeError):
+        importlib.reload(index)
+
+    monkeypatch.setenv('EAGER_INIT', 'false')
+    settings.reset_settings()
+    importlib.reload(index)
+    with pytest.raises(RuntimeError):
+        settings.get_settings()
+
+def test_parquet_output_mode(ingestion, monkeypatch):
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    monkeypatch.setenv('OUTPUT_FORMAT', 'parquet')
+    monkeypatch.setenv('PARQUET_COMPRESSION', 'zstd')
+    import settings
+    settings.reset_settings()
+
+    records = [make_record(offset, '2024-03-20T10:00:00Z') for offset in range(3)]
+    ingestion.handler({'records': records}, None)
+
+    keys = list_keys('parking-data-parquet/')
+    assert keys == ['parking-data-parquet/year=2024/month=03/day=20/hour=10/parking-events-0-0_parking-events-0-2.parquet']
+
+    body = boto3.client('s3').get_object(Bucket=TEST_BUCKET, Key=keys[0])['Body'].read()
+    table = pq.read_table(io.BytesIO(body))
+    assert str(table.schema.field('timestamp').type) == 'timestamp[ms]'
+    assert str(table.schema.field('status').type).startswith('dictionary')
+    assert table.num_rows == 3
+
+def test_gzip_compressed_output(ingestion, monkeypatch):
+    monkeypatch.setenv('OUTPUT_COMPRESSION', 'gzip')
+    import settings
+    settings.reset_settings()
+
+    records = [make_record(offset, '2024-03-20T10:00:00Z') for offset in range(3)]
+    ingestion.handler({'records': records}, None)
+    ingestion.handler({'records': records}, None)
+
+    keys = list_keys()
+    assert keys == ['parking-data/year=2024/month=03/day=20/hour=10/parking-events-0-0_parking-events-0-2.json.gz']
+    body = boto3.client('s3').get_object(Bucket=TEST_BUCKET, Key=keys[0])['Body'].read()
+    lines = gzip.decompress(body).decode('utf-8').splitlines()
+    assert [json.loads(line)['spot_id'] for line in lines] == ['A1', 'A1', 'A1']
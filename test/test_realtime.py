@@ -0,0 +1,154 @@
+import os
+import sys
+import gzip
+import json
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analytics.spots import SpotRegistry
+from realtime.aggregator import OccupancyAggregator, epoch_seconds, format_epoch
+from realtime.consumer import replay
+
+START = epoch_seconds('2024-03-20T10:00:00Z')
+
+def test_windows_are_time_weighted_and_late_events_only_update_live_view():
+    aggregator = OccupancyAggregator(allowed_lateness=5)
+    aggregator.add('A1', 'occupied', '2024-03-20T10:00:00Z')
+    aggregator.add('A2', 'vacant', '2024-03-20T10:00:00Z')
+    aggregator.add('A2', 'occupied', '2024-03-20T10:00:30Z')
+    # At or before the watermark (10:00:24): live state changes, the windows do not
+    aggregator.add('A1', 'vacant', '2024-03-20T10:00:20Z')
+    aggregator.add('A3', 'vacant', '2024-03-20T10:01:10Z')
+
+    snapshot = aggregator.snapshot()
+    assert snapshot['watermark'] == '2024-03-20T10:01:04Z'
+    assert (snapshot['occupied'], snapshot['available'], snapshot['late_events']) == (1, 2, 1)
+    # Last minute: 25s with one of two spots occupied, then 35s with both
+    assert snapshot['windows']['1m'] == {'occupancy_pct': 79.17, 'avg_occupied_spots': 1.58, 'arrivals': 1}
+
+def test_out_of_order_delivery_within_lateness_matches_sorted_order():
+    random.seed(7)
+    # One event per second: events of the same second are applied in delivery order
+    events = [
+        (f"A{random.randint(1, 20)}", random.choice(['occupied', 'vacant']), START + i)
+        for i in range(2 * 3600)
+    ]
+    shuffled = sorted(events, key=lambda event: event[2] + random.randint(-10, 10))
+
+    ordered, delivered, batched = (OccupancyAggregator(allowed_lateness=20) for _ in range(3))
+    compact = OccupancyAggregator(allowed_lateness=20, registry=SpotRegistry())
+    for event in events:
+        ordered.add(*event)
+    for event in shuffled:
+        delivered.add(*event)
+    batched.add_many((spot_id, status, format_epoch(t)) for spot_id, status, t in shuffled)
+    compact.add_many(shuffled)
+    for aggregator in (ordered, delivered, batched, compact):
+        aggregator.flush()
+
+    assert delivered.late_events == 0
+    assert delivered.snapshot()['windows'] == ordered.snapshot()['windows'] == batched.snapshot()['windows']
+    assert compact.snapshot() == delivered.snapshot()
+    assert all(compact.status(spot_id) == delivered.status(spot_id) for spot_id in delivered.spots)
+
+def test_epoch_seconds_checks_layout_once_the_hour_is_cached():
+    assert epoch_seconds('2024-03-20T10:00:59Z') == START + 59
+    for timestamp in ('2024-03-20T10:00:00', '2024-03-20T10:99:99Z', '2024-03-20T10:00:00+05:00',
+                      '2024-03-20T10:0x:00Z', '2024-03-20T10:٠٠:00Z'):
+        with pytest.raises(ValueError):
+            epoch_seconds(timestamp)
+
+def test_idle_stream_fast_forwards_to_constant_windows():
+    aggregator = OccupancyAggregator(allowed_lateness=0)
+    aggregator.add('A1', 'occupied', START)
+    aggregator.add('A2', 'vacant', START)
+    aggregator.advance(START + 3 * 3600)
+
+    assert aggregator.watermark == START + 3 * 3600 - 1
+    for window in aggregator.snapshot()['windows'].values():
+        assert window == {'occupancy_pct': 50.0, 'avg_occupied_spots': 1.0, 'arrivals': 0}
+
+def test_replay_reads_compressed_files_and_skips_malformed_lines(tmp_path):
+    import zstandard
+
+    lines = [json.dumps({'spot_id': f"A{i % 2}", 'status': 'occupied', 'timestamp': format_epoch(START + i)})
+             for i in range(10)]
+    (tmp_path / 'a.json.gz').write_bytes(gzip.compress("\n".join(lines[:5] + ['{"spot_id": "A1"}']).encode()))
+    (tmp_path / 'b.json.zst').write_bytes(zstandard.ZstdCompressor().compress("\n".join(lines[5:]).encode()))
+
+    aggregator = OccupancyAggregator(allowed_lateness=0)
+    reports = []
+    events, malformed = replay(aggregator, [str(tmp_path / 'a.json.gz'), str(tmp_path / 'b.json.zst')],
+                               reports.append, report_seconds=3)
+
+    assert (events, malformed) == (10, 1)
+    assert aggregator.snapshot()['occupied'] == 2
+    assert [report['watermark'][-3:] for report in reports] == ['02Z', '05Z', '08Z']
+
+async def http_get(port, path, etag=None):
+    import asyncio
+    from benchmark.availability_load_test import read_response
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = f"GET {path} HTTP/1.1\r\nHost: localhost\r\n" + (f"If-None-Match: {etag}\r\n" if etag else "")
+    writer.write((request + "\r\n").encode('latin-1'))
+    status, headers, body = await read_response(reader)
+    writer.close()
+    return status, headers.get('etag'), json.loads(body) if body else None
+
+def test_service_serves_zone_counters_with_etags_and_long_polls():
+    import asyncio
+    from realtime.service import AvailabilityServer, AvailabilityStore
+
+    async def scenario():
+        store = AvailabilityStore()
+        store.apply_many([('A1', 'occupied', START), ('A2', 'vacant', START), ('B1', 'vacant', START)])
+        server = await asyncio.start_server(AvailabilityServer(store).handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            status, etag, lot = await http_get(port, '/availability')
+            assert status == 200 and (lot['occupied'], lot['available']) == (1, 2)
+            assert lot['zones']['A'] == {'spots': 2, 'occupied': 1, 'available': 1}
+            assert (await http_get(port, '/availability', etag))[0] == 304
+            # A heartbeat with an unchanged status keeps the ETag
+            store.apply_many([('A1', 'occupied', START + 5)])
+            assert (await http_get(port, '/availability', etag))[0] == 304
+
+            status, spot_etag, spot = await http_get(port, '/availability/spots/B1')
+            assert spot == {'spot_id': 'B1', 'zone': 'B', 'status': 'vacant', 'since': '2024-03-20T10:00:00Z'}
+            assert (await http_get(port, '/availability/spots/B1?wait=0.1', spot_etag))[0] == 304
+
+            poll = asyncio.create_task(http_get(port, '/availability/spots/B1?wait=5', spot_etag))
+            await asyncio.sleep(0.05)
+            store.apply_many([('B1', 'occupied', START + 10)])
+            status, new_etag, spot = await asyncio.wait_for(poll, 1)
+            assert status == 200 and new_etag != spot_etag and spot['status'] == 'occupied'
+            assert (await http_get(port, '/availability/zones/B'))[2]['status'] == {'B1': 'occupied'}
+            assert (await http_get(port, '/availability/spots/Z9'))[0] == 404
+
+    asyncio.run(scenario())
+
+def test_service_rejects_invalid_content_length():
+    import asyncio
+    from benchmark.availability_load_test import read_response
+    from realtime.service import AvailabilityServer, AvailabilityStore
+
+    async def scenario():
+        server = await asyncio.start_server(AvailabilityServer(AvailabilityStore()).handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            for length in ('abc', '-1', '²'):
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(f"GET /health HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode('latin-1'))
+                status, headers, body = await read_response(reader)
+                assert status == 400 and json.loads(body) == {'error': 'invalid content-length'}
+                assert headers.get('connection') == 'close'
+                writer.close()
+
+            # The server keeps serving after a bad request
+            assert (await http_get(port, '/health'))[0] == 200
+
+    asyncio.run(scenario())
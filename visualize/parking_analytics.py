@@ -1,47 +1,125 @@
+import os
+import sys
 import boto3
+import numpy as np
 import pandas as pd
+import matplotlib
+# Charts are only saved to files: the headless backend needs no display and works in worker processes
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
 import json
 
-# Initialize clients
-athena = boto3.client('athena')
-s3 = boto3.client('s3')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-def run_athena_query(query):
-    """Run Athena query and return results as pandas DataFrame"""
-    response = athena.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={'Database': 'parking_analytics'},
-        ResultConfiguration={'OutputLocation': 's3://parking-monitoring-data/athena-results/'}
+from analytics.athena import AthenaClient
+from analytics.cache import QueryCache, window_watermark
+from analytics.local import FORMAT_PREFIXES, LocalEngine
+from analytics.query import build_query, last_hours
+from analytics.rollup import ROLLUP_PREFIX
+from analytics.spots import SpotRegistry
+
+# Latest status per spot, maintained by the ingestion Lambda when its SNAPSHOT_KEY is set to this key
+S3_BUCKET = 'parking-monitoring-data'
+SNAPSHOT_KEY = 'parking-state/current_status.json'
+
+# 'athena', or 'local' to compute the same DataFrames from a local copy of the bucket
+QUERY_ENGINE = os.environ.get('QUERY_ENGINE', 'athena').lower()
+# Local copy of the bucket holding parking-data/ (or parking-data-parquet/) and parking-state/
+LOCAL_DATA_DIR = os.environ.get('LOCAL_DATA_DIR', 'data')
+
+# Query result cache; an entry is invalidated when objects change in the partitions its query reads
+QUERY_CACHE_DIR = os.environ.get('QUERY_CACHE_DIR', '.query_cache')
+QUERY_CACHE_TTL = int(os.environ.get('QUERY_CACHE_TTL', 24 * 3600))
+QUERY_CACHE_MAX_MB = int(os.environ.get('QUERY_CACHE_MAX_MB', 256))
+# Read hourly metrics from the spot_hourly rollup instead of raw events
+USE_HOURLY_ROLLUP = os.environ.get('USE_HOURLY_ROLLUP', 'true').lower() in ('1', 'true', 'yes')
+# Hours of history the charts cover; queries only scan partitions inside this window
+DASHBOARD_WINDOW_HOURS = int(os.environ.get('DASHBOARD_WINDOW_HOURS', 30 * 24))
+# Must match OUTPUT_FORMAT of the ingestion Lambda
+SOURCE_FORMAT = os.environ.get('OUTPUT_FORMAT', 'json').lower()
+# Athena server-side result reuse, 0 disables it
+ATHENA_RESULT_REUSE_MINUTES = int(os.environ.get('ATHENA_RESULT_REUSE_MINUTES', 0))
+
+# Above this many spots, per-spot charts switch from one bar per spot to a status grid / sorted curve
+MAX_SPOT_BARS = int(os.environ.get('MAX_SPOT_BARS', 200))
+# Per-point detail (heatmap cell values, line markers) is only drawn up to this many points
+MAX_DETAILED_POINTS = int(os.environ.get('MAX_DETAILED_POINTS', 500))
+# Processes rendering the charts in parallel; 1 renders them one after another in this process
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Initialize clients; the local engine needs no AWS access at all
+if QUERY_ENGINE == 'local':
+    local_engine = LocalEngine(LOCAL_DATA_DIR, SOURCE_FORMAT)
+    athena = s3 = query_cache = None
+else:
+    local_engine = None
+    athena = AthenaClient(
+        database='parking_analytics',
+        output_location='s3://parking-monitoring-data/athena-results/',
+        result_reuse_minutes=ATHENA_RESULT_REUSE_MINUTES
     )
-    
-    query_execution_id = response['QueryExecutionId']
-    
-    # Wait for query to complete
-    while True:
-        response = athena.get_query_execution(QueryExecutionId=query_execution_id)
-        state = response['QueryExecution']['Status']['State']
-        if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-            break
-    
-    if state == 'SUCCEEDED':
-        # Get results
-        results = athena.get_query_results(QueryExecutionId=query_execution_id)
-        
-        # Convert to DataFrame
-        columns = [col['Label'] for col in results['ResultSet']['ResultSetMetadata']['ColumnInfo']]
-        rows = []
-        for row in results['ResultSet']['Rows'][1:]:  # Skip header
-            rows.append([field.get('VarCharValue', '') for field in row['Data']])
-        
-        return pd.DataFrame(rows, columns=columns)
+    s3 = boto3.client('s3')
+    query_cache = QueryCache(
+        athena,
+        directory=QUERY_CACHE_DIR,
+        ttl_seconds=QUERY_CACHE_TTL,
+        max_bytes=QUERY_CACHE_MAX_MB * 1024 * 1024
+    )
+
+@lru_cache(maxsize=None)
+def source_watermark(source, start, end):
+    """Watermark of the objects a query over [start, end) of the source table reads, listed once per run"""
+    if source == 'rollup':
+        return window_watermark(s3, S3_BUCKET, ROLLUP_PREFIX, start, end, monthly=True)
+    return window_watermark(s3, S3_BUCKET, FORMAT_PREFIXES[SOURCE_FORMAT], start, end)
+
+def submit_metric(metric, start=None, end=None):
+    """
+    Start computing a dashboard metric on the selected engine and return a
+    Future of its DataFrame. Athena queries run concurrently; the local
+    engine computes the result right away.
+    """
+    if local_engine is not None:
+        future = Future()
+        future.set_result(local_engine.run_metric(metric, start, end))
+        return future
+    source = 'rollup' if USE_HOURLY_ROLLUP and metric != 'latest_status' else 'events'
+    query = build_query(metric, start, end, source=source, source_format=SOURCE_FORMAT)
+    if start is None:
+        # Without a window the watermark would list the whole table on every run
+        return query_cache.submit(query, dataframe=True, cache=False)
+    return query_cache.submit(query, dataframe=True, watermark=lambda: source_watermark(source, start, end))
+
+def load_current_status():
+    """
+    Load the latest status of every spot from the ingest-time snapshot with a
+    single GET. Returns None if the snapshot does not exist (yet, or at all
+    when the ingestion Lambda runs without SNAPSHOT_KEY).
+    """
+    if local_engine is not None:
+        path = os.path.join(LOCAL_DATA_DIR, *SNAPSHOT_KEY.split('/'))
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            spots = json.load(f)['spots']
     else:
-        raise Exception(f"Query failed with state: {state}")
+        try:
+            response = s3.get_object(Bucket=S3_BUCKET, Key=SNAPSHOT_KEY)
+        except s3.exceptions.NoSuchKey:
+            return None
+        spots = json.loads(response['Body'].read())['spots']
+    # Decoded into arrays in one pass rather than a Python row per spot
+    return SpotRegistry(capacity=len(spots)).load_snapshot(spots).frame()
 
-def plot_current_status(df):
+def plot_current_status(df, max_bars=MAX_SPOT_BARS):
     """Plot current parking status"""
+    if len(df) > max_bars:
+        plot_status_grid(df)
+        return
     plt.figure(figsize=(12, 6))
     colors = ['red' if status == 'occupied' else 'green' for status in df['status']]
     plt.bar(df['spot_id'], [1] * len(df), color=colors)
@@ -52,10 +130,35 @@ def plot_current_status(df):
     plt.savefig('visualize/current_status.png')
     plt.close()
 
-def plot_occupancy_rate(df):
+def plot_status_grid(df):
+    """Plot current parking status as one grid cell per spot, in spot_id order"""
+    from matplotlib.colors import ListedColormap
+    from matplotlib.patches import Patch
+
+    count = len(df)
+    # About twice as many columns as rows, to fill the landscape figure
+    columns = max(int(np.ceil(np.sqrt(count * 2))), 1)
+    rows = -(-count // columns)
+    cells = np.full(rows * columns, np.nan)
+    cells[:count] = (df['status'] == 'occupied').to_numpy(dtype=float)
+
+    plt.figure(figsize=(12, 6))
+    plt.imshow(cells.reshape(rows, columns), cmap=ListedColormap(['green', 'red']), vmin=0, vmax=1,
+               aspect='auto', interpolation='nearest')
+    plt.title(f'Current Parking Status ({int(np.nansum(cells))} of {count} occupied)')
+    plt.xlabel(f'Parking Spot (rows of {columns}, by spot id)')
+    plt.xticks([])
+    plt.yticks([])
+    plt.legend(handles=[Patch(color='red', label='Occupied'), Patch(color='green', label='Vacant')],
+               loc='upper right')
+    plt.savefig('visualize/current_status.png')
+    plt.close()
+
+def plot_occupancy_rate(df, max_markers=MAX_DETAILED_POINTS):
     """Plot occupancy rate over time"""
     plt.figure(figsize=(15, 7))
-    plt.plot(df['hour_slot'], df['occupancy_rate'].astype(float), marker='o')
+    # A time axis places its own ticks; string labels would put a tick on every hour
+    plt.plot(pd.to_datetime(df['hour_slot']), df['occupancy_rate'], marker='o' if len(df) <= max_markers else None)
     plt.title('Parking Occupancy Rate Over Time')
     plt.xlabel('Time')
     plt.ylabel('Occupancy Rate (%)')
@@ -64,26 +167,33 @@ def plot_occupancy_rate(df):
     plt.savefig('visualize/occupancy_rate.png')
     plt.close()
 
-def plot_spot_activity(df):
+def plot_spot_activity(df, max_bars=MAX_SPOT_BARS):
     """Plot parking spot activity"""
     plt.figure(figsize=(12, 6))
-    df = df.sort_values('total_events', ascending=True)
-    plt.barh(df['spot_id'], df['occupancy_rate'].astype(float))
-    plt.title('Parking Spot Occupancy Rates')
-    plt.xlabel('Occupancy Rate (%)')
-    plt.ylabel('Parking Spot')
+    if len(df) > max_bars:
+        # One bar per spot is unreadable for a large lot: show how the rates are distributed instead
+        rates = np.sort(time_weighted_rate(df).to_numpy(dtype=float, na_value=np.nan))[::-1]
+        plt.plot(np.arange(1, len(rates) + 1), rates)
+        plt.title('Parking Spot Occupancy Rates')
+        plt.xlabel('Parking Spots, Busiest First')
+        plt.ylabel('Occupancy Rate (%)')
+    else:
+        df = df.sort_values('total_events', ascending=True)
+        plt.barh(df['spot_id'], time_weighted_rate(df))
+        plt.title('Parking Spot Occupancy Rates')
+        plt.xlabel('Occupancy Rate (%)')
+        plt.ylabel('Parking Spot')
     plt.tight_layout()
     plt.savefig('visualize/spot_activity.png')
     plt.close()
 
-def plot_daily_pattern(df):
+def plot_daily_pattern(df, max_annotated=MAX_DETAILED_POINTS):
     """Plot daily occupancy pattern"""
-    # Convert occupied_spots to numeric
-    df['occupied_spots'] = pd.to_numeric(df['occupied_spots'])
-    
-    pivot_df = df.pivot(index='hour', columns='date', values='occupied_spots')
+    # Hours without data become NaN, which the heatmap needs as float rather than Int64 <NA>
+    pivot_df = df.pivot(index='hour', columns='date', values='occupied_spots').astype(float)
     plt.figure(figsize=(15, 8))
-    sns.heatmap(pivot_df, cmap='YlOrRd', annot=True, fmt='g')
+    # Past a few weeks the cell values no longer fit, and drawing them dominates the rendering time
+    sns.heatmap(pivot_df, cmap='YlOrRd', annot=pivot_df.size <= max_annotated, fmt='g')
     plt.title('Daily Occupancy Pattern')
     plt.xlabel('Date')
     plt.ylabel('Hour')
@@ -91,56 +201,81 @@ def plot_daily_pattern(df):
     plt.savefig('visualize/daily_pattern.png')
     plt.close()
 
+def render_charts(charts, workers=CHART_WORKERS):
+    """
+    Render (plot function, DataFrame) pairs, each in a worker process of its
+    own when workers > 1. Every chart draws and saves its own figure, so they
+    share no pyplot state.
+    """
+    if workers <= 1 or len(charts) <= 1:
+        for plot, df in charts:
+            plot(df)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(charts))) as pool:
+        # result() re-raises a chart's error here
+        for future in [pool.submit(plot, df) for plot, df in charts]:
+            future.result()
+
+def time_weighted_rate(df):
+    """
+    Share of time spent occupied where the source provides it (rollup or local
+    engine); the share of occupied events otherwise
+    """
+    return df['time_occupied_pct'] if 'time_occupied_pct' in df else df['occupancy_rate']
+
+def occupancy_rate_by_hour(hourly):
+    """Occupancy rate per hour slot from the hourly metrics"""
+    return pd.DataFrame({
+        'hour_slot': hourly['year'] + '-' + hourly['month'] + '-' + hourly['day'] + ' ' + hourly['hour'] + ':00:00',
+        'occupancy_rate': time_weighted_rate(hourly)
+    })
+
+def daily_pattern_by_hour(hourly):
+    """Occupied events per date and hour from the hourly metrics"""
+    return pd.DataFrame({
+        'date': hourly['year'] + '-' + hourly['month'] + '-' + hourly['day'],
+        'hour': hourly['hour'],
+        'occupied_spots': hourly['occupied_events']
+    })
+
 def main():
     print("Generating parking analytics visualizations...")
     
     # Create visualizations directory if it doesn't exist
-    import os
     os.makedirs('visualize', exist_ok=True)
     
-    # Run queries and create visualizations
+    # Start the Athena scans together; the refresh takes about as long as the slowest one
+    start, end = last_hours(DASHBOARD_WINDOW_HOURS)
+    # One grouped scan feeds both the occupancy rate and the daily pattern charts
+    hourly_future = submit_metric('hourly_occupancy', start, end)
+    spot_activity_future = submit_metric('spot_activity', start, end)
+    current_status = load_current_status()
+    # No snapshot yet: fall back to a full scan for the latest event per spot
+    current_status_future = submit_metric('latest_status') if current_status is None else None
+    
     print("\n1. Current Parking Status")
-    current_status = run_athena_query("""
-        SELECT spot_id, status, timestamp
-        FROM parking_analytics.parking_events
-        ORDER BY timestamp DESC
-        LIMIT 10
-    """)
-    plot_current_status(current_status)
+    if current_status_future is not None:
+        current_status = current_status_future.result()
+    charts = [(plot_current_status, current_status)]
+    
+    hourly = hourly_future.result()
     
     print("\n2. Occupancy Rate Over Time")
-    occupancy_rate = run_athena_query("""
-        SELECT CONCAT(year, '-', month, '-', day, ' ', hour, ':00:00') as hour_slot,
-               COUNT(CASE WHEN status = 'occupied' THEN 1 END) * 100.0 / COUNT(*) as occupancy_rate
-        FROM parking_analytics.parking_events
-        GROUP BY year, month, day, hour
-        ORDER BY year, month, day, hour
-    """)
-    plot_occupancy_rate(occupancy_rate)
+    charts.append((plot_occupancy_rate, occupancy_rate_by_hour(hourly)))
     
     print("\n3. Parking Spot Activity")
-    spot_activity = run_athena_query("""
-        SELECT spot_id,
-               COUNT(*) as total_events,
-               ROUND(COUNT(CASE WHEN status = 'occupied' THEN 1 END) * 100.0 / COUNT(*), 2) as occupancy_rate
-        FROM parking_analytics.parking_events
-        GROUP BY spot_id
-        ORDER BY total_events DESC
-    """)
-    plot_spot_activity(spot_activity)
+    charts.append((plot_spot_activity, spot_activity_future.result()))
     
     print("\n4. Daily Occupancy Pattern")
-    daily_pattern = run_athena_query("""
-        SELECT CONCAT(year, '-', month, '-', day) as date,
-               hour,
-               COUNT(CASE WHEN status = 'occupied' THEN 1 END) as occupied_spots
-        FROM parking_analytics.parking_events
-        GROUP BY year, month, day, hour
-        ORDER BY year, month, day, hour
-    """)
-    plot_daily_pattern(daily_pattern)
+    charts.append((plot_daily_pattern, daily_pattern_by_hour(hourly)))
+    
+    # Rendering is CPU-bound, so the charts are drawn in separate processes
+    render_charts(charts)
     
     print("\nVisualizations have been saved in the 'visualize' directory!")
+    if query_cache is not None:
+        query_cache.close()
+        print(query_cache.report())
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file